@@ -1,8 +1,12 @@
 import os
+import io
+import json
+import time
+import hmac
+import functools
+from urllib.parse import urlencode
 import bcrypt
 from dotenv import load_dotenv
-import numpy as np
-from PIL import Image
 from flask import (
     Flask,
     jsonify,
@@ -12,14 +16,56 @@ from flask import (
     redirect,
     url_for,
     session,
+    make_response,
+    abort,
+    g,
+    send_file,
+    Response,
+    stream_with_context,
+    has_request_context,
 )
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from sqlmodel import Session, select
-from database import get_user_by_username, create_user, engine, User, Comment, Topic
+from database import (
+    get_user_by_username,
+    create_user,
+    get_topics_page,
+    get_users_page,
+    USER_SORT_COLUMNS,
+    engine,
+    init_db,
+    User,
+    Comment,
+    Topic,
+)
 from models import LoginModel, RegisterModel
-from src.face_analysis import FaceAnalysis
-from src.object_detection import YOLOv8
-from utils.image import encode_image
+from src.model_registry import create_model_registry
+from src.inference_scheduler import InferenceScheduler
+from src.inference_pool import InferencePool, InferenceUnavailable
+from src.live_stream import LiveStreams
+from src.bulk_analysis import (
+    face_to_json,
+    object_to_json,
+    face_analyzer,
+    object_analyzer,
+    analyze_all,
+    archive_entries,
+    file_entries,
+    open_archive,
+    spool,
+)
+from utils.image import (
+    decode_image,
+    encode_image,
+    create_image_store,
+    ImageTooLargeError,
+)
+from utils.cache import create_inference_cache, create_page_cache
+from utils.job_queue import JobQueue
+from utils.admission import AdmissionGate, AdmittedBackend, Overloaded
+from utils.metrics import metrics
+from utils.profiling import RequestProfiler
 from utils.data import relative_time, allowed_file
 import config
 
@@ -30,11 +76,617 @@ load_dotenv()
 app = Flask("AI Web App")
 app.secret_key = os.getenv("SECRET_KEY")
 app.config["UPLOAD_FOLDER"] = "./uploads"
+app.config["MAX_CONTENT_LENGTH"] = config.max_request_bytes
+app.jinja_env.filters["relative_time"] = relative_time
+app.jinja_env.globals["default_face_detection_mode"] = config.face_detection_mode
+
+
+
+models = create_model_registry()
+if config.inference_backend == "process":
+    # Models live in worker processes; this process only holds the client
+    # Workers start with the first task, never while app.py is imported
+    inference_backend = InferencePool(
+        config.inference_pool_workers,
+        config.inference_pool_max_results,
+        config.inference_pool_timeout,
+    )
+else:
+    models.preload(config.preload_models)
+    inference_backend = InferenceScheduler(
+        models,
+        config.inference_max_batch_size,
+        config.inference_max_wait_time,
+    )
+inference_cache = create_inference_cache(
+    config.inference_cache_backend,
+    config.inference_cache_dir,
+    config.inference_cache_max_bytes,
+    config.inference_cache_ttl,
+)
+live_streams = LiveStreams(
+    config.live_stream_max_streams,
+    config.live_stream_idle_timeout,
+    config.live_stream_max_latency,
+)
+page_cache = create_page_cache(
+    config.page_cache_backend,
+    config.page_cache_dir,
+    config.page_cache_max_bytes,
+    config.page_cache_ttl,
+)
+request_profiler = None
+if config.profile_key:
+    request_profiler = RequestProfiler(
+        config.profile_dir, config.profile_max_profiles, config.profile_max_per_minute
+    )
+job_queue = JobQueue(config.job_queue_path, config.job_result_ttl, config.job_timeout)
+admission_gates = {
+    name: AdmissionGate(
+        name,
+        config.admission_max_in_flight,
+        config.admission_max_queue,
+        config.admission_max_wait,
+        config.admission_retry_after,
+    )
+    for name in ("face_analysis", "object_detection")
+}
+# Bulk requests run for long and use bulk_workers threads each, so only a
+# few may run at once; more are rejected right away
+admission_gates["bulk"] = AdmissionGate(
+    "bulk", config.bulk_max_requests, 0, 0, config.admission_retry_after
+)
+# Every model call passes its model's gate. Threads outside a request (bulk
+# workers, job workers, live streams) wait for a slot instead of being rejected
+inference_backend = AdmittedBackend(
+    inference_backend, admission_gates, background=lambda: not has_request_context()
+)
+image_store = create_image_store(
+    config.output_image_store_backend,
+    config.output_image_store_dir,
+    config.output_image_store_max_bytes,
+    config.output_image_store_ttl,
+    format=config.output_image_format,
+    quality=config.output_image_quality,
+    max_dimension=config.output_image_max_dimension,
+)
+if config.output_image_store_backend == "memory" and config.web_concurrency > 1:
+    print(
+        "warning: OUTPUT_IMAGE_STORE_BACKEND=memory with WEB_CONCURRENCY > 1, "
+        "output images saved by one worker are missing in the others"
+    )
+if config.page_cache_backend == "memory" and config.web_concurrency > 1:
+    print(
+        "warning: PAGE_CACHE_BACKEND=memory with WEB_CONCURRENCY > 1, "
+        "blog changes only reach the worker that made them until PAGE_CACHE_TTL runs out"
+    )
+
 
-face_analysis = FaceAnalysis(
-    config.face_detection_onnx_model_path, config.age_gender_estimation_onnx_model_path
+FACE_ANALYSIS_MODEL_ID = (
+    config.face_detection_onnx_model_path,
+    config.age_gender_estimation_onnx_model_path,
+    config.face_detection_threshold,
+    config.face_detection_nms_threshold,
+    config.face_detection_min_face_ratio,
 )
-object_detector = YOLOv8(config.object_detection_onnx_model_path)
+OBJECT_DETECTION_MODEL_ID = (
+    config.object_detection_onnx_model_path,
+    config.object_detection_confidence_threshold,
+    config.object_detection_iou_threshold,
+    config.object_detection_class_aware_nms,
+    config.object_detection_mode,
+    config.object_detection_tile_size,
+    config.object_detection_tile_overlap,
+)
+
+
+def analyze_faces(input_image, detection_mode):
+    key = inference_cache.key(
+        input_image,
+        FACE_ANALYSIS_MODEL_ID,
+        detection_mode=detection_mode,
+        output_image=(image_store.format, image_store.quality, image_store.max_dimension),
+    )
+
+    def compute():
+        faces, output_image = inference_backend.analyze_faces(
+            input_image, draw=True, detection_mode=detection_mode
+        )
+        genders = [int(face.gender) for face in faces]
+        ages = [face.age for face in faces]
+        return genders, ages, image_store.encode(output_image)
+
+    return inference_cache.get_or_compute(key, compute)
+
+
+def detect_objects(input_image):
+    key = inference_cache.key(
+        input_image,
+        OBJECT_DETECTION_MODEL_ID,
+        output_image=(image_store.format, image_store.quality, image_store.max_dimension),
+    )
+
+    def compute():
+        *_, labels, output_image = inference_backend.detect_objects(input_image, draw=True)
+        return labels, image_store.encode(output_image)
+
+    return inference_cache.get_or_compute(key, compute)
+
+
+def decode_upload(stream, min_size=config.decode_min_size):
+    with metrics.time("decode"):
+        return decode_image(stream, min_size, config.max_image_pixels)
+
+
+def decode_object_upload(stream):
+    # Tiled detection is there to find small objects at full resolution,
+    # so its uploads are decoded without the reduction
+    if config.object_detection_mode == "tiled":
+        return decode_upload(stream, min_size=None)
+    return decode_upload(stream)
+
+
+def api_analyze_faces(input_image, scale, annotate, detection_mode):
+    key = inference_cache.key(
+        input_image,
+        ("api",) + FACE_ANALYSIS_MODEL_ID,
+        scale=scale,
+        annotate=annotate,
+        detection_mode=detection_mode,
+    )
+
+    def compute():
+        faces, output_image = inference_backend.analyze_faces(
+            input_image, draw=annotate, detection_mode=detection_mode
+        )
+        result = {"faces": [face_to_json(face, scale) for face in faces]}
+        if annotate:
+            result["image"] = encode_image(output_image)
+        return result
+
+    return inference_cache.get_or_compute(key, compute)
+
+
+def api_detect_objects(input_image, scale, annotate):
+    key = inference_cache.key(
+        input_image,
+        ("api",) + OBJECT_DETECTION_MODEL_ID,
+        scale=scale,
+        annotate=annotate,
+    )
+
+    def compute():
+        boxes, scores, class_ids, labels, output_image = inference_backend.detect_objects(
+            input_image, draw=annotate
+        )
+        result = {
+            "objects": [
+                object_to_json(box, score, class_id, label, scale)
+                for box, score, class_id, label in zip(
+                    boxes.tolist(), scores, class_ids.tolist(), labels
+                )
+            ]
+        }
+        if annotate:
+            result["image"] = encode_image(output_image)
+        return result
+
+    return inference_cache.get_or_compute(key, compute)
+
+
+def api_input_stream():
+    """Return the upload from a multipart "image" field or from the raw request body."""
+    if request.mimetype == "multipart/form-data":
+        input_image_file = request.files.get("image")
+        if input_image_file is None or not allowed_file(input_image_file.filename):
+            return None
+        return input_image_file.stream
+    # Any other body is the image itself, whatever Content-Type curl or the
+    # client library picked, so it must not be parsed as a form
+    data = request.get_data(cache=False, parse_form_data=False)
+    if not data:
+        return None
+    return io.BytesIO(data)
+
+
+def face_detection_mode(value):
+    """Return the requested detection mode, the configured one if unset, or None if invalid."""
+    if not value:
+        return config.face_detection_mode
+    return value if value in config.FACE_DETECTION_MODES else None
+
+
+def api_face_detection_mode():
+    """Return the detection_mode query parameter as (mode, None), or (None, a 400 response) if invalid."""
+    detection_mode = face_detection_mode(request.args.get("detection_mode"))
+    if detection_mode is None:
+        modes = ", ".join(config.FACE_DETECTION_MODES)
+        return None, (jsonify({"error": f"detection_mode must be one of {modes}"}), 400)
+    return detection_mode, None
+
+
+def api_authorized():
+    # Logged-in users of the web pages may call the API without a key
+    if not config.api_key or session.get("user_id"):
+        return True
+    return request.headers.get("X-API-Key") == config.api_key
+
+
+def admitted(model):
+    """Turn the view's POST requests away early when the model is saturated.
+
+    The model call itself waits in the gate (see AdmittedBackend); this
+    check runs before the body is read, so an overloaded server rejects
+    uploads without buffering or decoding them.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "POST":
+                return view(*args, **kwargs)
+            if request.content_length is not None and request.content_length > request.max_content_length:
+                raise RequestEntityTooLarge()
+            admission_gates[model].check()
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def service_unavailable(retry_after):
+    if request.path.startswith("/api/"):
+        response = jsonify({"error": "The server is busy, try again later"})
+    else:
+        flash("سرور الان شلوغه، چند ثانیه دیگه دوباره امتحان کن", "danger")
+        response = make_response(render_template(f"{request.endpoint}.html"))
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return service_unavailable(e.retry_after)
+
+
+@app.errorhandler(InferenceUnavailable)
+def inference_unavailable(e):
+    return service_unavailable(config.admission_retry_after)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    if request.path.startswith("/api/"):
+        return jsonify({"error": f"Request body is too large, the limit is {request.max_content_length} bytes"}), 413
+    flash("این عکس خیلی بزرگه، یک عکس کوچک‌تر انتخاب کن", "danger")
+    return redirect(request.path)
+
+
+def api_request(analyze, decode=decode_upload):
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    error = "Send a png or jpeg image as the request body or in an 'image' field"
+    stream = api_input_stream()
+    if stream is None:
+        return jsonify({"error": error}), 400
+    try:
+        input_image, scale = decode(stream)
+    except ImageTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception:
+        return jsonify({"error": error}), 400
+    annotate = request.args.get("annotate", "false").lower() in ("1", "true", "yes")
+    return jsonify(analyze(input_image, scale, annotate))
+
+
+@app.route("/api/v1/face-analysis", methods=["POST"])
+@admitted("face_analysis")
+def api_face_analysis():
+    detection_mode, error = api_face_detection_mode()
+    if error:
+        return error
+    return api_request(functools.partial(api_analyze_faces, detection_mode=detection_mode))
+
+
+@app.route("/api/v1/object-detection", methods=["POST"])
+@admitted("object_detection")
+def api_object_detection():
+    return api_request(api_detect_objects, decode_object_upload)
+
+
+@app.route("/api/v1/streams", methods=["POST"])
+def api_open_stream():
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    kind = request.args.get("kind", "faces")
+    if kind not in ("faces", "objects"):
+        return jsonify({"error": "kind must be faces or objects"}), 400
+    detection_mode, error = api_face_detection_mode()
+    if error:
+        return error
+    if kind == "faces":
+        process = face_analyzer(inference_backend, decode_upload, detection_mode)
+    else:
+        process = object_analyzer(inference_backend, decode_object_upload)
+    stream = live_streams.open(kind, process)
+    if stream is None:
+        return jsonify({"error": "Too many open streams"}), 503
+    return jsonify({
+        "id": stream.id,
+        "frames_url": url_for("api_stream_frame", stream_id=stream.id),
+        "results_url": url_for("api_stream_results", stream_id=stream.id),
+    }), 201
+
+
+@app.route("/api/v1/streams/<stream_id>", methods=["GET", "DELETE"])
+def api_stream(stream_id):
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    if request.method == "DELETE":
+        if not live_streams.close(stream_id):
+            abort(404)
+        return "", 204
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        abort(404)
+    return jsonify(stream.stats())
+
+
+@app.route("/api/v1/streams/<stream_id>/frames", methods=["POST"])
+def api_stream_frame(stream_id):
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        abort(404)
+    frame = request.get_data()
+    if not frame:
+        return jsonify({"error": "Send a jpeg frame as the request body"}), 400
+    return jsonify({"frame": stream.submit(frame)}), 202
+
+
+@app.route("/api/v1/streams/<stream_id>/results")
+def api_stream_results(stream_id):
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    stream = live_streams.get(stream_id)
+    if stream is None:
+        abort(404)
+
+    def generate():
+        # One JSON object per processed frame; blank lines keep idle connections open
+        for result in stream.results():
+            yield "\n" if result is None else json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def bulk_entries():
+    """Return (entries, count) for a zip archive or image files in the request, or (None, 0)."""
+    # The request's files are closed before the response streams, so
+    # uploads are copied to temporary files that spill to disk when large
+    if "archive" in request.files:
+        archive = open_archive(spool(request.files["archive"].stream, config.bulk_spool_bytes))
+    elif request.files:
+        files = request.files.getlist("images") + request.files.getlist("image")
+        entries = file_entries(files, config.bulk_spool_bytes)
+        if not entries:
+            return None, 0
+        return entries, len(entries)
+    elif request.mimetype in ("application/zip", "application/x-zip-compressed"):
+        archive = open_archive(spool(request.stream, config.bulk_spool_bytes))
+    else:
+        return None, 0
+    if archive is None:
+        return None, 0
+    count = sum(1 for _ in archive_entries(archive))
+    return archive_entries(archive, config.bulk_max_image_bytes), count
+
+
+@app.route("/api/v1/bulk/<kind>", methods=["POST"])
+def api_bulk(kind):
+    if kind not in ("face-analysis", "object-detection"):
+        abort(404)
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    # Bulk uploads are spooled to disk and may be larger than other requests
+    request.max_content_length = config.bulk_max_request_bytes
+    if request.content_length is not None and request.content_length > request.max_content_length:
+        raise RequestEntityTooLarge()
+    detection_mode, error = api_face_detection_mode()
+    if error:
+        return error
+    # The slot is held until the streamed response is closed, before the
+    # upload is read; the images then wait in the model gates one by one
+    gate = admission_gates["bulk"]
+    gate.acquire()
+    try:
+        response = make_response(bulk_response(kind, detection_mode))
+    except BaseException:
+        gate.release()
+        raise
+    response.call_on_close(gate.release)
+    return response
+
+
+def bulk_response(kind, detection_mode):
+    entries, count = bulk_entries()
+    if entries is None:
+        return jsonify({
+            "error": "Send a zip archive as the request body or in an 'archive' field, "
+            "or png and jpeg images in 'images' fields"
+        }), 400
+    if count > config.bulk_max_images:
+        return jsonify({"error": f"{count} images sent, the limit is {config.bulk_max_images}"}), 413
+    if kind == "face-analysis":
+        analyze = face_analyzer(inference_backend, decode_upload, detection_mode)
+    else:
+        analyze = object_analyzer(inference_backend, decode_object_upload)
+
+    def generate():
+        # One JSON object per image in input order, then a summary line
+        started = time.monotonic()
+        failed = 0
+        for result in analyze_all(entries, analyze, config.bulk_workers):
+            failed += "error" in result
+            yield json.dumps(result) + "\n"
+        elapsed = time.monotonic() - started
+        yield json.dumps({"summary": {"images": count, "failed": failed, "seconds": round(elapsed, 3)}}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def face_analysis_job(payload, params):
+    input_image, scale = decode_upload(io.BytesIO(payload))
+    if params.get("page"):
+        genders, ages, output_image_data = analyze_faces(input_image, params["detection_mode"])
+        return {"genders": genders, "ages": ages, "image_name": image_store.save(output_image_data)}
+    return api_analyze_faces(input_image, scale, params["annotate"], params["detection_mode"])
+
+
+def object_detection_job(payload, params):
+    input_image, scale = decode_object_upload(io.BytesIO(payload))
+    if params.get("page"):
+        labels, output_image_data = detect_objects(input_image)
+        return {"labels": labels, "image_name": image_store.save(output_image_data)}
+    return api_detect_objects(input_image, scale, params["annotate"])
+
+
+job_queue.register("face-analysis", face_analysis_job)
+job_queue.register("object-detection", object_detection_job)
+
+
+@app.before_request
+def start_job_workers():
+    # Started by the server's first request rather than on import, so that
+    # tools and benchmarks importing the app run no job workers
+    job_queue.start(config.job_workers)
+
+
+@app.route("/api/v1/jobs/<kind>", methods=["POST"])
+def api_submit_job(kind):
+    if kind not in job_queue.handlers:
+        abort(404)
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    stream = api_input_stream()
+    if stream is None:
+        return jsonify({"error": "Send a png or jpeg image as the request body or in an 'image' field"}), 400
+    payload = stream.read(config.job_max_bytes + 1)
+    if len(payload) > config.job_max_bytes:
+        return jsonify({"error": "Image is too large"}), 413
+    params = {"annotate": request.args.get("annotate", "false").lower() in ("1", "true", "yes")}
+    if kind == "face-analysis":
+        params["detection_mode"], error = api_face_detection_mode()
+        if error:
+            return error
+    job_id = job_queue.submit(kind, payload, params)
+    status_url = url_for("api_job", job_id=job_id)
+    response = jsonify({"id": job_id, "status": "queued", "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+
+@app.route("/api/v1/jobs/<job_id>")
+def api_job(job_id):
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    response = jsonify(job)
+    if job["status"] in ("queued", "running"):
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+# Registered before the metrics hooks so that the profile is saved after
+# the Server-Timing header has been added
+@app.before_request
+def start_profile():
+    if request_profiler is None:
+        return
+    key = request.headers.get("X-Profile") or request.args.get("profile")
+    if key and hmac.compare_digest(key, config.profile_key):
+        g.profile_start = time.perf_counter()
+        g.profile = request_profiler.start()
+
+
+@app.after_request
+def save_profile(response):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        # The key is left out of the recorded URL
+        args = [(name, value) for name, value in request.args.items(multi=True) if name != "profile"]
+        path = request.path + ("?" + urlencode(args) if args else "")
+        # Streamed responses are profiled up to the point their body starts
+        response.headers["X-Profile-Name"] = request_profiler.stop(profile, {
+            "method": request.method,
+            "path": path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - g.profile_start) * 1000, 1),
+            "server_timing": response.headers.get("Server-Timing"),
+        })
+    return response
+
+
+@app.teardown_request
+def discard_profile(exception):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        request_profiler.discard(profile)
+
+
+metrics.describe("app_requests_total", "counter", "Requests by endpoint, method and status")
+metrics.describe("app_request_seconds", "histogram", "Request latency by endpoint")
+metrics.describe("app_requests_in_flight", "gauge", "Requests being handled by endpoint")
+metrics.describe("app_faces_detected_total", "counter", "Faces detected")
+metrics.describe("app_objects_detected_total", "counter", "Objects detected by label")
+
+
+def metrics_endpoint():
+    # Requests matching no route (404s, scanner probes) have no endpoint
+    return request.endpoint or "unmatched"
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+    metrics.add("app_requests_in_flight", 1, endpoint=metrics_endpoint())
+
+
+@app.after_request
+def finish_request_metrics(response):
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = metrics_endpoint()
+    metrics.inc("app_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe("app_request_seconds", elapsed, endpoint=endpoint)
+    server_timing = metrics.finish_request()
+    if server_timing is not None:
+        response.headers["Server-Timing"] = f"{server_timing}, total;dur={elapsed * 1000:.1f}"
+    return response
+
+
+@app.teardown_request
+def end_request_metrics(exception):
+    metrics.add("app_requests_in_flight", -1, endpoint=metrics_endpoint())
+
+
+@app.before_request
+def create_tables():
+    init_db()
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    if not api_authorized():
+        return jsonify({"error": "Invalid API key"}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
@@ -126,6 +778,7 @@ def profile():
 
 
 @app.route("/ai-face-analysis", methods=["GET", "POST"])
+@admitted("face_analysis")
 def ai_face_analysis():
     if session.get("user_id"):
         if request.method == "GET":
@@ -136,21 +789,43 @@ def ai_face_analysis():
                 return redirect(url_for("upload"))
             else:
                 if input_image_file and allowed_file(input_image_file.filename):
-                    input_image = Image.open(input_image_file.stream)
-                    input_image = np.array(input_image)
-                    output_image, genders, ages = face_analysis(input_image)
-                    image_uri = encode_image(output_image)
+                    detection_mode = face_detection_mode(request.form.get("detection_mode"))
+                    if detection_mode is None:
+                        flash("این دقت تشخیص رو نمی‌شناسم، یکی از گزینه‌ها رو انتخاب کن", "danger")
+                        return redirect(url_for("ai_face_analysis"))
+                    if config.async_jobs:
+                        # Decoding and inference happen in a job worker; the page polls for it
+                        payload = input_image_file.read(config.job_max_bytes + 1)
+                        if len(payload) > config.job_max_bytes:
+                            flash("این عکس خیلی بزرگه، یک عکس کوچک‌تر انتخاب کن", "danger")
+                            return redirect(url_for("ai_face_analysis"))
+                        job_id = job_queue.submit(
+                            "face-analysis",
+                            payload,
+                            {"page": True, "detection_mode": detection_mode},
+                        )
+                        return redirect(url_for("ai_face_analysis_job", job_id=job_id))
+                    try:
+                        input_image, _ = decode_upload(input_image_file.stream)
+                    except ImageTooLargeError:
+                        flash("این عکس خیلی بزرگه، یک عکس کوچک‌تر انتخاب کن", "danger")
+                        return redirect(url_for("ai_face_analysis"))
+                    genders, ages, output_image_data = analyze_faces(input_image, detection_mode)
+                    image_name = image_store.save(output_image_data)
+                    image_url = url_for("output_image", name=image_name)
                     return render_template(
                         "ai_face_analysis.html",
                         genders=genders,
                         ages=ages,
-                        image_uri=image_uri,
+                        image_url=image_url,
+                        detection_mode=detection_mode,
                     )
     else:
         return redirect(url_for("login"))
 
 
 @app.route("/ai-object-detection", methods=["GET", "POST"])
+@admitted("object_detection")
 def ai_object_detection():
     if session.get("user_id"):
         if request.method == "GET":
@@ -161,17 +836,97 @@ def ai_object_detection():
                 return redirect(url_for("upload"))
             else:
                 if input_image_file and allowed_file(input_image_file.filename):
-                    input_image = Image.open(input_image_file.stream)
-                    input_image = np.array(input_image)
-                    output_image, labels = object_detector(input_image)
-                    image_uri = encode_image(output_image)
+                    if config.async_jobs:
+                        payload = input_image_file.read(config.job_max_bytes + 1)
+                        if len(payload) > config.job_max_bytes:
+                            flash("این عکس خیلی بزرگه، یک عکس کوچک‌تر انتخاب کن", "danger")
+                            return redirect(url_for("ai_object_detection"))
+                        job_id = job_queue.submit("object-detection", payload, {"page": True})
+                        return redirect(url_for("ai_object_detection_job", job_id=job_id))
+                    try:
+                        input_image, _ = decode_object_upload(input_image_file.stream)
+                    except ImageTooLargeError:
+                        flash("این عکس خیلی بزرگه، یک عکس کوچک‌تر انتخاب کن", "danger")
+                        return redirect(url_for("ai_object_detection"))
+                    labels, output_image_data = detect_objects(input_image)
+                    image_name = image_store.save(output_image_data)
+                    image_url = url_for("output_image", name=image_name)
                     return render_template(
-                        "ai_object_detection.html", labels=labels, image_uri=image_uri
+                        "ai_object_detection.html", labels=labels, image_url=image_url
                     )
     else:
         return redirect(url_for("login"))
 
 
+def page_job(job_id, kind, page):
+    """Render a page job: still running, failed (back to the form) or its result."""
+    if not session.get("user_id"):
+        return redirect(url_for("login"))
+    job = job_queue.get(job_id)
+    if job is None or job["kind"] != kind:
+        flash("نتیجه این عکس دیگه در دسترس نیست، دوباره امتحان کن", "danger")
+        return redirect(url_for(page))
+    if job["status"] == "failed":
+        flash("پردازش این عکس انجام نشد، یک عکس دیگه انتخاب کن", "danger")
+        return redirect(url_for(page))
+    if job["status"] != "done":
+        return render_template(f"{page}.html", job_pending=True)
+    result = dict(job["result"])
+    image_url = url_for("output_image", name=result.pop("image_name"))
+    return render_template(f"{page}.html", image_url=image_url, **result)
+
+
+@app.route("/ai-face-analysis/jobs/<job_id>")
+def ai_face_analysis_job(job_id):
+    return page_job(job_id, "face-analysis", "ai_face_analysis")
+
+
+@app.route("/ai-object-detection/jobs/<job_id>")
+def ai_object_detection_job(job_id):
+    return page_job(job_id, "object-detection", "ai_object_detection")
+
+
+@app.route("/output-images/<name>")
+def output_image(name):
+    data, mimetype = image_store.get(name)
+    if data is None:
+        abort(404)
+    response = make_response(data)
+    response.mimetype = mimetype
+    # Names are content hashes, so a stored image never changes
+    response.set_etag(name)
+    response.cache_control.private = True
+    response.cache_control.max_age = config.output_image_store_ttl
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@app.route("/inference/stats")
+def inference_stats():
+    if config.inference_backend == "process":
+        return jsonify({
+            "pool": inference_backend.stats(),
+            "admission": {name: gate.stats() for name, gate in admission_gates.items()},
+            "streams": live_streams.stats(),
+            "jobs": job_queue.stats(),
+        })
+    return jsonify({
+        "batching": inference_backend.stats(),
+        "models": models.stats(),
+        "admission": {name: gate.stats() for name, gate in admission_gates.items()},
+        "streams": live_streams.stats(),
+        "jobs": job_queue.stats(),
+    })
+
+
+@app.route("/ai-live-detection", methods=["GET"])
+def ai_live_detection():
+    if session.get("user_id"):
+        return render_template("ai_live_detection.html")
+    else:
+        return redirect(url_for("login"))
+
+
 @app.route("/ai-pose-detection", methods=["GET"])
 def ai_pose_detection():
     if session.get("user_id"):
@@ -197,19 +952,66 @@ def mind_reader_result():
     return render_template("mind_reader_result.html", number=number)
 
 
-@app.route("/blog")
-def blog():
-    with Session(engine) as db_session:
-        statement = select(Topic)
-        topics = list(db_session.exec(statement))
+def cached_page(*tags):
+    """Serve a view from page_cache and answer conditional requests with 304.
+
+    tags name the data the page is rendered from, formatted with the view's
+    arguments; invalidating one of them in page_cache drops the page. Pages
+    are cached per user, since the navbar shows who is logged in, and not
+    at all while a flashed message is waiting to be shown.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if session.get("_flashes"):
+                return view(**kwargs)
+            user = (session.get("user_id"), session.get("user_username"))
+            key = page_cache.key((request.full_path, user), [tag.format(**kwargs) for tag in tags])
+            page = page_cache.get(key)
+            if page is None:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                page = page_cache.set(key, response.get_data(), response.mimetype)
+            response = Response(page["body"], mimetype=page["mimetype"])
+            response.set_etag(page["etag"])
+            response.last_modified = page["last_modified"]
+            # Browsers keep the page but revalidate it, which usually costs a 304
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
 
-    # for topic in topics:
-    #     topic.timestamp = relative_time(topic.timestamp)
 
-    return render_template("blog.html", topics=topics)
+def topics_page():
+    """The page of topics asked for by the limit, after and before query parameters."""
+    limit = request.args.get("limit", config.blog_page_size, type=int)
+    limit = min(max(limit, 1), config.blog_max_page_size)
+    page = get_topics_page(
+        limit,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        excerpt_length=config.blog_excerpt_length,
+    )
+    return dict(
+        page,
+        limit=limit,
+        page_sizes=[size for size in (10, 20, 50) if size <= config.blog_max_page_size],
+    )
+
+
+@app.route("/blog")
+@cached_page("topics")
+def blog():
+    return render_template("blog.html", **topics_page())
 
 
 @app.route("/blog/<int:topic_id>")
+@cached_page("topic-{topic_id}")
 def blog_topic(topic_id):
     with Session(engine) as db_session:
         topic = db_session.query(Topic).filter_by(id=topic_id).first()
@@ -223,14 +1025,72 @@ def admin():
     # if not user_id or role != "Admin":
     #     return redirect(url_for('login'))
 
-    with Session(engine) as db_session:
-        statement = select(User)
-        users = list(db_session.exec(statement))
+    per_page = request.args.get("per_page", config.admin_users_page_size, type=int)
+    per_page = min(max(per_page, 1), config.admin_users_max_page_size)
+    page = max(request.args.get("page", 1, type=int), 1)
+    search = request.args.get("q", "").strip()
+    sort = request.args.get("sort", "join_time")
+    if sort not in USER_SORT_COLUMNS:
+        sort = "join_time"
+    order = "asc" if request.args.get("order") == "asc" else "desc"
+    users, total = get_users_page(page, per_page, search, sort, descending=order == "desc")
+    return render_template(
+        "admin.html",
+        users=users,
+        total=total,
+        page=page,
+        pages=max((total + per_page - 1) // per_page, 1),
+        per_page=per_page,
+        q=search,
+        sort=sort,
+        order=order,
+    )
 
-    for user in users:
-        user.join_time = relative_time(user.join_time)
 
-    return render_template("admin.html", users=users)
+def profiles_authorized():
+    """Profiles expose code paths and file names, so reading them takes the
+    profile key, given once per session as ?key=."""
+    key = request.args.get("key")
+    if key and hmac.compare_digest(key, config.profile_key):
+        session["profiles_authorized"] = True
+    return session.get("profiles_authorized", False)
+
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    if request_profiler is not None and not profiles_authorized():
+        abort(403)
+    profiles = request_profiler.recent() if request_profiler is not None else []
+    return render_template(
+        "admin_profiles.html", profiles=profiles, enabled=request_profiler is not None
+    )
+
+
+@app.route("/admin/profiles/<name>")
+def admin_profile(name):
+    if request_profiler is None or request_profiler.path(name) is None:
+        abort(404)
+    if not profiles_authorized():
+        abort(403)
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "ncalls"):
+        sort = "cumulative"
+    return render_template(
+        "admin_profile.html",
+        profile=request_profiler.info(name),
+        sort=sort,
+        summary=request_profiler.summary(name, sort),
+    )
+
+
+@app.route("/admin/profiles/<name>/download")
+def admin_profile_download(name):
+    path = request_profiler.path(name) if request_profiler is not None else None
+    if path is None:
+        abort(404)
+    if not profiles_authorized():
+        abort(403)
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name + ".prof")
 
 
 @app.route("/admin/blog")
@@ -240,14 +1100,7 @@ def admin_blog():
     # if not user_id or role != "Admin":
     #     return redirect(url_for('login'))
 
-    with Session(engine) as db_session:
-        statement = select(Topic)
-        topics = list(db_session.exec(statement))
-
-    # for topic in topics:
-        # topic.timestamp = relative_time(topic.timestamp)
-
-    return render_template("admin_blog.html", topics=topics)
+    return render_template("admin_blog.html", **topics_page())
 
 
 @app.route("/admin/blog/add-topic", methods=["GET", "POST"])
@@ -269,6 +1122,8 @@ def admin_blog_add_topic():
         with Session(engine) as db_session:
             db_session.add(topic)
             db_session.commit()
+            # Its page may have been cached as missing before it existed
+            page_cache.invalidate("topics", f"topic-{topic.id}")
         return redirect(url_for("admin_blog"))
     
 @app.route("/admin/blog/edit-topic/<int:topic_id>", methods=["GET", "POST"])
@@ -289,6 +1144,7 @@ def admin_blog_edit_topic(topic_id):
                 topic.title = request.form["title"]
                 topic.body = request.form["body"]
                 db_session.commit()
+                page_cache.invalidate("topics", f"topic-{topic_id}")
                 return redirect(url_for("admin_blog"))
             else:
                 return "Topic not found", 404
@@ -302,6 +1158,7 @@ def admin_blog_delete_topic(topic_id):
         if topic:
             db_session.delete(topic)
             db_session.commit()
+            page_cache.invalidate("topics", f"topic-{topic_id}")
             return redirect(url_for("admin_blog"))
         else:
             return "Topic not found", 404
@@ -0,0 +1,135 @@
+"""Tiny randomly initialized ONNX models with the interfaces of the real ones.
+
+They let the benchmarks run the full pre- and post-processing code without
+the real weights. Timings of the network itself are meaningless, the
+surrounding Python is what they are for. Needs the `onnx` package.
+"""
+import os
+import numpy as np
+
+
+def conv(name, input_name, in_channels, out_channels, stride, rng, nodes, initializers, bias=0.0):
+    from onnx import helper, numpy_helper
+
+    # A single strided convolution maps the input straight to the output grid
+    weight = (rng.standard_normal((out_channels, in_channels, stride, stride)) * 0.01).astype(np.float32)
+    initializers += [
+        numpy_helper.from_array(weight, f"{name}_weight"),
+        numpy_helper.from_array(np.full(out_channels, bias, np.float32), f"{name}_bias"),
+    ]
+    nodes.append(
+        helper.make_node(
+            "Conv",
+            [input_name, f"{name}_weight", f"{name}_bias"],
+            [name],
+            kernel_shape=[stride, stride],
+            strides=[stride, stride],
+        )
+    )
+    return name
+
+
+def save(graph, path):
+    import onnx
+    from onnx import helper
+
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+
+
+def make_face_detection(path, seed=0):
+    """RetinaFace with keypoints: 3 strides, 2 anchors, score/bbox/kps outputs."""
+    from onnx import helper, numpy_helper, TensorProto
+
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+    outputs = {"score": [], "bbox": [], "kps": []}
+    for stride in (8, 16, 32):
+        for kind, channels in (("score", 2), ("bbox", 8), ("kps", 20)):
+            # Scores start low so random weights do not produce thousands of faces
+            bias = -4.0 if kind == "score" else 0.5
+            name = conv(f"{kind}{stride}", "input.1", 3, channels, stride, rng, nodes, initializers, bias)
+            nodes.append(helper.make_node("Transpose", [name], [f"{name}_nhwc"], perm=[0, 2, 3, 1]))
+            shape = np.array([-1, channels // 2], np.int64)
+            initializers.append(numpy_helper.from_array(shape, f"{name}_shape"))
+            nodes.append(helper.make_node("Reshape", [f"{name}_nhwc", f"{name}_shape"], [f"{name}_rows"]))
+            activation = "Sigmoid" if kind == "score" else "Relu"
+            nodes.append(helper.make_node(activation, [f"{name}_rows"], [f"{name}_out"]))
+            outputs[kind].append(f"{name}_out")
+    graph = helper.make_graph(
+        nodes,
+        "face_detection",
+        [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, [1, 3, "height", "width"])],
+        [
+            helper.make_tensor_value_info(name, TensorProto.FLOAT, ["anchors", None])
+            for name in outputs["score"] + outputs["bbox"] + outputs["kps"]
+        ],
+        initializers,
+    )
+    save(graph, path)
+
+
+def make_age_gender_estimation(path, seed=0):
+    """96x96 crops in, (gender logits, age / 100) out, dynamic batch."""
+    from onnx import helper, TensorProto
+
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+    name = conv("fc", "data", 3, 3, 96, rng, nodes, initializers, bias=0.3)
+    nodes.append(helper.make_node("Flatten", [name], ["fc1"], axis=1))
+    graph = helper.make_graph(
+        nodes,
+        "age_gender_estimation",
+        [helper.make_tensor_value_info("data", TensorProto.FLOAT, ["batch", 3, 96, 96])],
+        [helper.make_tensor_value_info("fc1", TensorProto.FLOAT, ["batch", 3])],
+        initializers,
+    )
+    save(graph, path)
+
+
+def make_object_detection(path, seed=0, size=640, num_classes=80):
+    """YOLOv8 head layout: (1, 4 + classes, anchors) with boxes in input pixels."""
+    from onnx import helper, numpy_helper, TensorProto
+
+    rng = np.random.default_rng(seed)
+    nodes, initializers, features = [], [], []
+    channels = 4 + num_classes
+    for stride in (8, 16, 32):
+        name = conv(f"p{stride}", "images", 3, channels, stride, rng, nodes, initializers, bias=-4.0)
+        initializers.append(numpy_helper.from_array(np.array([0, channels, -1], np.int64), f"{name}_shape"))
+        nodes.append(helper.make_node("Reshape", [name, f"{name}_shape"], [f"{name}_flat"]))
+        features.append(f"{name}_flat")
+    nodes.append(helper.make_node("Concat", features, ["features"], axis=2))
+    nodes.append(helper.make_node("Sigmoid", ["features"], ["activations"]))
+    # Boxes (cx, cy, w, h) spread over the input, class scores stay in [0, 1]
+    box_scale = np.ones((1, channels, 1), np.float32)
+    box_scale[0, :4, 0] = size
+    initializers.append(numpy_helper.from_array(box_scale, "box_scale"))
+    nodes.append(helper.make_node("Mul", ["activations", "box_scale"], ["output0"]))
+    graph = helper.make_graph(
+        nodes,
+        "object_detection",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [1, 3, size, size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [1, channels, None])],
+        initializers,
+    )
+    save(graph, path)
+
+
+STAND_INS = {
+    "face_detection": ("det_10g.onnx", make_face_detection),
+    "age_gender_estimation": ("genderage.onnx", make_age_gender_estimation),
+    "object_detection": ("yolov8n.onnx", make_object_detection),
+}
+
+
+def stand_in_path(name, directory):
+    """Path of the stand-in for a model, built on first use."""
+    filename, make = STAND_INS[name]
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        make(path)
+    return path
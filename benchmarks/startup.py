@@ -0,0 +1,100 @@
+"""Report how long importing and initializing each component of the app takes.
+
+Every import is timed in a fresh interpreter so that the numbers include the
+module's own dependencies, which is what a new worker process pays.
+
+    python benchmarks/startup.py --repeat 3
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPONENTS = [
+    "numpy",
+    "cv2",
+    "onnxruntime",
+    "flask",
+    "sqlmodel",
+    "database",
+    "utils.image",
+    "src.face_analysis",
+    "src.object_detection",
+    "app",
+]
+
+IMPORT_CODE = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+INIT_CODE = """
+import json
+import time
+import app
+times = {}
+for name in app.models.factories:
+    start = time.perf_counter()
+    app.models.get(name)
+    times[name] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+
+def run(code):
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result.stdout.strip().splitlines()[-1]
+
+
+def import_times(repeat):
+    times = {}
+    for module in COMPONENTS:
+        try:
+            samples = [float(run(IMPORT_CODE.format(module=module))) for _ in range(repeat)]
+            times[module] = statistics.median(samples)
+        except RuntimeError as e:
+            print(f"{module}: {e}", file=sys.stderr)
+    return times
+
+
+def init_times(repeat):
+    samples = [json.loads(run(INIT_CODE)) for _ in range(repeat)]
+    return {name: statistics.median(s[name] for s in samples) for name in samples[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the median is reported")
+    parser.add_argument("--skip-models", action="store_true", help="Only measure imports")
+    parser.add_argument("--json", type=str, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {"import": import_times(args.repeat)}
+    print(f"{'import':<30}{'seconds':>10}")
+    for name, seconds in results["import"].items():
+        print(f"{name:<30}{seconds:>10.3f}")
+
+    if not args.skip_models:
+        try:
+            results["init"] = init_times(args.repeat)
+        except RuntimeError as e:
+            print(f"model initialization failed: {e}", file=sys.stderr)
+        else:
+            print(f"\n{'model init':<30}{'seconds':>10}")
+            for name, seconds in results["init"].items():
+                print(f"{name:<30}{seconds:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
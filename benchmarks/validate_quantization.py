@@ -0,0 +1,169 @@
+"""Compare INT8 models against their FP32 originals on a local image set.
+
+Detections from both precisions are matched greedily by IoU. Face analysis
+reports detection agreement, mean IoU, age MAE and gender agreement over
+matched faces; object detection reports agreement and mean IoU over
+matches of the same class. Median latency per image is reported for both.
+
+    python -m src.quantize --calibration-dir uploads
+    python benchmarks/validate_quantization.py --images uploads
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.face_analysis import FaceAnalysis
+from src.object_detection import YOLOv8
+from src.quantize import load_images
+import config
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between every pair of (x1, y1, x2, y2) boxes."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match(boxes_a, boxes_b, iou_threshold, compatible=None):
+    """Greedily pair boxes, highest IoU first. Returns (index_a, index_b, iou) triples."""
+    ious = iou_matrix(boxes_a, boxes_b)
+    if compatible is not None:
+        ious = np.where(compatible, ious, 0.0)
+    pairs = []
+    while ious.size and ious.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        pairs.append((i, j, float(ious[i, j])))
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+    return pairs
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def summarize(num_reference, num_candidate, pairs, latency_reference, latency_candidate):
+    return {
+        "reference_detections": num_reference,
+        "candidate_detections": num_candidate,
+        "recall": len(pairs) / num_reference if num_reference else 1.0,
+        "precision": len(pairs) / num_candidate if num_candidate else 1.0,
+        "mean_iou": statistics.mean(iou for _, _, iou in pairs) if pairs else None,
+        "fp32_latency_ms": statistics.median(latency_reference) * 1000,
+        "int8_latency_ms": statistics.median(latency_candidate) * 1000,
+    }
+
+
+def analyze_faces(face_analysis, image):
+    faces = face_analysis.face_detection_model(image)
+    face_analysis.age_gender_estimation_model.estimate(image, faces)
+    return faces
+
+
+def validate_face_analysis(images, iou_threshold):
+    reference = FaceAnalysis(
+        config.face_detection_fp32_onnx_model_path,
+        config.age_gender_estimation_fp32_onnx_model_path,
+    )
+    candidate = FaceAnalysis(
+        config.model_path(config.face_detection_fp32_onnx_model_path, "int8"),
+        config.model_path(config.age_gender_estimation_fp32_onnx_model_path, "int8"),
+    )
+    for face_analysis in (reference, candidate):
+        face_analysis.face_detection_model.prepare(
+            0,
+            det_thresh=config.face_detection_threshold,
+            nms_thresh=config.face_detection_nms_threshold,
+        )
+        face_analysis.warmup()
+    num_reference = num_candidate = 0
+    all_pairs, age_errors, gender_matches = [], [], []
+    latency_reference, latency_candidate = [], []
+    for image in images:
+        detections_a, seconds_a = timed(analyze_faces, reference, image)
+        detections_b, seconds_b = timed(analyze_faces, candidate, image)
+        latency_reference.append(seconds_a)
+        latency_candidate.append(seconds_b)
+        pairs = match(
+            [face.bbox for face in detections_a], [face.bbox for face in detections_b], iou_threshold
+        )
+        for i, j, _ in pairs:
+            age_errors.append(abs(detections_a[i].age - detections_b[j].age))
+            gender_matches.append(bool(detections_a[i].gender == detections_b[j].gender))
+        num_reference += len(detections_a)
+        num_candidate += len(detections_b)
+        all_pairs += pairs
+    summary = summarize(num_reference, num_candidate, all_pairs, latency_reference, latency_candidate)
+    summary["age_mae"] = statistics.mean(age_errors) if age_errors else None
+    summary["gender_agreement"] = statistics.mean(gender_matches) if gender_matches else None
+    return summary
+
+
+def validate_object_detection(images, iou_threshold):
+    reference = YOLOv8(config.object_detection_fp32_onnx_model_path)
+    candidate = YOLOv8(config.model_path(config.object_detection_fp32_onnx_model_path, "int8"))
+    reference.warmup()
+    candidate.warmup()
+    num_reference = num_candidate = 0
+    all_pairs = []
+    latency_reference, latency_candidate = [], []
+    for image in images:
+        (boxes_a, _, class_ids_a), seconds_a = timed(reference.detect, image)
+        (boxes_b, _, class_ids_b), seconds_b = timed(candidate.detect, image)
+        latency_reference.append(seconds_a)
+        latency_candidate.append(seconds_b)
+        # YOLOv8 boxes are (left, top, width, height)
+        xyxy_a = np.concatenate([boxes_a[:, :2], boxes_a[:, :2] + boxes_a[:, 2:]], axis=1)
+        xyxy_b = np.concatenate([boxes_b[:, :2], boxes_b[:, :2] + boxes_b[:, 2:]], axis=1)
+        same_class = class_ids_a[:, None] == class_ids_b[None, :]
+        all_pairs += match(xyxy_a, xyxy_b, iou_threshold, same_class)
+        num_reference += len(boxes_a)
+        num_candidate += len(boxes_b)
+    return summarize(num_reference, num_candidate, all_pairs, latency_reference, latency_candidate)
+
+
+VALIDATORS = {
+    "face_analysis": validate_face_analysis,
+    "object_detection": validate_object_detection,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=str, default="uploads", help="Directory of validation images")
+    parser.add_argument("--max-images", type=int, default=200, help="Maximum number of images")
+    parser.add_argument("--iou-threshold", type=float, default=0.5, help="IoU needed to match two detections")
+    parser.add_argument(
+        "--models", type=str, nargs="+", default=list(VALIDATORS), choices=list(VALIDATORS), help="Pipelines to validate"
+    )
+    parser.add_argument("--json", type=str, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.max_images)
+    assert images, f"No images found in {args.images}"
+    results = {}
+    for name in args.models:
+        results[name] = VALIDATORS[name](images, args.iou_threshold)
+        print(name)
+        for key, value in results[name].items():
+            print(f"  {key:<24}{value if value is None or isinstance(value, int) else round(value, 4)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,258 @@
+"""Micro-benchmarks for the vision hot paths, with JSON baselines.
+
+Every case runs on deterministic synthetic inputs at several image sizes and
+face/object counts. The real models are used when their files exist,
+otherwise (or with --stand-ins) tiny random ONNX stand-ins are built, so
+the pre- and post-processing code can be measured anywhere.
+
+    python benchmarks/vision.py --save benchmarks/baseline.json
+    python benchmarks/vision.py --compare benchmarks/baseline.json --threshold 0.15
+
+Comparison exits with status 1 when any case got slower than the threshold.
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import platform
+import statistics
+import numpy as np
+import cv2
+import onnxruntime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stand_ins import stand_in_path
+from src.face import Face
+from src.face_detection import RetinaFace, DETECTION_MODES, distance2bbox, distance2kps
+from src.age_gender_estimation import AgeGenderEstimator
+from src.object_detection import YOLOv8, DETECTION_MODES as OBJECT_DETECTION_MODES
+from utils import face_align
+from utils.image import encode_image
+import config
+
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720), (1920, 1080)]
+FACE_COUNTS = [1, 8, 32]
+OBJECT_COUNTS = [1, 10, 100]
+
+FP32_MODEL_PATHS = {
+    "face_detection": config.face_detection_fp32_onnx_model_path,
+    "age_gender_estimation": config.age_gender_estimation_fp32_onnx_model_path,
+    "object_detection": config.object_detection_fp32_onnx_model_path,
+}
+
+
+def synthetic_image(width, height, seed=0):
+    # Smooth noise compresses like a photo, unlike per-pixel noise
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def synthetic_faces(width, height, count, seed=0):
+    rng = np.random.default_rng(seed)
+    faces = []
+    for _ in range(count):
+        size = rng.uniform(0.05, 0.2) * min(width, height)
+        x1 = rng.uniform(0, width - size)
+        y1 = rng.uniform(0, height - size)
+        bbox = np.array([x1, y1, x1 + size, y1 + size], dtype=np.float32)
+        kps = face_align.arcface_dst / 112.0 * size + np.array([x1, y1], dtype=np.float32)
+        faces.append(Face(bbox=bbox, kps=kps.astype(np.float32), det_score=np.float32(0.9)))
+    return faces
+
+
+def synthetic_dets(count, seed=0):
+    """Clusters of four overlapping boxes, as the detector produces around a face."""
+    rng = np.random.default_rng(seed)
+    centers = np.repeat(rng.uniform(50, 590, (count // 4 + 1, 2)), 4, axis=0)[:count]
+    sizes = np.repeat(rng.uniform(20, 80, count // 4 + 1), 4)[:count]
+    jitter = rng.normal(0, 3, (count, 2))
+    x1y1 = centers + jitter - sizes[:, None] / 2
+    x2y2 = x1y1 + sizes[:, None]
+    scores = rng.uniform(0.5, 1.0, count)
+    return np.hstack([x1y1, x2y2, scores[:, None]]).astype(np.float32)
+
+
+def synthetic_yolo_output(count, num_classes, input_size=640, anchors=8400, seed=0):
+    """Raw YOLOv8 output with exactly `count` candidates above any threshold up to 0.6."""
+    rng = np.random.default_rng(seed)
+    output = np.zeros((1, 4 + num_classes, anchors), dtype=np.float32)
+    output[0, 0:2] = rng.uniform(0, input_size, (2, anchors))
+    output[0, 2:4] = rng.uniform(10, input_size / 4, (2, anchors))
+    output[0, 4:] = rng.uniform(0, 0.3, (num_classes, anchors))
+    candidates = rng.choice(anchors, count, replace=False)
+    output[0, 4 + rng.integers(0, num_classes, count), candidates] = rng.uniform(0.6, 1.0, count)
+    return output
+
+
+def anchor_centers(size=640, stride=8, num_anchors=2):
+    centers = np.stack(np.mgrid[: size // stride, : size // stride][::-1], axis=-1).astype(np.float32)
+    centers = (centers * stride).reshape((-1, 2))
+    return np.repeat(centers, num_anchors, axis=0)
+
+
+def model_paths(use_stand_ins, stand_in_dir):
+    paths = {}
+    for name, path in FP32_MODEL_PATHS.items():
+        if use_stand_ins or not os.path.exists(path):
+            paths[name] = stand_in_path(name, stand_in_dir)
+        else:
+            paths[name] = path
+    return paths
+
+
+def cases(paths):
+    """Yield (name, callable) pairs; inputs are built before timing starts."""
+    face_detector = RetinaFace(paths["face_detection"])
+    age_gender_estimator = AgeGenderEstimator(paths["age_gender_estimation"])
+    object_detector = YOLOv8(paths["object_detection"])
+
+    for width, height in RESOLUTIONS:
+        image = synthetic_image(width, height)
+        resolution = f"{width}x{height}"
+        yield f"retinaface.detect[{resolution}]", lambda image=image: face_detector.detect(
+            image, input_size=(640, 640)
+        )
+        yield f"yolov8.preprocess[{resolution}]", lambda image=image: object_detector.preprocess(image)
+        yield f"encode_image[{resolution}]", lambda image=image: encode_image(image)
+
+    image = synthetic_image(1280, 720)
+    for mode in DETECTION_MODES:
+        yield f"retinaface.__call__[1280x720,{mode}]", lambda mode=mode: face_detector(image, mode=mode)
+
+    det_img, _ = face_detector.letterbox(synthetic_image(640, 480), (640, 640))
+    yield "retinaface.forward[640x640]", lambda: face_detector.forward(det_img, face_detector.det_thresh)
+
+    for count in (16, 256, 4096):
+        dets = synthetic_dets(count)
+        yield f"retinaface.nms[{count}]", lambda dets=dets: face_detector.nms(dets)
+
+    points = anchor_centers()
+    rng = np.random.default_rng(0)
+    bbox_distances = rng.uniform(0, 64, (len(points), 4)).astype(np.float32)
+    kps_distances = rng.uniform(-64, 64, (len(points), 10)).astype(np.float32)
+    yield f"distance2bbox[{len(points)}]", lambda: distance2bbox(points, bbox_distances)
+    yield f"distance2kps[{len(points)}]", lambda: distance2kps(points, kps_distances)
+
+    image = synthetic_image(3840, 2160)
+    for mode in OBJECT_DETECTION_MODES:
+        detector = YOLOv8(paths["object_detection"], mode=mode)
+        yield f"yolov8.detect[3840x2160,{mode}]", lambda detector=detector: detector.detect(image)
+
+    image = synthetic_image(1280, 720)
+    num_classes = len(object_detector.classes)
+    for count in OBJECT_COUNTS:
+        output = [synthetic_yolo_output(count, num_classes)]
+        yield f"yolov8.postprocess[1280x720,{count}]", lambda output=output: object_detector.postprocess(
+            image, output
+        )
+
+    for count in FACE_COUNTS:
+        faces = synthetic_faces(1280, 720, count)
+        yield f"age_gender.__call__[{count}]", lambda faces=faces: [
+            age_gender_estimator(image, face) for face in faces
+        ]
+
+    face = synthetic_faces(1280, 720, 1)[0]
+    center = (face.bbox[:2] + face.bbox[2:]) / 2
+    scale = 96 / ((face.bbox[2] - face.bbox[0]) * 1.5)
+    yield "face_align.transform[96]", lambda: face_align.transform(image, center, 96, scale, 0)
+    yield "face_align.estimate_norm[112]", lambda: face_align.estimate_norm(face.kps, 112)
+
+    faces = synthetic_faces(1280, 720, 32)
+    kps = np.stack([face.kps for face in faces])
+    Ms = face_align.estimate_norm(kps, 112)
+    points = np.random.default_rng(0).uniform(0, 720, (32, 106, 2)).astype(np.float32)
+    yield "face_align.estimate_norm[112,32]", lambda: face_align.estimate_norm(kps, 112)
+    yield "face_align.trans_points[106,32]", lambda: face_align.trans_points(points, Ms)
+
+
+def measure(fn, repeat, min_time):
+    timer = timeit.Timer(fn)
+    fn()
+    # Pick a loop count that takes about min_time per round
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    samples = [seconds / number for seconds in timer.repeat(repeat, number)]
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "rounds": repeat,
+        "number": number,
+    }
+
+
+def environment(paths):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": onnxruntime.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "models": {
+            name: "real" if path == FP32_MODEL_PATHS[name] else "stand-in"
+            for name, path in paths.items()
+        },
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return the names of cases whose median got slower than the threshold allows."""
+    regressions = []
+    print(f"{'case':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            print(f"{name:<40}{'-':>12}{result['median_ms']:>12.3f}{'new':>10}")
+            continue
+        change = result["median_ms"] / reference["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<40}{reference['median_ms']:>12.3f}{result['median_ms']:>12.3f}{change:>+10.1%}{flag}"
+        )
+    if baseline["environment"]["models"] != results["environment"]["models"]:
+        print("warning: baseline was recorded with different models", file=sys.stderr)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", type=str, default="", help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per case, the median is reported")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Approximate seconds per round")
+    parser.add_argument("--stand-ins", action="store_true", help="Use random stand-in models even if the real ones exist")
+    parser.add_argument(
+        "--stand-in-dir", type=str, default="cache/benchmark_models", help="Where stand-in models are written"
+    )
+    parser.add_argument("--save", type=str, help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", type=str, help="Compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before a case is flagged")
+    args = parser.parse_args()
+
+    paths = model_paths(args.stand_ins, args.stand_in_dir)
+    results = {"environment": environment(paths), "results": {}}
+    for name, fn in cases(paths):
+        if args.filter in name:
+            results["results"][name] = measure(fn, args.repeat, args.min_time)
+            if not args.compare:
+                print(f"{name:<40}{results['results'][name]['median_ms']:>12.3f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
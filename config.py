@@ -1,5 +1,186 @@
+import os
+
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
 
-face_detection_onnx_model_path = "models/det_10g.onnx"
-age_gender_estimation_onnx_model_path = "models/genderage.onnx"
-object_detection_onnx_model_path = "models/yolov8n.onnx"
+face_detection_fp32_onnx_model_path = "models/det_10g.onnx"
+age_gender_estimation_fp32_onnx_model_path = "models/genderage.onnx"
+object_detection_fp32_onnx_model_path = "models/yolov8n.onnx"
+
+
+def model_path(fp32_model_path, precision):
+    # INT8 models are written next to the FP32 ones by src/quantize.py
+    if precision == "int8":
+        return fp32_model_path[: -len(".onnx")] + ".int8.onnx"
+    return fp32_model_path
+
+
+# Precision per model: fp32 or int8
+face_detection_onnx_model_path = model_path(
+    face_detection_fp32_onnx_model_path, os.getenv("FACE_DETECTION_PRECISION", "fp32")
+)
+age_gender_estimation_onnx_model_path = model_path(
+    age_gender_estimation_fp32_onnx_model_path, os.getenv("AGE_GENDER_ESTIMATION_PRECISION", "fp32")
+)
+object_detection_onnx_model_path = model_path(
+    object_detection_fp32_onnx_model_path, os.getenv("OBJECT_DETECTION_PRECISION", "fp32")
+)
+
+face_detection_threshold = float(os.getenv("FACE_DETECTION_THRESHOLD", 0.5))
+face_detection_nms_threshold = float(os.getenv("FACE_DETECTION_NMS_THRESHOLD", 0.4))
+# Detector input size: fast (320), balanced (640), accurate (960), or adaptive,
+# which sizes the input so that faces spanning face_detection_min_face_ratio
+# of the longer image side are still found. Requests may pick their own mode
+FACE_DETECTION_MODES = ("fast", "balanced", "accurate", "adaptive")
+face_detection_mode = os.getenv("FACE_DETECTION_MODE", "balanced")
+face_detection_min_face_ratio = float(os.getenv("FACE_DETECTION_MIN_FACE_RATIO", 0.03))
+object_detection_confidence_threshold = float(os.getenv("OBJECT_DETECTION_CONFIDENCE_THRESHOLD", 0.5))
+object_detection_iou_threshold = float(os.getenv("OBJECT_DETECTION_IOU_THRESHOLD", 0.5))
+object_detection_class_aware_nms = os.getenv("OBJECT_DETECTION_CLASS_AWARE_NMS", "0") == "1"
+# Object detection inference mode: "letterbox" keeps the aspect ratio,
+# "resize" stretches images to the model input and "tiled" also runs
+# overlapping tiles of large images, as one batch or on
+# object_detection_tile_workers threads, at most
+# object_detection_max_batch_size windows per session.run
+OBJECT_DETECTION_MODES = ("resize", "letterbox", "tiled")
+object_detection_mode = os.getenv("OBJECT_DETECTION_MODE", "letterbox")
+object_detection_tile_size = int(os.getenv("OBJECT_DETECTION_TILE_SIZE", 640))
+object_detection_tile_overlap = float(os.getenv("OBJECT_DETECTION_TILE_OVERLAP", 0.2))
+object_detection_tile_workers = int(os.getenv("OBJECT_DETECTION_TILE_WORKERS", 0))
+object_detection_max_batch_size = int(os.getenv("OBJECT_DETECTION_MAX_BATCH_SIZE", 16))
+
+# Maximum number of face crops sent to the age/gender model in one session.run
+age_gender_estimation_batch_size = int(os.getenv("AGE_GENDER_ESTIMATION_BATCH_SIZE", 32))
+
+# Cross-request micro-batching: requests queued for the same model are grouped
+# into batches of up to inference_max_batch_size, waiting at most
+# inference_max_wait_time seconds for the batch to fill up
+inference_max_batch_size = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 8))
+inference_max_wait_time = float(os.getenv("INFERENCE_MAX_WAIT_MS", 5)) / 1000
+
+# Inference result cache: "memory" (per process), "disk" (shared by all workers
+# through inference_cache_dir) or "none"
+inference_cache_backend = os.getenv("INFERENCE_CACHE_BACKEND", "memory")
+inference_cache_dir = os.getenv("INFERENCE_CACHE_DIR", "./cache/inference")
+inference_cache_max_bytes = int(os.getenv("INFERENCE_CACHE_MAX_MB", 256)) * 1024 * 1024
+inference_cache_ttl = int(os.getenv("INFERENCE_CACHE_TTL", 3600))
+
+# When set, /api/v1 requests must send this value in the X-API-Key header
+api_key = os.getenv("API_KEY")
+
+# Annotated output images are stored for a short time and served from
+# /output-images/<name> instead of being inlined into the page. The disk
+# store is shared by all worker processes; "memory" only works with one,
+# since the image request may reach another process than the upload
+output_image_format = os.getenv("OUTPUT_IMAGE_FORMAT", "jpeg")  # png, jpeg or webp
+output_image_quality = int(os.getenv("OUTPUT_IMAGE_QUALITY", 85))
+output_image_max_dimension = int(os.getenv("OUTPUT_IMAGE_MAX_DIMENSION", 1600))  # 0 keeps full size
+output_image_store_backend = os.getenv("OUTPUT_IMAGE_STORE_BACKEND", "disk")  # disk or memory
+output_image_store_dir = os.getenv("OUTPUT_IMAGE_STORE_DIR", "./cache/output_images")
+output_image_store_max_bytes = int(os.getenv("OUTPUT_IMAGE_STORE_MAX_MB", 256)) * 1024 * 1024
+output_image_store_ttl = int(os.getenv("OUTPUT_IMAGE_STORE_TTL", 600))
+
+# Uploads are decoded at reduced resolution, keeping the shorter side at
+# least decode_min_size pixels. Larger images are rejected before decoding
+decode_min_size = int(os.getenv("DECODE_MIN_SIZE", 640))
+max_image_pixels = int(os.getenv("MAX_IMAGE_PIXELS", 64_000_000))
+
+# ONNX Runtime session options shared by all models
+onnx_graph_optimization_level = os.getenv("ONNX_GRAPH_OPTIMIZATION_LEVEL", "all")  # disable, basic, extended or all
+onnx_execution_mode = os.getenv("ONNX_EXECUTION_MODE", "sequential")  # sequential or parallel
+# 0 splits the cores evenly between the WEB_CONCURRENCY worker processes
+# (and their INFERENCE_POOL_WORKERS with INFERENCE_BACKEND=process)
+onnx_intra_op_num_threads = int(os.getenv("ONNX_INTRA_OP_NUM_THREADS", 0))
+onnx_inter_op_num_threads = int(os.getenv("ONNX_INTER_OP_NUM_THREADS", 1))
+onnx_enable_cpu_mem_arena = os.getenv("ONNX_ENABLE_CPU_MEM_ARENA", "1") == "1"
+onnx_allow_spinning = os.getenv("ONNX_ALLOW_SPINNING", "0") == "1"
+# Optimized models are saved here so restarts skip graph optimization; empty disables
+onnx_optimized_model_dir = os.getenv("ONNX_OPTIMIZED_MODEL_DIR", "./cache/onnx")
+# Run one dummy inference per model at startup
+onnx_warmup = os.getenv("ONNX_WARMUP", "1") == "1"
+web_concurrency = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Models are loaded on first use. List names here (comma separated, e.g.
+# "face_analysis,object_detection") to load and warm them up at startup
+preload_models = [name for name in os.getenv("PRELOAD_MODELS", "").split(",") if name]
+
+# "thread" runs the models in this process behind the micro-batching scheduler,
+# "process" runs them in a pool of worker processes fed through shared memory
+inference_backend = os.getenv("INFERENCE_BACKEND", "thread")
+inference_pool_workers = int(os.getenv("INFERENCE_POOL_WORKERS", 2))
+inference_pool_max_results = int(os.getenv("INFERENCE_POOL_MAX_RESULTS", 1024))
+# Seconds a request waits for a pool worker before it fails with a 503
+inference_pool_timeout = float(os.getenv("INFERENCE_POOL_TIMEOUT", 60))
+
+# Live camera streams: frames older than live_stream_max_latency seconds are
+# dropped instead of processed, and streams without frames or readers for
+# live_stream_idle_timeout seconds are closed
+live_stream_max_streams = int(os.getenv("LIVE_STREAM_MAX_STREAMS", 16))
+live_stream_max_latency = float(os.getenv("LIVE_STREAM_MAX_LATENCY_MS", 1000)) / 1000
+live_stream_idle_timeout = float(os.getenv("LIVE_STREAM_IDLE_TIMEOUT", 30))
+
+# Bulk analysis of zip archives and multi-file uploads. bulk_workers images
+# are decoded and analyzed at once, which also bounds the memory a request
+# uses; it should be somewhat above the inference batch size to fill batches
+bulk_workers = int(os.getenv("BULK_WORKERS", 16))
+bulk_max_images = int(os.getenv("BULK_MAX_IMAGES", 10000))
+bulk_max_image_bytes = int(os.getenv("BULK_MAX_IMAGE_MB", 32)) * 1024 * 1024
+bulk_spool_bytes = int(os.getenv("BULK_SPOOL_MB", 64)) * 1024 * 1024
+# Bulk requests running at once; more get a 503 with Retry-After
+bulk_max_requests = int(os.getenv("BULK_MAX_REQUESTS", 2))
+
+# Request bodies above max_request_bytes are rejected with 413 before they
+# are read; bulk uploads are spooled to disk and may be up to bulk_max_request_bytes
+max_request_bytes = int(os.getenv("MAX_REQUEST_MB", 32)) * 1024 * 1024
+bulk_max_request_bytes = int(os.getenv("BULK_MAX_REQUEST_MB", 1024)) * 1024 * 1024
+
+# Admission control: each model runs at most admission_max_in_flight
+# requests at once and up to admission_max_queue more wait for at most
+# admission_max_wait seconds. Requests beyond that get a 503 with a
+# Retry-After of admission_retry_after seconds before their upload is read
+admission_max_in_flight = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 16))
+admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", 16))
+admission_max_wait = float(os.getenv("ADMISSION_MAX_WAIT_MS", 2000)) / 1000
+admission_retry_after = int(os.getenv("ADMISSION_RETRY_AFTER", 1))
+
+# Background jobs are kept in a local SQLite file and run by job_workers
+# threads in every web process. With async_jobs the face analysis and object
+# detection pages submit a job and poll for it instead of blocking the request
+async_jobs = os.getenv("ASYNC_JOBS", "0") == "1"
+job_queue_path = os.getenv("JOB_QUEUE_PATH", "./cache/jobs.sqlite3")
+job_workers = int(os.getenv("JOB_WORKERS", 2))
+job_result_ttl = int(os.getenv("JOB_RESULT_TTL", 600))
+job_timeout = int(os.getenv("JOB_TIMEOUT", 300))
+job_max_bytes = int(os.getenv("JOB_MAX_MB", 32)) * 1024 * 1024
+
+# Per-stage latency histograms and request counters, served on /metrics in
+# the Prometheus text format and per response in Server-Timing headers
+metrics_enabled = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Requests that send profile_key in an X-Profile header or a ?profile= query
+# parameter are profiled with cProfile, at most profile_max_per_minute of
+# them. The newest profile_max_profiles are kept and listed on
+# /admin/profiles. Profiling is off while PROFILE_KEY is unset
+profile_key = os.getenv("PROFILE_KEY")
+profile_dir = os.getenv("PROFILE_DIR", "./cache/profiles")
+profile_max_profiles = int(os.getenv("PROFILE_MAX_PROFILES", 50))
+profile_max_per_minute = int(os.getenv("PROFILE_MAX_PER_MINUTE", 6))
+
+# Rendered blog pages, invalidated when an admin changes a topic. Tags are
+# versioned in the same backend, so with several worker processes only
+# "disk" shares invalidations between them; it is the default then
+page_cache_backend = os.getenv("PAGE_CACHE_BACKEND", "disk" if web_concurrency > 1 else "memory")
+page_cache_dir = os.getenv("PAGE_CACHE_DIR", "./cache/pages")
+page_cache_max_bytes = int(os.getenv("PAGE_CACHE_MAX_MB", 64)) * 1024 * 1024
+page_cache_ttl = int(os.getenv("PAGE_CACHE_TTL", 3600))
+
+# Blog listings show blog_page_size topics per page by default; ?limit= may
+# ask for up to blog_max_page_size. Listings load only the first
+# blog_excerpt_length characters of each body
+blog_page_size = int(os.getenv("BLOG_PAGE_SIZE", 10))
+blog_max_page_size = int(os.getenv("BLOG_MAX_PAGE_SIZE", 50))
+blog_excerpt_length = int(os.getenv("BLOG_EXCERPT_LENGTH", 200))
+
+# The admin user table shows admin_users_page_size users per page by
+# default, and at most admin_users_max_page_size
+admin_users_page_size = int(os.getenv("ADMIN_USERS_PAGE_SIZE", 50))
+admin_users_max_page_size = int(os.getenv("ADMIN_USERS_MAX_PAGE_SIZE", 200))
@@ -1,14 +1,22 @@
 import os
+import threading
+from collections import namedtuple
 from datetime import datetime
 from dotenv import load_dotenv
+from sqlalchemy import Index, String, func, inspect, text, tuple_
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 
 
 class User(SQLModel, table=True):
+    # Prefix searches use LIKE 'abc%', which needs a pattern index in Postgres
+    __table_args__ = (
+        Index("ix_user_username_pattern", "username", postgresql_ops={"username": "text_pattern_ops"}),
+    )
+
     id: int = Field(default=None, primary_key=True)
     username: str = Field(index=True)
     password: str
-    join_time: str
+    join_time: datetime = Field(default_factory=datetime.now, index=True)
 
 
 class Comment(SQLModel, table=True):
@@ -19,6 +27,9 @@ class Comment(SQLModel, table=True):
 
 
 class Topic(SQLModel, table=True):
+    # The blog lists topics newest first and pages through them by (timestamp, id)
+    __table_args__ = (Index("ix_topic_timestamp_id", "timestamp", "id"),)
+
     id: int = Field(default=None, primary_key=True)
     title: str
     body: str
@@ -36,14 +47,48 @@ DATABASE_HOST = os.getenv("DATABASE_HOST")
 DATABASE_USER = os.getenv("DATABASE_USER")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
-DATABASE_URL = (
+# DATABASE_URL, when set, replaces the Postgres settings above (the tests use SQLite)
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}/{DATABASE_NAME}"
 )
 
 engine = create_engine(DATABASE_URL, echo=True)
 
-# Create the database tables
-SQLModel.metadata.create_all(engine)
+tables_created = False
+tables_lock = threading.Lock()
+
+
+USER_SORT_COLUMNS = {"id": User.id, "username": User.username, "join_time": User.join_time}
+
+
+def migrate_user_join_time():
+    # join_time used to be text; Postgres converts it in place, SQLite already
+    # stores datetimes as the same text
+    if engine.dialect.name != "postgresql":
+        return
+    columns = {column["name"]: column["type"] for column in inspect(engine).get_columns("user")}
+    if isinstance(columns.get("join_time"), String):
+        column_type = User.__table__.c.join_time.type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.execute(
+                text(f'ALTER TABLE "user" ALTER COLUMN join_time TYPE {column_type} USING join_time::{column_type}')
+            )
+
+
+def init_db():
+    # Create the database tables on first use rather than at import time
+    global tables_created
+    if tables_created:
+        return
+    with tables_lock:
+        if not tables_created:
+            SQLModel.metadata.create_all(engine)
+            migrate_user_join_time()
+            # create_all skips existing tables, so add indexes introduced since
+            for table in SQLModel.metadata.tables.values():
+                for index in table.indexes:
+                    index.create(engine, checkfirst=True)
+            tables_created = True
 
 
 def get_user_by_username(username: str):
@@ -53,9 +98,96 @@ def get_user_by_username(username: str):
 
 
 def create_user(username: str, password_hash: str):
-    user = User(username=username, password=password_hash, join_time=datetime.now())
+    user = User(username=username, password=password_hash)
     with Session(engine) as db_session:
         db_session.add(user)
         db_session.commit()
         db_session.refresh(user)
     return user
+
+
+def get_users_page(page, per_page, search="", sort="join_time", descending=True):
+    """Return one page of users, and the number of users matching search.
+
+    search matches the start of the username. Only the requested page is
+    loaded, ordered by a USER_SORT_COLUMNS column with id as tiebreaker.
+    """
+    statement = select(User.id, User.username, User.join_time)
+    count = select(func.count()).select_from(User)
+    if search:
+        condition = User.username.startswith(search, autoescape=True)
+        statement = statement.where(condition)
+        count = count.where(condition)
+    column = USER_SORT_COLUMNS[sort]
+    order = [column.desc(), User.id.desc()] if descending else [column, User.id]
+    statement = statement.order_by(*order).offset((page - 1) * per_page).limit(per_page)
+    with Session(engine) as db_session:
+        total = db_session.exec(count).one()
+        users = list(db_session.exec(statement))
+    return users, total
+
+
+def parse_topic_cursor(cursor):
+    """Return the (timestamp, id) in a cursor made by topic_cursor, or None if it is invalid."""
+    try:
+        timestamp, topic_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(timestamp), int(topic_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def topic_cursor(topic):
+    return f"{topic.timestamp.isoformat()}_{topic.id}"
+
+
+TopicExcerpt = namedtuple("TopicExcerpt", "id title timestamp excerpt truncated")
+
+
+def get_topics_page(limit, after=None, before=None, excerpt_length=200):
+    """Return a page of topics, newest first, and the cursors of the pages around it.
+
+    Pages are found by keyset on (timestamp, id) instead of OFFSET, so every
+    page costs the same index range scan. Only the first excerpt_length
+    characters of each body are loaded, plus one to tell whether it goes on.
+    after continues with older topics, before goes back to newer ones; the
+    returned cursors are None at either end of the blog.
+    """
+    key = tuple_(Topic.timestamp, Topic.id)
+    statement = select(
+        Topic.id,
+        Topic.title,
+        Topic.timestamp,
+        func.substr(Topic.body, 1, excerpt_length + 1).label("excerpt"),
+    )
+    after = parse_topic_cursor(after) if after else None
+    before = parse_topic_cursor(before) if before and not after else None
+    if before is not None:
+        statement = statement.where(key > before).order_by(Topic.timestamp, Topic.id)
+    else:
+        if after is not None:
+            statement = statement.where(key < after)
+        statement = statement.order_by(Topic.timestamp.desc(), Topic.id.desc())
+    with Session(engine) as db_session:
+        topics = list(db_session.exec(statement.limit(limit + 1)))
+
+    more = len(topics) > limit
+    topics = [
+        TopicExcerpt(
+            topic.id,
+            topic.title,
+            topic.timestamp,
+            topic.excerpt[:excerpt_length],
+            len(topic.excerpt.rstrip()) > excerpt_length,
+        )
+        for topic in topics[:limit]
+    ]
+    if before is not None:
+        topics.reverse()
+        has_newer, has_older = more, True
+    else:
+        has_newer, has_older = after is not None, more
+    return {
+        "topics": topics,
+        "newer": topic_cursor(topics[0]) if topics and has_newer else None,
+        "older": topic_cursor(topics[-1]) if topics and has_older else None,
+    }
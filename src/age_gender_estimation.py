@@ -1,16 +1,19 @@
 import numpy as np
 import cv2
-import onnxruntime
 from utils import face_align
+from src.onnx_session import create_session
+from utils.metrics import metrics
 
 
 class AgeGenderEstimator:
-    def __init__(self, model_file=None):
+    def __init__(self, model_file=None, batch_size=32):
         assert model_file is not None
         self.model_file = model_file
         self.input_mean = 0.0
         self.input_std = 1.0
-        self.session = onnxruntime.InferenceSession(self.model_file, providers=["CPUExecutionProvider"])
+        # genderage.onnx declares a [1, 3] output, so every batched run would
+        # log a VerifyOutputSizes warning; only errors are logged for it
+        self.session = create_session(self.model_file, log_severity_level=3)
         input_cfg = self.session.get_inputs()[0]
         input_shape = input_cfg.shape
         input_name = input_cfg.name
@@ -23,26 +26,77 @@ class AgeGenderEstimator:
         self.input_name = input_name
         self.output_names = output_names
         assert len(self.output_names) == 1
+        # Models exported with a fixed batch dimension must be fed exactly that many crops
+        if isinstance(input_shape[0], int) and input_shape[0] > 0:
+            self.fixed_batch_size = True
+            self.batch_size = input_shape[0]
+        else:
+            self.fixed_batch_size = False
+            self.batch_size = batch_size
 
-    def __call__(self, img, face):
-        bbox = face.bbox
-        w, h = (bbox[2] - bbox[0]), (bbox[3] - bbox[1])
-        center = (bbox[2] + bbox[0]) / 2, (bbox[3] + bbox[1]) / 2
+    def crop(self, img, face):
+        return self.crops(img, [face])[0]
+
+    def crops(self, img, faces):
+        if len(faces) == 0:
+            return []
+        bboxes = np.array([face.bbox for face in faces], dtype=np.float32)
+        w, h = (bboxes[:, 2] - bboxes[:, 0]), (bboxes[:, 3] - bboxes[:, 1])
+        centers = (bboxes[:, 2:4] + bboxes[:, 0:2]) / 2
         rotate = 0
-        _scale = self.input_size[0] / (max(w, h) * 1.5)
-        aimg, M = face_align.transform(img, center, self.input_size[0], _scale, rotate)
-        input_size = tuple(aimg.shape[0:2][::-1])
-        blob = cv2.dnn.blobFromImage(
-            aimg,
+        _scales = self.input_size[0] / (np.maximum(w, h) * 1.5)
+        Ms = face_align.transform_matrix(centers, self.input_size[0], _scales, rotate)
+        output_size = (self.input_size[0], self.input_size[0])
+        return [cv2.warpAffine(img, M, output_size, borderValue=0.0) for M in Ms]
+
+    def forward(self, blob):
+        preds = []
+        for start in range(0, blob.shape[0], self.batch_size):
+            chunk = blob[start : start + self.batch_size]
+            num = chunk.shape[0]
+            if self.fixed_batch_size and num < self.batch_size:
+                padding = np.zeros((self.batch_size - num,) + chunk.shape[1:], dtype=chunk.dtype)
+                chunk = np.concatenate([chunk, padding])
+            pred = self.session.run(self.output_names, {self.input_name: chunk})[0]
+            preds.append(pred[:num])
+        return np.concatenate(preds)
+
+    def estimate(self, img, faces):
+        return self.batch([(img, faces)])[0]
+
+    def preprocess(self, crops):
+        return cv2.dnn.blobFromImages(
+            crops,
             1.0 / self.input_std,
-            input_size,
+            self.input_size,
             (self.input_mean, self.input_mean, self.input_mean),
             swapRB=False,
         )
-        pred = self.session.run(self.output_names, {self.input_name: blob})[0][0]
-        assert len(pred) == 3
-        gender = np.argmax(pred[:2])
-        age = int(np.round(pred[2] * 100))
-        face["gender"] = gender
-        face["age"] = age
-        return gender, age
+
+    def batch(self, requests):
+        with metrics.time("preprocess", model="AgeGenderEstimator"):
+            crops = [crop for img, faces in requests for crop in self.crops(img, faces)]
+            if len(crops) == 0:
+                return [([], []) for _ in requests]
+            blob = self.preprocess(crops)
+        with metrics.time("session_run", model="AgeGenderEstimator"):
+            preds = self.forward(blob)
+        assert preds.shape[1] == 3
+        genders = np.argmax(preds[:, :2], axis=1)
+        ages = np.round(preds[:, 2] * 100).astype(int)
+        results = []
+        start = 0
+        for img, faces in requests:
+            for face, gender, age in zip(faces, genders[start:], ages[start:]):
+                face["gender"] = gender
+                face["age"] = int(age)
+            start += len(faces)
+            results.append(([face.gender for face in faces], [face.age for face in faces]))
+        return results
+
+    def warmup(self):
+        self.forward(np.zeros((1, 3) + self.input_size[::-1], dtype=np.float32))
+
+    def __call__(self, img, face):
+        genders, ages = self.estimate(img, [face])
+        return genders[0], ages[0]
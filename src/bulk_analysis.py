@@ -0,0 +1,184 @@
+"""Analyze many images in one go: a zip archive, uploaded files or a directory.
+
+Entries are read, decoded and analyzed by a pool of threads. Every thread
+blocks on the inference backend, whose micro-batchers group the concurrent
+requests into model batches, so running a few more threads than the batch
+size keeps the batches full. At most max_pending entries are in memory at
+once and results come out in input order as soon as they are ready.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.data import allowed_file
+from utils.image import ImageTooLargeError
+
+
+def face_to_json(face, scale):
+    x_scale, y_scale = scale
+    x1, y1, x2, y2 = face.bbox.tolist()
+    landmarks = None
+    if face.kps is not None:
+        landmarks = [[x * x_scale, y * y_scale] for x, y in face.kps.tolist()]
+    return {
+        "box": [x1 * x_scale, y1 * y_scale, x2 * x_scale, y2 * y_scale],
+        "score": float(face.det_score),
+        "landmarks": landmarks,
+        "gender": face.sex,
+        "age": face.age,
+    }
+
+
+def object_to_json(box, score, class_id, label, scale):
+    x_scale, y_scale = scale
+    x, y, w, h = box
+    return {
+        "box": [x * x_scale, y * y_scale, (x + w) * x_scale, (y + h) * y_scale],
+        "score": float(score),
+        "class_id": class_id,
+        "label": label,
+    }
+
+
+def decode_data(decode, data):
+    try:
+        return decode(io.BytesIO(data))
+    except ImageTooLargeError:
+        raise
+    except Exception:
+        raise ValueError("Not a png or jpeg image")
+
+
+def face_analyzer(backend, decode, detection_mode=None):
+    """Return analyze(data) for encoded images, running face analysis on backend."""
+
+    def analyze(data):
+        input_image, scale = decode_data(decode, data)
+        faces, _ = backend.analyze_faces(input_image, detection_mode=detection_mode)
+        return {"faces": [face_to_json(face, scale) for face in faces]}
+
+    return analyze
+
+
+def object_analyzer(backend, decode):
+    """Return analyze(data) for encoded images, running object detection on backend."""
+
+    def analyze(data):
+        input_image, scale = decode_data(decode, data)
+        boxes, scores, class_ids, labels, _ = backend.detect_objects(input_image)
+        return {
+            "objects": [
+                object_to_json(box, score, class_id, label, scale)
+                for box, score, class_id, label in zip(
+                    boxes.tolist(), scores, class_ids.tolist(), labels
+                )
+            ]
+        }
+
+    return analyze
+
+
+def archive_entries(archive, max_bytes=None):
+    """Yield (name, read) for the images in a zip file; read() returns the bytes."""
+
+    def reader(info):
+        def read():
+            if max_bytes and info.file_size > max_bytes:
+                raise ImageTooLargeError(f"Image has {info.file_size} bytes, the limit is {max_bytes}")
+            return archive.read(info)
+
+        return read
+
+    for info in archive.infolist():
+        # Skip folders and the resource forks macOS adds to archives
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or not allowed_file(info.filename):
+            continue
+        yield info.filename, reader(info)
+
+
+def spool(stream, max_memory):
+    """Copy stream into a temporary file that stays in memory up to max_memory bytes."""
+    spooled = tempfile.SpooledTemporaryFile(max_memory)
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+def file_entries(files, max_memory):
+    """Return (name, read) for uploaded files with an allowed extension.
+
+    Uploads are closed when the view returns, before a streamed response
+    reads them, so they are first copied into one temporary file.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_memory)
+    lock = threading.Lock()
+
+    def reader(offset, size):
+        def read():
+            with lock:
+                spooled.seek(offset)
+                return spooled.read(size)
+
+        return read
+
+    entries = []
+    for file in files:
+        if allowed_file(file.filename):
+            offset = spooled.tell()
+            shutil.copyfileobj(file.stream, spooled)
+            entries.append((file.filename, reader(offset, spooled.tell() - offset)))
+    return entries
+
+
+def directory_entries(directory):
+    """Yield (path, read) for the images below directory, in sorted order."""
+
+    def reader(path):
+        def read():
+            with open(path, "rb") as f:
+                return f.read()
+
+        return read
+
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            if allowed_file(name):
+                path = os.path.join(root, name)
+                yield path, reader(path)
+
+
+def open_archive(stream):
+    """Open a zip archive, or return None if stream is not one."""
+    try:
+        return zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        return None
+
+
+def result(name, future):
+    try:
+        return dict(name=name, **future.result())
+    except Exception as e:
+        return {"name": name, "error": str(e) or type(e).__name__}
+
+
+def analyze_all(entries, analyze, workers=8, max_pending=None):
+    """Yield {"name": ..., **analyze(read())} or {"name": ..., "error": ...} per entry, in order."""
+    max_pending = max_pending or 2 * workers
+    executor = ThreadPoolExecutor(workers, thread_name_prefix="bulk-analysis")
+    pending = deque()
+    try:
+        for name, read in entries:
+            pending.append((name, executor.submit(lambda read=read: analyze(read()))))
+            if len(pending) >= max_pending:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+    finally:
+        # A client that disconnects closes the generator; drop the work it left behind
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -1,31 +1,38 @@
+import sys
+import json
 import argparse
 import cv2
-from src.face_detection import RetinaFace
+from src.face_detection import RetinaFace, DETECTION_MODES
 from src.age_gender_estimation import AgeGenderEstimator
 
 
 class FaceAnalysis:
-    def __init__(self, face_detection_onnx_model_path, age_gender_estimation_onnx_model_path):
+    def __init__(
+        self,
+        face_detection_onnx_model_path,
+        age_gender_estimation_onnx_model_path,
+        age_gender_estimation_batch_size=32,
+    ):
         self.face_detection_model = RetinaFace(face_detection_onnx_model_path)
-        self.age_gender_estimation_model = AgeGenderEstimator(age_gender_estimation_onnx_model_path)
+        self.age_gender_estimation_model = AgeGenderEstimator(
+            age_gender_estimation_onnx_model_path, age_gender_estimation_batch_size
+        )
+
+    def warmup(self):
+        self.face_detection_model.warmup()
+        self.age_gender_estimation_model.warmup()
 
     def postprocess(self, image):
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return image
 
-    def __call__(self, input_image):
-        faces = self.face_detection_model(input_image)
-        genders = []
-        ages = []
+    def draw(self, input_image, faces):
         output_image = input_image.copy()
         for face in faces:
             bbox = face.bbox.astype(int)
-            gender, age = self.age_gender_estimation_model(input_image, face)
-            genders.append(gender)
-            ages.append(age)
             # Draw bounding box and labels on the image
             cv2.rectangle(output_image, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
-            label = f"Gender: {'Male' if gender == 1 else 'Female'}, Age: {int(age)}"
+            label = f"Gender: {'Male' if face.gender == 1 else 'Female'}, Age: {int(face.age)}"
             cv2.putText(
                 output_image,
                 label,
@@ -35,15 +42,25 @@ class FaceAnalysis:
                 (36, 255, 12),
                 2,
             )
-        
+
         output_image = self.postprocess(output_image)
+        return output_image
+
+    def __call__(self, input_image):
+        faces = self.face_detection_model(input_image)
+        genders, ages = self.age_gender_estimation_model.estimate(input_image, faces)
+        output_image = self.draw(input_image, faces)
         return output_image, genders, ages
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--image", type=str, required=True ,help="Input image path",
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
+        "--image", type=str, help="Input image path",
+    )
+    inputs.add_argument(
+        "--dir", type=str, help="Analyze every image below this directory and write one JSON line per image",
     )
     parser.add_argument(
         "--face-detection-model", type=str, default="models/det_10g.onnx", help="ONNX model path"
@@ -51,14 +68,51 @@ if __name__ == "__main__":
     parser.add_argument(
         "--age-gender-estimation-model", type=str, default="models/genderage.onnx", help="ONNX model path"
     )
+    parser.add_argument(
+        "--detection-mode", type=str, default=None, choices=DETECTION_MODES, help="Face detector input size"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="Images per detector batch in --dir mode"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Write the JSON lines here instead of stdout"
+    )
     args = parser.parse_args()
 
-    input_image = cv2.imread(args.image)
-    if input_image is not None:
-        face_analysis = FaceAnalysis(args.face_detection_model, args.age_gender_estimation_model)
-        output_image, genders, ages = face_analysis(input_image)
-        cv2.imshow("Age and Gender Detection", output_image)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+    face_analysis = FaceAnalysis(args.face_detection_model, args.age_gender_estimation_model)
+    if args.dir:
+        from src.bulk_analysis import analyze_all, directory_entries, face_analyzer
+        from src.inference_scheduler import InferenceScheduler
+        from src.model_registry import ModelRegistry
+        from utils.image import decode_image
+        import config
+
+        face_analysis.face_detection_model.prepare(
+            0,
+            det_thresh=config.face_detection_threshold,
+            nms_thresh=config.face_detection_nms_threshold,
+            detection_mode=config.face_detection_mode,
+            min_face_ratio=config.face_detection_min_face_ratio,
+        )
+        models = ModelRegistry()
+        models.register("face_analysis", lambda: face_analysis)
+        scheduler = InferenceScheduler(models, args.batch_size)
+        analyze = face_analyzer(
+            scheduler,
+            lambda stream: decode_image(stream, config.decode_min_size, config.max_image_pixels),
+            args.detection_mode,
+        )
+        output = open(args.output, "w") if args.output else sys.stdout
+        for result in analyze_all(directory_entries(args.dir), analyze, workers=2 * args.batch_size):
+            output.write(json.dumps(result) + "\n")
+        if args.output:
+            output.close()
     else:
-        print("Could not read image:", args.image)
+        input_image = cv2.imread(args.image)
+        if input_image is not None:
+            output_image, genders, ages = face_analysis(input_image)
+            cv2.imshow("Age and Gender Detection", output_image)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+        else:
+            print("Could not read image:", args.image)
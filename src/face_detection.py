@@ -1,9 +1,18 @@
 import os
+import math
 import argparse
 import numpy as np
 import cv2
-import onnxruntime
 from src.face import Face
+from src.onnx_session import create_session
+from utils.metrics import metrics
+
+
+# Longer side of the detector input in each detection mode
+DETECTION_SIZES = {"fast": 320, "balanced": 640, "accurate": 960}
+DETECTION_MODES = list(DETECTION_SIZES) + ["adaptive"]
+# Faces much smaller than the smallest anchor (16 px at stride 8) are missed
+MIN_FACE_SIZE = 16
 
 
 def distance2bbox(points, distance, max_shape=None):
@@ -23,35 +32,30 @@ def distance2bbox(points, distance, max_shape=None):
     x2 = points[:, 0] + distance[:, 2]
     y2 = points[:, 1] + distance[:, 3]
     if max_shape is not None:
-        x1 = x1.clamp(min=0, max=max_shape[1])
-        y1 = y1.clamp(min=0, max=max_shape[0])
-        x2 = x2.clamp(min=0, max=max_shape[1])
-        y2 = y2.clamp(min=0, max=max_shape[0])
+        x1 = np.clip(x1, 0, max_shape[1])
+        y1 = np.clip(y1, 0, max_shape[0])
+        x2 = np.clip(x2, 0, max_shape[1])
+        y2 = np.clip(y2, 0, max_shape[0])
     return np.stack([x1, y1, x2, y2], axis=-1)
 
 
 def distance2kps(points, distance, max_shape=None):
-    """Decode distance prediction to bounding box.
+    """Decode distance prediction to keypoints.
 
     Args:
         points (Tensor): Shape (n, 2), [x, y].
-        distance (Tensor): Distance from the given point to 4
-            boundaries (left, top, right, bottom).
+        distance (Tensor): Offsets (dx, dy) from the given point to
+            each keypoint, shape (n, num_points * 2).
         max_shape (tuple): Shape of the image.
 
     Returns:
-        Tensor: Decoded bboxes.
+        Tensor: Decoded keypoints, shape (n, num_points * 2).
     """
-    preds = []
-    for i in range(0, distance.shape[1], 2):
-        px = points[:, i % 2] + distance[:, i]
-        py = points[:, i % 2 + 1] + distance[:, i + 1]
-        if max_shape is not None:
-            px = px.clamp(min=0, max=max_shape[1])
-            py = py.clamp(min=0, max=max_shape[0])
-        preds.append(px)
-        preds.append(py)
-    return np.stack(preds, axis=-1)
+    preds = distance + np.tile(points, distance.shape[1] // 2)
+    if max_shape is not None:
+        np.clip(preds[:, 0::2], 0, max_shape[1], out=preds[:, 0::2])
+        np.clip(preds[:, 1::2], 0, max_shape[0], out=preds[:, 1::2])
+    return preds
 
 
 class RetinaFace:
@@ -62,10 +66,12 @@ class RetinaFace:
         if self.session is None:
             assert self.model_file is not None
             assert os.path.exists(self.model_file)
-            self.session = onnxruntime.InferenceSession(self.model_file, None)
+            self.session = create_session(self.model_file)
         self.center_cache = {}
         self.nms_thresh = 0.4
         self.det_thresh = 0.5
+        self.detection_mode = "balanced"
+        self.min_face_ratio = 0.03
         self._init_vars()
         self.prepare(ctx_id=0, det_size=(640, 640))
 
@@ -86,6 +92,9 @@ class RetinaFace:
         self.output_names = output_names
         self.input_mean = 127.5
         self.input_std = 128.0
+        self.batched = False
+        if len(outputs[0].shape) == 3:
+            self.batched = True
         self.use_kps = False
         self._anchor_ratio = 1.0
         self._num_anchors = 1
@@ -117,72 +126,121 @@ class RetinaFace:
         det_thresh = kwargs.get("det_thresh", None)
         if det_thresh is not None:
             self.det_thresh = det_thresh
+        detection_mode = kwargs.get("detection_mode", None)
+        if detection_mode is not None:
+            assert detection_mode in DETECTION_MODES, detection_mode
+            self.detection_mode = detection_mode
+        min_face_ratio = kwargs.get("min_face_ratio", None)
+        if min_face_ratio is not None:
+            self.min_face_ratio = min_face_ratio
         input_size = kwargs.get("input_size", None)
         if input_size is not None:
             if self.input_size is not None:
                 print("warning: det_size is already set in detection model, ignore")
             else:
                 self.input_size = input_size
+        # Anchor centers for the expected input size are built once up front
+        det_size = self.input_size or kwargs.get("det_size", None)
+        if det_size is not None:
+            for stride in self._feat_stride_fpn:
+                self.anchor_centers(det_size[1] // stride, det_size[0] // stride, stride)
+
+    def anchor_centers(self, height, width, stride):
+        key = (height, width, stride)
+        if key in self.center_cache:
+            return self.center_cache[key]
+        anchor_centers = np.stack(
+            np.mgrid[:height, :width][::-1], axis=-1
+        ).astype(np.float32)
+        anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+        if self._num_anchors > 1:
+            anchor_centers = np.repeat(anchor_centers, self._num_anchors, axis=0)
+        if len(self.center_cache) < 100:
+            self.center_cache[key] = anchor_centers
+        return anchor_centers
 
     def forward(self, img, threshold):
-        scores_list = []
-        bboxes_list = []
-        kpss_list = []
-        input_size = tuple(img.shape[0:2][::-1])
-        blob = cv2.dnn.blobFromImage(
-            img,
+        return self.forward_batch([img], threshold)[0]
+
+    def preprocess(self, imgs):
+        input_size = tuple(imgs[0].shape[0:2][::-1])
+        return cv2.dnn.blobFromImages(
+            imgs,
             1.0 / self.input_std,
             input_size,
             (self.input_mean, self.input_mean, self.input_mean),
             swapRB=True,
         )
-        net_outs = self.session.run(self.output_names, {self.input_name: blob})
 
+    def forward_batch(self, imgs, threshold):
+        with metrics.time("preprocess", model="RetinaFace"):
+            blob = self.preprocess(imgs)
         input_height = blob.shape[2]
         input_width = blob.shape[3]
+        if self.batched:
+            with metrics.time("session_run", model="RetinaFace"):
+                net_outs = self.session.run(self.output_names, {self.input_name: blob})
+            with metrics.time("postprocess", model="RetinaFace"):
+                return [
+                    self.decode([out[i] for out in net_outs], input_height, input_width, threshold)
+                    for i in range(blob.shape[0])
+                ]
+        results = []
+        for i in range(blob.shape[0]):
+            with metrics.time("session_run", model="RetinaFace"):
+                net_outs = self.session.run(self.output_names, {self.input_name: blob[i : i + 1]})
+            with metrics.time("postprocess", model="RetinaFace"):
+                results.append(self.decode(net_outs, input_height, input_width, threshold))
+        return results
+
+    def decode(self, net_outs, input_height, input_width, threshold):
+        scores_list = []
+        bboxes_list = []
+        kpss_list = []
         fmc = self.fmc
         for idx, stride in enumerate(self._feat_stride_fpn):
+            # Threshold first so only the surviving anchors are decoded
             scores = net_outs[idx]
-            bbox_preds = net_outs[idx + fmc]
-            bbox_preds = bbox_preds * stride
-            if self.use_kps:
-                kps_preds = net_outs[idx + fmc * 2] * stride
-            height = input_height // stride
-            width = input_width // stride
-            K = height * width
-            key = (height, width, stride)
-            if key in self.center_cache:
-                anchor_centers = self.center_cache[key]
-            else:
-                anchor_centers = np.stack(
-                    np.mgrid[:height, :width][::-1], axis=-1
-                ).astype(np.float32)
-
-                anchor_centers = (anchor_centers * stride).reshape((-1, 2))
-                if self._num_anchors > 1:
-                    anchor_centers = np.stack(
-                        [anchor_centers] * self._num_anchors, axis=1
-                    ).reshape((-1, 2))
-                if len(self.center_cache) < 100:
-                    self.center_cache[key] = anchor_centers
-
             pos_inds = np.where(scores >= threshold)[0]
-            bboxes = distance2bbox(anchor_centers, bbox_preds)
-            pos_scores = scores[pos_inds]
-            pos_bboxes = bboxes[pos_inds]
-            scores_list.append(pos_scores)
-            bboxes_list.append(pos_bboxes)
+            anchor_centers = self.anchor_centers(
+                input_height // stride, input_width // stride, stride
+            )[pos_inds]
+            scores_list.append(scores[pos_inds])
+            bbox_preds = net_outs[idx + fmc][pos_inds] * stride
+            bboxes_list.append(distance2bbox(anchor_centers, bbox_preds))
             if self.use_kps:
+                kps_preds = net_outs[idx + fmc * 2][pos_inds] * stride
                 kpss = distance2kps(anchor_centers, kps_preds)
-                kpss = kpss.reshape((kpss.shape[0], -1, 2))
-                pos_kpss = kpss[pos_inds]
-                kpss_list.append(pos_kpss)
+                kpss_list.append(kpss.reshape((kpss.shape[0], kpss.shape[1] // 2, 2)))
         return scores_list, bboxes_list, kpss_list
 
-    def detect(self, img, input_size=None, max_num=0, metric="default"):
-        assert input_size is not None or self.input_size is not None
-        input_size = self.input_size if input_size is None else input_size
+    def detection_size(self, img, mode=None):
+        """Detector input (width, height) for img in the given detection mode.
+
+        Dynamic-shape models get an input with the image's aspect ratio, its
+        sides rounded up to a multiple of 32, instead of a padded square.
+        "adaptive" sizes the input so that a face spanning min_face_ratio of
+        the image's longer side reaches MIN_FACE_SIZE, without going beyond
+        the accurate size or upscaling the image.
+        """
+        if self.input_size is not None:
+            # Models exported with a fixed input shape only run at that size
+            return self.input_size
+        mode = mode or self.detection_mode
+        height, width = img.shape[:2]
+        if mode == "adaptive":
+            size = MIN_FACE_SIZE / self.min_face_ratio
+            size = min(max(size, DETECTION_SIZES["fast"]), DETECTION_SIZES["accurate"])
+            size = min(size, max(height, width))
+        else:
+            size = DETECTION_SIZES[mode]
+        scale = size / max(height, width)
+        return (
+            max(32, math.ceil(width * scale / 32) * 32),
+            max(32, math.ceil(height * scale / 32) * 32),
+        )
 
+    def letterbox(self, img, input_size):
         im_ratio = float(img.shape[0]) / img.shape[1]
         model_ratio = float(input_size[1]) / input_size[0]
         if im_ratio > model_ratio:
@@ -195,9 +253,27 @@ class RetinaFace:
         resized_img = cv2.resize(img, (new_width, new_height))
         det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
         det_img[:new_height, :new_width, :] = resized_img
+        return det_img, det_scale
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        return self.detect_batch([img], input_size, max_num, metric)[0]
 
-        scores_list, bboxes_list, kpss_list = self.forward(det_img, self.det_thresh)
+    def detect_batch(self, imgs, input_size=None, max_num=0, metric="default"):
+        assert input_size is not None or self.input_size is not None
+        input_size = self.input_size if input_size is None else input_size
 
+        with metrics.time("preprocess", model="RetinaFace"):
+            det_imgs, det_scales = zip(*[self.letterbox(img, input_size) for img in imgs])
+        outs = self.forward_batch(list(det_imgs), self.det_thresh)
+        with metrics.time("postprocess", model="RetinaFace"):
+            return [
+                self.postprocess(img, det_scale, *out, max_num=max_num, metric=metric)
+                for img, det_scale, out in zip(imgs, det_scales, outs)
+            ]
+
+    def postprocess(
+        self, img, det_scale, scores_list, bboxes_list, kpss_list, max_num=0, metric="default"
+    ):
         scores = np.vstack(scores_list)
         scores_ravel = scores.ravel()
         order = scores_ravel.argsort()[::-1]
@@ -237,39 +313,18 @@ class RetinaFace:
         return det, kpss
 
     def nms(self, dets):
-        thresh = self.nms_thresh
-        x1 = dets[:, 0]
-        y1 = dets[:, 1]
-        x2 = dets[:, 2]
-        y2 = dets[:, 3]
-        scores = dets[:, 4]
-
-        areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-        order = scores.argsort()[::-1]
-
-        keep = []
-        while order.size > 0:
-            i = order[0]
-            keep.append(i)
-            xx1 = np.maximum(x1[i], x1[order[1:]])
-            yy1 = np.maximum(y1[i], y1[order[1:]])
-            xx2 = np.minimum(x2[i], x2[order[1:]])
-            yy2 = np.minimum(y2[i], y2[order[1:]])
-
-            w = np.maximum(0.0, xx2 - xx1 + 1)
-            h = np.maximum(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-            inds = np.where(ovr <= thresh)[0]
-            order = order[inds + 1]
-
-        return keep
-
-    def __call__(self, image, max_num=0):
-        bboxes, kpss = self.detect(image, input_size=(640, 640), max_num=max_num, metric="default")
-        if bboxes.shape[0] == 0:
+        if dets.shape[0] == 0:
             return []
+        # Widths and heights get the same +1 as the pixel-inclusive areas used originally
+        boxes = np.stack(
+            [dets[:, 0], dets[:, 1], dets[:, 2] - dets[:, 0] + 1, dets[:, 3] - dets[:, 1] + 1],
+            axis=1,
+        )
+        # Scores were thresholded during decoding, so every box is a candidate
+        keep = cv2.dnn.NMSBoxes(boxes, dets[:, 4], 0.0, self.nms_thresh)
+        return np.array(keep, dtype=int).reshape(-1)
+
+    def to_faces(self, bboxes, kpss):
         ret = []
         for i in range(bboxes.shape[0]):
             bbox = bboxes[i, 0:4]
@@ -281,6 +336,27 @@ class RetinaFace:
             ret.append(face)
         return ret
 
+    def batch(self, images, max_num=0, modes=None):
+        """Detect faces in each image, optionally with a detection mode per image."""
+        modes = modes or [None] * len(images)
+        sizes = [self.detection_size(image, mode) for image, mode in zip(images, modes)]
+        # Images that map to the same input size share one forward pass
+        dets = [None] * len(images)
+        for size in set(sizes):
+            indices = [i for i, s in enumerate(sizes) if s == size]
+            group = self.detect_batch(
+                [images[i] for i in indices], input_size=size, max_num=max_num, metric="default"
+            )
+            for i, det in zip(indices, group):
+                dets[i] = det
+        return [self.to_faces(bboxes, kpss) for bboxes, kpss in dets]
+
+    def warmup(self):
+        self(np.zeros((640, 640, 3), dtype=np.uint8))
+
+    def __call__(self, image, max_num=0, mode=None):
+        return self.batch([image], max_num=max_num, modes=[mode])[0]
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -290,10 +366,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "--model", type=str, default="models/det_10g.onnx", help="ONNX model path"
     )
+    parser.add_argument(
+        "--mode", type=str, default="balanced", choices=DETECTION_MODES, help="Detection mode"
+    )
     args = parser.parse_args()
 
     input_image = cv2.imread(args.image)
     if input_image is not None:
         face_detector = RetinaFace(args.model)
-        faces = face_detector(input_image)
+        faces = face_detector(input_image, mode=args.mode)
         print(faces)
@@ -0,0 +1,297 @@
+import os
+import time
+import queue
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future, TimeoutError
+import numpy as np
+from src.face import Face
+from utils.metrics import metrics
+
+
+# Result rows written after the image in each task's shared memory block
+# face:   x1, y1, x2, y2, score, 5 landmarks (x, y), gender, age
+# object: x, y, w, h, score, class id
+FACE_COLUMNS = 17
+OBJECT_COLUMNS = 6
+
+
+def pack_faces(faces, out):
+    for row, face in zip(out, faces):
+        row[0:4] = face.bbox
+        row[4] = face.det_score
+        row[5:15] = face.kps.reshape(-1) if face.kps is not None else np.nan
+        row[15] = face.gender
+        row[16] = face.age
+
+
+def unpack_faces(rows):
+    faces = []
+    for row in rows:
+        kps = None if np.isnan(row[5]) else row[5:15].reshape(5, 2)
+        face = Face(bbox=row[0:4], kps=kps, det_score=row[4])
+        face.gender = int(row[15])
+        face.age = int(row[16])
+        faces.append(face)
+    return faces
+
+
+def run_task(models, shm, kind, draw, shape, dtype, max_results, detection_mode=None):
+    # Views into shm.buf must be gone before the block can be closed
+    image = results = None
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        input_image = image.copy()
+        offset = image.nbytes
+        if kind == "face_analysis":
+            face_analysis = models.get("face_analysis")
+            faces = face_analysis.face_detection_model(input_image, mode=detection_mode)
+            faces = faces[:max_results]
+            face_analysis.age_gender_estimation_model.estimate(input_image, faces)
+            results = np.ndarray((len(faces), FACE_COLUMNS), np.float32, shm.buf, offset)
+            pack_faces(faces, results)
+            if draw:
+                image[:] = face_analysis.draw(input_image, faces)
+            return len(faces), None
+
+        object_detector = models.get("object_detection")
+        boxes, scores, class_ids = object_detector.detect(input_image)
+        boxes, scores, class_ids = boxes[:max_results], scores[:max_results], class_ids[:max_results]
+        results = np.ndarray((len(boxes), OBJECT_COLUMNS), np.float32, shm.buf, offset)
+        results[:, 0:4] = boxes
+        results[:, 4] = scores
+        results[:, 5] = class_ids
+        if draw:
+            image[:], _ = object_detector.draw(input_image, boxes, scores, class_ids)
+        return len(boxes), [object_detector.classes[class_id] for class_id in class_ids]
+    finally:
+        del image, results
+
+
+class InferenceUnavailable(RuntimeError):
+    """A task timed out or its worker process died."""
+
+
+def worker_main(task_queue, result_queue, max_results):
+    from src.model_registry import create_model_registry
+
+    models = create_model_registry()
+    pid = os.getpid()
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, kind, draw, shm_name, shape, dtype, detection_mode = task
+        # Lets the client fail this task if the process dies while running it
+        result_queue.put(("started", task_id, pid))
+        try:
+            # Gone if the client timed out and unlinked it before we got here
+            shm = shared_memory.SharedMemory(name=shm_name)
+        except FileNotFoundError as e:
+            result_queue.put(("done", task_id, (0, None, repr(e))))
+            continue
+        try:
+            count, labels = run_task(
+                models, shm, kind, draw, shape, dtype, max_results, detection_mode
+            )
+            result_queue.put(("done", task_id, (count, labels, None)))
+        except Exception as e:
+            result_queue.put(("done", task_id, (0, None, repr(e))))
+        finally:
+            shm.close()
+
+
+class InferencePool:
+    """Run the models in worker processes, moving pixels through shared memory.
+
+    For every task the client allocates one shared memory block holding the
+    input image followed by room for max_results result rows. The worker
+    reads the image from it, writes the detections (and the annotated image,
+    which has the same shape, over the input) back into it, and only the
+    task id, result count and labels travel through the queues.
+
+    Exposes the same analyze_faces/detect_objects interface as
+    InferenceScheduler, so the web app can use either.
+
+    Workers are started by the first task rather than in the constructor:
+    spawned children import the main module again, and a pool built while
+    it is imported must not try to start processes of its own there. A
+    worker that dies fails the task it was running and is replaced; a task
+    without a result after timeout seconds fails as well.
+    """
+
+    def __init__(self, num_workers=2, max_results=1024, timeout=60):
+        self.num_workers = num_workers
+        self.max_results = max_results
+        self.timeout = timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.task_queue = None
+        self.result_queue = None
+        self.workers = []
+        self.running = {}
+        self.restarts = 0
+        self.task_ids = itertools.count()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.closed = False
+
+    def start_worker(self):
+        worker = self.context.Process(
+            target=worker_main,
+            args=(self.task_queue, self.result_queue, self.max_results),
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def start(self):
+        with self.lock:
+            if self.listener is not None:
+                return
+            self.task_queue = self.context.Queue()
+            self.result_queue = self.context.Queue()
+            self.workers = [self.start_worker() for _ in range(self.num_workers)]
+            self.listener = threading.Thread(target=self.listen, name="inference-pool", daemon=True)
+            self.listener.start()
+
+    def fail(self, task_id, message):
+        with self.lock:
+            future = self.pending.pop(task_id, None)
+        if future is not None:
+            future.set_exception(InferenceUnavailable(message))
+
+    def check_workers(self):
+        if self.closed:
+            return
+        dead = [i for i, worker in enumerate(self.workers) if not worker.is_alive()]
+        if not dead:
+            return
+        if len(dead) == len(self.workers):
+            # Nothing is left to run the queued tasks either
+            with self.lock:
+                task_ids = list(self.pending)
+        else:
+            task_ids = [self.running.get(self.workers[i].pid) for i in dead]
+        for i in dead:
+            self.running.pop(self.workers[i].pid, None)
+        for task_id in task_ids:
+            if task_id is not None:
+                self.fail(task_id, "Inference worker process died")
+        for i in dead:
+            self.workers[i] = self.start_worker()
+            self.restarts += 1
+
+    def listen(self):
+        last_check = time.monotonic()
+        while True:
+            if time.monotonic() - last_check > 0.5:
+                self.check_workers()
+                last_check = time.monotonic()
+            try:
+                message, task_id, value = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if message == "started":
+                self.running[value] = task_id
+                continue
+            self.running = {pid: running for pid, running in self.running.items() if running != task_id}
+            count, labels, error = value
+            with self.lock:
+                # The task may already have failed with a timeout
+                future = self.pending.pop(task_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result((count, labels))
+
+    def run(self, kind, input_image, draw, columns, detection_mode=None):
+        self.start()
+        input_image = np.ascontiguousarray(input_image)
+        size = input_image.nbytes + self.max_results * columns * 4
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            return self.run_in(shm, kind, input_image, draw, columns, detection_mode)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def run_in(self, shm, kind, input_image, draw, columns, detection_mode=None):
+        image = np.ndarray(input_image.shape, input_image.dtype, shm.buf)
+        try:
+            image[:] = input_image
+            future = Future()
+            task_id = next(self.task_ids)
+            with self.lock:
+                self.pending[task_id] = future
+            self.task_queue.put(
+                (
+                    task_id,
+                    kind,
+                    draw,
+                    shm.name,
+                    input_image.shape,
+                    input_image.dtype.str,
+                    detection_mode,
+                )
+            )
+            try:
+                count, labels = future.result(self.timeout)
+            except TimeoutError:
+                # A worker still running the task keeps its own mapping of
+                # the block, so unlinking it below is safe
+                with self.lock:
+                    self.pending.pop(task_id, None)
+                raise InferenceUnavailable(f"Inference took longer than {self.timeout} seconds")
+            results = np.ndarray((count, columns), np.float32, shm.buf, input_image.nbytes).copy()
+            output_image = image.copy() if draw else None
+            return results, labels, output_image
+        finally:
+            del image
+
+    def analyze_faces(self, input_image, draw=False, detection_mode=None):
+        # Model stages run in the workers; only the whole round trip is timed here
+        with metrics.time("pool", model="face_analysis"):
+            results, _, output_image = self.run(
+                "face_analysis", input_image, draw, FACE_COLUMNS, detection_mode
+            )
+        metrics.inc("app_faces_detected_total", len(results))
+        return unpack_faces(results), output_image
+
+    def detect_objects(self, input_image, draw=False):
+        with metrics.time("pool", model="object_detection"):
+            results, labels, output_image = self.run(
+                "object_detection", input_image, draw, OBJECT_COLUMNS
+            )
+        for label in labels:
+            metrics.inc("app_objects_detected_total", label=label)
+        boxes = results[:, 0:4].astype(int)
+        scores = results[:, 4]
+        class_ids = results[:, 5].astype(int)
+        return boxes, scores, class_ids, labels, output_image
+
+    def stats(self):
+        return {
+            "workers": self.num_workers,
+            "started": self.listener is not None,
+            "alive": sum(worker.is_alive() for worker in self.workers),
+            "restarts": self.restarts,
+            "pending": len(self.pending),
+        }
+
+    def close(self, timeout=5):
+        """Stop the workers, terminating those still busy after timeout seconds."""
+        if self.listener is None:
+            return
+        # Workers exiting from here on are not replaced
+        self.closed = True
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from queue import Queue, Empty
+from utils.metrics import metrics
+from utils.profiling import profiling
+
+
+class MicroBatcher:
+    """Queue requests for one model and run them in micro-batches.
+
+    A single worker thread owns the model: it blocks for the first request,
+    then keeps collecting until either max_batch_size requests are queued or
+    max_wait_time seconds have passed, and hands the whole group to batch_fn.
+    batch_fn receives a list of request arguments and must return one result
+    per request, in order.
+
+    Requests submitted from a thread being profiled run right away on that
+    thread, in a batch of their own, so that the model shows up in the
+    profile instead of a wait on the batcher.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_time=0.005):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.queue = Queue()
+        self.batch_sizes = Counter()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name=f"{name}-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        if profiling():
+            future.set_running_or_notify_cancel()
+            self.execute([(item, future)])
+        else:
+            self.queue.put((item, future))
+        return future
+
+    def collect(self):
+        requests = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait_time
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(self.queue.get(timeout=timeout))
+            except Empty:
+                break
+        return requests
+
+    def run(self):
+        while True:
+            requests = self.collect()
+            requests = [
+                (item, future)
+                for item, future in requests
+                if future.set_running_or_notify_cancel()
+            ]
+            if requests:
+                self.execute(requests)
+
+    def execute(self, requests):
+        with self.lock:
+            self.batch_sizes[len(requests)] += 1
+        try:
+            results = list(self.batch_fn([item for item, _ in requests]))
+            if len(results) != len(requests):
+                # Pairing them up would leave some requests waiting forever
+                raise RuntimeError(
+                    f"{self.name} returned {len(results)} results for {len(requests)} requests"
+                )
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(requests, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_time": self.max_wait_time,
+            "batch_sizes": batch_sizes,
+        }
+
+
+class InferenceScheduler:
+    """Micro-batch the models held in a ModelRegistry.
+
+    The registry must provide "face_analysis" (a FaceAnalysis) and
+    "object_detection" (a YOLOv8). Models are looked up when their first
+    batch runs, so a model nobody uses is never loaded.
+    """
+
+    def __init__(self, models, max_batch_size=8, max_wait_time=0.005):
+        self.models = models
+        self.face_detection_batcher = MicroBatcher(
+            "RetinaFace",
+            lambda requests: self.face_analysis_model.face_detection_model.batch(
+                [image for image, _ in requests], modes=[mode for _, mode in requests]
+            ),
+            max_batch_size,
+            max_wait_time,
+        )
+        self.age_gender_estimation_batcher = MicroBatcher(
+            "AgeGenderEstimator",
+            lambda requests: self.face_analysis_model.age_gender_estimation_model.batch(requests),
+            max_batch_size,
+            max_wait_time,
+        )
+        self.object_detection_batcher = MicroBatcher(
+            "YOLOv8",
+            lambda images: self.object_detector.batch(images),
+            max_batch_size,
+            max_wait_time,
+        )
+
+    @property
+    def face_analysis_model(self):
+        return self.models.get("face_analysis")
+
+    @property
+    def object_detector(self):
+        return self.models.get("object_detection")
+
+    def analyze_faces(self, input_image, draw=False, detection_mode=None):
+        """Return the detected faces, with gender and age set, and the annotated image if draw."""
+        # Batch stages cover the wait in the queue and the batch this request ran in
+        with metrics.time("batch", model="RetinaFace"):
+            faces = self.face_detection_batcher.submit((input_image, detection_mode)).result()
+        with metrics.time("batch", model="AgeGenderEstimator"):
+            self.age_gender_estimation_batcher.submit((input_image, faces)).result()
+        metrics.inc("app_faces_detected_total", len(faces))
+        output_image = None
+        if draw:
+            with metrics.time("draw"):
+                output_image = self.face_analysis_model.draw(input_image, faces)
+        return faces, output_image
+
+    def detect_objects(self, input_image, draw=False):
+        """Return boxes, scores, class ids, labels and the annotated image if draw."""
+        object_detector = self.object_detector
+        with metrics.time("batch", model="YOLOv8"):
+            boxes, scores, class_ids = self.object_detection_batcher.submit(input_image).result()
+        labels = [object_detector.classes[class_id] for class_id in class_ids]
+        for label in labels:
+            metrics.inc("app_objects_detected_total", label=label)
+        output_image = None
+        if draw:
+            with metrics.time("draw"):
+                output_image, _ = object_detector.draw(input_image, boxes, scores, class_ids)
+        return boxes, scores, class_ids, labels, output_image
+
+    def stats(self):
+        return {
+            batcher.name: batcher.stats()
+            for batcher in (
+                self.face_detection_batcher,
+                self.age_gender_estimation_batcher,
+                self.object_detection_batcher,
+            )
+        }
@@ -0,0 +1,194 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class LiveStream:
+    """Run detection on the newest frame of a camera stream, dropping the rest.
+
+    Frames are handed in as encoded bytes. The stream keeps only the newest
+    frame that is not yet being processed: a frame arriving while another
+    one waits replaces it, and a frame that waited longer than max_latency
+    is skipped. Dropped frames are never decoded, so a slow server falls
+    behind by at most one frame instead of building up a queue.
+
+    A worker thread passes each frame to process(frame_bytes) and publishes
+    the result, which readers receive through results().
+    """
+
+    def __init__(self, stream_id, kind, process, max_latency=1.0, window=5.0):
+        self.id = stream_id
+        self.kind = kind
+        self.process = process
+        self.max_latency = max_latency
+        self.window = window
+        self.frame_ids = itertools.count()
+        self.pending = None
+        self.latest = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.last_active = time.monotonic()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.completion_times = deque()
+        self.latencies = deque(maxlen=100)
+        self.thread = threading.Thread(target=self.run, name=f"live-stream-{stream_id}", daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        with self.condition:
+            frame_id = next(self.frame_ids)
+            self.received += 1
+            self.last_active = time.monotonic()
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (frame_id, frame, time.monotonic())
+            self.condition.notify_all()
+        return frame_id
+
+    def next_frame(self):
+        with self.condition:
+            while self.pending is None and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            frame = self.pending
+            self.pending = None
+            return frame
+
+    def run(self):
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            frame_id, data, received_at = frame
+            if time.monotonic() - received_at > self.max_latency:
+                with self.condition:
+                    self.dropped += 1
+                continue
+            try:
+                result = self.process(data)
+            except Exception as e:
+                result = {"error": str(e)}
+                with self.condition:
+                    self.failed += 1
+            now = time.monotonic()
+            with self.condition:
+                self.processed += 1
+                self.latencies.append(now - received_at)
+                self.completion_times.append(now)
+                while self.completion_times[0] < now - self.window:
+                    self.completion_times.popleft()
+                self.latest = dict(
+                    result,
+                    frame=frame_id,
+                    latency_ms=round((now - received_at) * 1000, 1),
+                    fps=round(self.fps(now), 1),
+                )
+                self.condition.notify_all()
+
+    def fps(self, now):
+        # Frames completed over the last window seconds, or since the first one
+        if not self.completion_times:
+            return 0.0
+        span = min(self.window, now - self.completion_times[0])
+        if span <= 0:
+            return 0.0
+        return (len(self.completion_times) - 1) / span
+
+    def results(self, timeout=15.0):
+        """Yield each new result; None after timeout seconds without one, to keep the connection alive."""
+        last_frame = -1
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closed or (self.latest is not None and self.latest["frame"] > last_frame),
+                    timeout,
+                )
+                if self.closed:
+                    return
+                self.last_active = time.monotonic()
+                if self.latest is None or self.latest["frame"] <= last_frame:
+                    result = None
+                else:
+                    result = self.latest
+                    last_frame = result["frame"]
+            yield result
+
+    def stats(self):
+        with self.condition:
+            latencies = sorted(self.latencies)
+            now = time.monotonic()
+            return {
+                "kind": self.kind,
+                "received": self.received,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "fps": round(self.fps(now), 2),
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                    "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+                },
+                "idle_seconds": round(now - self.last_active, 1),
+            }
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class LiveStreams:
+    """Open live streams, closing those idle for longer than idle_timeout."""
+
+    def __init__(self, max_streams=16, idle_timeout=30.0, max_latency=1.0):
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.max_latency = max_latency
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                stream for stream in self.streams.values()
+                if now - stream.last_active > self.idle_timeout
+            ]
+            for stream in expired:
+                del self.streams[stream.id]
+        for stream in expired:
+            stream.close()
+
+    def open(self, kind, process):
+        """Return a new stream, or None when max_streams are already open."""
+        self.expire()
+        with self.lock:
+            if len(self.streams) >= self.max_streams:
+                return None
+            stream = LiveStream(uuid.uuid4().hex, kind, process, self.max_latency)
+            self.streams[stream.id] = stream
+        return stream
+
+    def get(self, stream_id):
+        self.expire()
+        with self.lock:
+            return self.streams.get(stream_id)
+
+    def close(self, stream_id):
+        with self.lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.close()
+        return stream is not None
+
+    def stats(self):
+        self.expire()
+        with self.lock:
+            streams = list(self.streams.values())
+        return {stream.id: stream.stats() for stream in streams}
@@ -0,0 +1,95 @@
+import threading
+import time
+import config
+
+
+class ModelRegistry:
+    """Build models on first use instead of at import time.
+
+    Factories are registered by name and run at most once, under a per-model
+    lock, by whichever thread asks for the model first. Factories should
+    import their heavy dependencies themselves, so that importing the web
+    app does not pull in OpenCV or ONNX Runtime.
+    """
+
+    def __init__(self):
+        self.factories = {}
+        self.models = {}
+        self.load_times = {}
+        self.locks = {}
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+        self.locks[name] = threading.Lock()
+
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self.locks[name]:
+            model = self.models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = self.factories[name]()
+                self.load_times[name] = time.perf_counter() - start
+                self.models[name] = model
+        return model
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+
+    def stats(self):
+        return {
+            name: {
+                "loaded": name in self.models,
+                "load_time": self.load_times.get(name),
+            }
+            for name in self.factories
+        }
+
+
+def load_face_analysis():
+    from src.face_analysis import FaceAnalysis
+
+    face_analysis = FaceAnalysis(
+        config.face_detection_onnx_model_path,
+        config.age_gender_estimation_onnx_model_path,
+        config.age_gender_estimation_batch_size,
+    )
+    face_analysis.face_detection_model.prepare(
+        0,
+        det_thresh=config.face_detection_threshold,
+        nms_thresh=config.face_detection_nms_threshold,
+        detection_mode=config.face_detection_mode,
+        min_face_ratio=config.face_detection_min_face_ratio,
+    )
+    if config.onnx_warmup:
+        face_analysis.warmup()
+    return face_analysis
+
+
+def load_object_detection():
+    from src.object_detection import YOLOv8
+
+    object_detector = YOLOv8(
+        config.object_detection_onnx_model_path,
+        config.object_detection_confidence_threshold,
+        config.object_detection_iou_threshold,
+        config.object_detection_class_aware_nms,
+        config.object_detection_mode,
+        config.object_detection_tile_size,
+        config.object_detection_tile_overlap,
+        config.object_detection_tile_workers,
+        config.object_detection_max_batch_size,
+    )
+    if config.onnx_warmup:
+        object_detector.warmup()
+    return object_detector
+
+
+def create_model_registry():
+    models = ModelRegistry()
+    models.register("face_analysis", load_face_analysis)
+    models.register("object_detection", load_object_detection)
+    return models
@@ -1,21 +1,67 @@
+import sys
+import json
 import argparse
+import math
 import yaml
 import cv2
 import numpy as np
-import onnxruntime as ort
+from concurrent.futures import ThreadPoolExecutor
+from src.onnx_session import create_session
+from utils.metrics import metrics
+
+
+# "resize" stretches the image to the model input, "letterbox" scales it
+# keeping its aspect ratio and pads the rest, "tiled" also runs overlapping
+# tile_size windows so that small objects in large images keep their size
+DETECTION_MODES = ("resize", "letterbox", "tiled")
+# Letterbox padding, the gray YOLOv8 was trained with
+PAD_VALUE = 114
+
+
+def tile_starts(length, tile_size, stride):
+    """Offsets of tiles covering length, the last one ending at the edge."""
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
 
 
 class YOLOv8:
-    def __init__(self, onnx_model_path, confidence_threshold=0.5, iou_threshold=0.5):
+    def __init__(
+        self,
+        onnx_model_path,
+        confidence_threshold=0.5,
+        iou_threshold=0.5,
+        class_aware_nms=False,
+        mode="resize",
+        tile_size=640,
+        tile_overlap=0.2,
+        tile_workers=0,
+        max_batch_size=16,
+    ):
+        assert mode in DETECTION_MODES, mode
+        assert 0 <= tile_overlap < 1, tile_overlap
         self.confidence_threshold = confidence_threshold
         self.iou_threshold = iou_threshold
+        self.class_aware_nms = class_aware_nms
+        self.mode = mode
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_workers = max(1, tile_workers)
+        self.max_batch_size = max_batch_size
         with open("coco8.yaml") as stream:
             self.classes = yaml.safe_load(stream)["names"]
-        self.session = ort.InferenceSession(
-            onnx_model_path, providers=["CPUExecutionProvider"]
-        )
+        self.session = create_session(onnx_model_path)
         self.model_inputs = self.session.get_inputs()
-        self.input_width, self.input_height = self.model_inputs[0].shape[2:4]
+        self.input_height, self.input_width = self.model_inputs[0].shape[2:4]
+        # Models exported without a dynamic batch axis only accept one image per run
+        self.batched = not isinstance(self.model_inputs[0].shape[0], int)
+        # With tile_workers the windows of a batch are split into chunks run
+        # on that many threads; otherwise they go through one session.run
+        self.executor = None
+        if self.tile_workers > 1:
+            self.executor = ThreadPoolExecutor(self.tile_workers, thread_name_prefix="yolov8")
 
     def draw_detections(self, image, box, score, class_id):
         x1, y1, w, h = box
@@ -45,69 +91,178 @@ class YOLOv8:
             cv2.LINE_AA,
         )
 
+    def geometry(self, image_shape):
+        """Size the image is resized to and its (x, y) offset in the model input."""
+        if self.mode == "resize":
+            return self.input_width, self.input_height, 0, 0
+        height, width = image_shape[:2]
+        ratio = min(self.input_width / width, self.input_height / height)
+        new_width = max(1, round(width * ratio))
+        new_height = max(1, round(height * ratio))
+        return (
+            new_width,
+            new_height,
+            (self.input_width - new_width) // 2,
+            (self.input_height - new_height) // 2,
+        )
+
+    def scale(self, image_shape, x=0, y=0):
+        """(x_scale, y_scale, x_offset, y_offset) mapping model input coordinates
+        back to the image, for a window whose top left corner is at (x, y)."""
+        height, width = image_shape[:2]
+        new_width, new_height, x_pad, y_pad = self.geometry(image_shape)
+        x_scale = width / new_width
+        y_scale = height / new_height
+        return x_scale, y_scale, x - x_pad * x_scale, y - y_pad * y_scale
+
+    def resize(self, image):
+        new_width, new_height, x_pad, y_pad = self.geometry(image.shape)
+        resized = cv2.resize(image, (new_width, new_height))
+        if (new_width, new_height) == (self.input_width, self.input_height):
+            return resized
+        padded = np.full((self.input_height, self.input_width, 3), PAD_VALUE, dtype=np.uint8)
+        padded[y_pad : y_pad + new_height, x_pad : x_pad + new_width] = resized
+        return padded
+
+    def windows(self, image):
+        """(window, x, y) for the parts of image the model runs on.
+
+        Tiled mode covers images larger than a tile with overlapping tiles
+        and keeps the whole image as a first window, which finds the objects
+        too large for a single tile.
+        """
+        height, width = image.shape[:2]
+        if self.mode != "tiled" or max(height, width) <= self.tile_size:
+            return [(image, 0, 0)]
+        stride = max(1, int(self.tile_size * (1 - self.tile_overlap)))
+        return [(image, 0, 0)] + [
+            (image[y : y + self.tile_size, x : x + self.tile_size], x, y)
+            for y in tile_starts(height, self.tile_size, stride)
+            for x in tile_starts(width, self.tile_size, stride)
+        ]
+
+    def blob(self, images):
+        """Model input for a list of BGR images of the model's input size."""
+        # Scales to [0, 1], swaps BGR to RGB and moves channels first in one pass
+        return cv2.dnn.blobFromImages(images, 1 / 255.0, swapRB=True)
+
     def preprocess(self, image):
-        self.image_height, self.image_width = image.shape[:2]
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image = cv2.resize(image, (self.input_width, self.input_height))
-        image_data = np.array(image, dtype=np.float32) / 255.0
-        image_data = np.transpose(image_data, (2, 0, 1))  # Channel first
-        image_data = np.expand_dims(image_data, axis=0)
-        return image_data
+        """Model input for image as a single window, without tiling."""
+        return self.blob([self.resize(image)])
 
-    def postprocess(self, input_image, output):
-        outputs = np.transpose(np.squeeze(output[0]))
-        rows = outputs.shape[0]
-        boxes = []
-        scores = []
-        class_ids = []
-        x_factor = self.image_width / self.input_width
-        y_factor = self.image_height / self.input_height
-
-        for i in range(rows):
-            classes_scores = outputs[i][4:]
-            max_score = np.amax(classes_scores)
-            if max_score >= self.confidence_threshold:
-                class_id = np.argmax(classes_scores)
-                x, y, w, h = outputs[i][0], outputs[i][1], outputs[i][2], outputs[i][3]
-                left = int((x - w / 2) * x_factor)
-                top = int((y - h / 2) * y_factor)
-                width = int(w * x_factor)
-                height = int(h * y_factor)
-                class_ids.append(class_id)
-                scores.append(max_score)
-                boxes.append([left, top, width, height])
-
-        indices = cv2.dnn.NMSBoxes(
-            boxes, scores, self.confidence_threshold, self.iou_threshold
-        )
+    def decode(self, output, scale):
+        x_scale, y_scale, x_offset, y_offset = scale
+        outputs = np.transpose(np.squeeze(output[0], axis=0))
+        classes_scores = outputs[:, 4:]
+        max_scores = np.amax(classes_scores, axis=1)
+        mask = max_scores >= self.confidence_threshold
+        outputs = outputs[mask]
+        scores = max_scores[mask]
+        class_ids = np.argmax(classes_scores[mask], axis=1)
+
+        x, y, w, h = outputs[:, 0], outputs[:, 1], outputs[:, 2], outputs[:, 3]
+        boxes = np.stack(
+            [
+                (x - w / 2) * x_scale + x_offset,
+                (y - h / 2) * y_scale + y_offset,
+                w * x_scale,
+                h * y_scale,
+            ],
+            axis=-1,
+        ).astype(int)
+        return boxes, scores, class_ids
+
+    def nms(self, boxes, scores, class_ids):
+        if len(boxes) == 0:
+            return np.empty((0,), dtype=int)
+        if self.class_aware_nms:
+            indices = cv2.dnn.NMSBoxesBatched(
+                boxes, scores, class_ids, self.confidence_threshold, self.iou_threshold
+            )
+        else:
+            indices = cv2.dnn.NMSBoxes(
+                boxes, scores, self.confidence_threshold, self.iou_threshold
+            )
+        return np.array(indices, dtype=int).reshape(-1)
+
+    def detections(self, outputs, windows):
+        """Detections in image coordinates from the outputs for an image's windows.
+
+        Boxes from all windows go through one NMS pass, which also removes
+        the duplicates found by overlapping tiles.
+        """
+        decoded = [
+            self.decode([outputs[i : i + 1]], self.scale(window.shape, x, y))
+            for i, (window, x, y) in enumerate(windows)
+        ]
+        boxes, scores, class_ids = (np.concatenate(parts) for parts in zip(*decoded))
+        indices = self.nms(boxes, scores, class_ids)
+        return boxes[indices], scores[indices], class_ids[indices]
 
-        output_boxes = np.array(boxes)[indices]
-        output_scores = np.array(scores)[indices]
-        output_class_ids = np.array(class_ids)[indices]
-        output_labels = []
-        for output_class_id in output_class_ids:
-            output_labels.append(self.classes[output_class_id])
+    def draw(self, input_image, boxes, scores, class_ids):
+        output_labels = [self.classes[class_id] for class_id in class_ids]
         output_image = input_image.copy()
-        for i in indices:
-            box = boxes[i]
-            score = scores[i]
-            class_id = class_ids[i]
+        for box, score, class_id in zip(boxes.tolist(), scores, class_ids.tolist()):
             self.draw_detections(output_image, box, score, class_id)
 
         output_image = cv2.cvtColor(output_image, cv2.COLOR_BGR2RGB)
         return output_image, output_labels
 
+    def postprocess(self, input_image, output):
+        boxes, scores, class_ids = self.detections(output[0], [(input_image, 0, 0)])
+        return self.draw(input_image, boxes, scores, class_ids)
+
+    def forward(self, image_data):
+        input_name = self.model_inputs[0].name
+        if self.batched:
+            return self.session.run(None, {input_name: image_data})[0]
+        outputs = [
+            self.session.run(None, {input_name: image_data[i : i + 1]})[0]
+            for i in range(image_data.shape[0])
+        ]
+        return np.concatenate(outputs)
+
+    def run(self, chunks):
+        if self.executor is None or len(chunks) == 1:
+            return np.concatenate([self.forward(chunk) for chunk in chunks])
+        return np.concatenate(list(self.executor.map(self.forward, chunks)))
+
+    def batch(self, input_images):
+        with metrics.time("preprocess", model="YOLOv8"):
+            windows = [self.windows(image) for image in input_images]
+            inputs = [self.resize(window) for image_windows in windows for window, _, _ in image_windows]
+            # Chunks bound the memory of one session.run and spread over the tile workers
+            chunk_size = min(self.max_batch_size, math.ceil(len(inputs) / self.tile_workers))
+            chunks = [self.blob(inputs[i : i + chunk_size]) for i in range(0, len(inputs), chunk_size)]
+        with metrics.time("session_run", model="YOLOv8"):
+            outputs = self.run(chunks)
+        with metrics.time("postprocess", model="YOLOv8"):
+            results = []
+            start = 0
+            for image_windows in windows:
+                results.append(self.detections(outputs[start : start + len(image_windows)], image_windows))
+                start += len(image_windows)
+            return results
+
+    def detect(self, input_image):
+        return self.batch([input_image])[0]
+
+    def warmup(self):
+        self(np.zeros((self.input_height, self.input_width, 3), dtype=np.uint8))
+
     def __call__(self, input_image):
-        image_data = self.preprocess(input_image)
-        outputs = self.session.run(None, {self.model_inputs[0].name: image_data})
-        output_image, output_labels = self.postprocess(input_image, outputs)
-        return output_image, output_labels
+        boxes, scores, class_ids = self.detect(input_image)
+        return self.draw(input_image, boxes, scores, class_ids)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--image", type=str, required=True ,help="Input image path",
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
+        "--image", type=str, help="Input image path",
+    )
+    inputs.add_argument(
+        "--dir", type=str, help="Detect objects in every image below this directory and write one JSON line per image",
     )
     parser.add_argument(
         "--model", type=str, default="models/yolov8n.onnx", help="ONNX model path"
@@ -118,14 +273,64 @@ if __name__ == "__main__":
     parser.add_argument(
         "--iou-threshold", type=float, default=0.5, help="NMS IoU threshold"
     )
+    parser.add_argument(
+        "--class-aware-nms", action="store_true", help="Run NMS separately per class"
+    )
+    parser.add_argument(
+        "--mode", type=str, default="resize", choices=DETECTION_MODES, help="Inference mode"
+    )
+    parser.add_argument(
+        "--tile-size", type=int, default=640, help="Tile size in pixels in tiled mode"
+    )
+    parser.add_argument(
+        "--tile-overlap", type=float, default=0.2, help="Fraction of a tile shared with its neighbours"
+    )
+    parser.add_argument(
+        "--tile-workers", type=int, default=0, help="Threads running the tiles of a batch, 0 runs them as one batch"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="Images per batch in --dir mode"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Write the JSON lines here instead of stdout"
+    )
     args = parser.parse_args()
 
-    object_detector = YOLOv8(args.model, args.conf_threshold, args.iou_threshold)
-    input_image = cv2.imread(args.image)
-    output_image, output_labels = object_detector(input_image)
+    object_detector = YOLOv8(
+        args.model,
+        args.conf_threshold,
+        args.iou_threshold,
+        args.class_aware_nms,
+        args.mode,
+        args.tile_size,
+        args.tile_overlap,
+        args.tile_workers,
+    )
+    if args.dir:
+        from src.bulk_analysis import analyze_all, directory_entries, object_analyzer
+        from src.inference_scheduler import InferenceScheduler
+        from src.model_registry import ModelRegistry
+        from utils.image import decode_image
+        import config
+
+        models = ModelRegistry()
+        models.register("object_detection", lambda: object_detector)
+        scheduler = InferenceScheduler(models, args.batch_size)
+        analyze = object_analyzer(
+            scheduler,
+            lambda stream: decode_image(stream, config.decode_min_size, config.max_image_pixels),
+        )
+        output = open(args.output, "w") if args.output else sys.stdout
+        for result in analyze_all(directory_entries(args.dir), analyze, workers=2 * args.batch_size):
+            output.write(json.dumps(result) + "\n")
+        if args.output:
+            output.close()
+    else:
+        input_image = cv2.imread(args.image)
+        output_image, output_labels = object_detector(input_image)
 
-    print(output_labels)
+        print(output_labels)
 
-    cv2.namedWindow("Output", cv2.WINDOW_NORMAL)
-    cv2.imshow("Output", output_image)
-    cv2.waitKey(0)
+        cv2.namedWindow("Output", cv2.WINDOW_NORMAL)
+        cv2.imshow("Output", output_image)
+        cv2.waitKey(0)
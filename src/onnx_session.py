@@ -0,0 +1,94 @@
+import os
+import onnxruntime
+import config
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def thread_budget():
+    """Split the machine's cores between the processes that run models."""
+    if config.onnx_intra_op_num_threads > 0:
+        return config.onnx_intra_op_num_threads
+    processes = max(1, config.web_concurrency)
+    if config.inference_backend == "process":
+        # Every web process has its own pool of workers running the models
+        processes *= max(1, config.inference_pool_workers)
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
+def saved_optimization_level():
+    # Models saved at "all" contain layout transformations for this machine's
+    # CPU, so the cache stops at "extended" and "all" is applied at load time
+    if config.onnx_graph_optimization_level == "all":
+        return "extended"
+    return config.onnx_graph_optimization_level
+
+
+def optimized_model_path(model_path, providers):
+    stat = os.stat(model_path)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    # Source size and mtime are part of the name so a replaced model is
+    # re-optimized, the runtime version and providers so that a cache on a
+    # shared volume or from before an upgrade is never loaded by the wrong runtime
+    runtime = "-".join([onnxruntime.__version__] + [provider.replace("ExecutionProvider", "") for provider in providers])
+    return os.path.join(
+        config.onnx_optimized_model_dir,
+        f"{name}.{saved_optimization_level()}.{runtime}.{stat.st_size}.{int(stat.st_mtime)}.onnx",
+    )
+
+
+def create_session(model_path, providers=("CPUExecutionProvider",), log_severity_level=None):
+    options = onnxruntime.SessionOptions()
+    if log_severity_level is not None:
+        options.log_severity_level = log_severity_level
+    options.execution_mode = EXECUTION_MODES[config.onnx_execution_mode]
+    options.intra_op_num_threads = thread_budget()
+    options.inter_op_num_threads = config.onnx_inter_op_num_threads
+    options.enable_cpu_mem_arena = config.onnx_enable_cpu_mem_arena
+    if not config.onnx_allow_spinning:
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+
+    if not config.onnx_optimized_model_dir:
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+            config.onnx_graph_optimization_level
+        ]
+        return onnxruntime.InferenceSession(model_path, options, providers=list(providers))
+
+    cached_path = optimized_model_path(model_path, providers)
+    if not os.path.exists(cached_path):
+        # Several worker processes may start at once, so each writes its own
+        # file and the finished one is moved into place atomically
+        os.makedirs(config.onnx_optimized_model_dir, exist_ok=True)
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        save_options = onnxruntime.SessionOptions()
+        save_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[saved_optimization_level()]
+        save_options.optimized_model_filepath = tmp_path
+        if log_severity_level is not None:
+            save_options.log_severity_level = log_severity_level
+        onnxruntime.InferenceSession(model_path, save_options, providers=list(providers))
+        if not os.path.exists(tmp_path):
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+                config.onnx_graph_optimization_level
+            ]
+            return onnxruntime.InferenceSession(model_path, options, providers=list(providers))
+        os.replace(tmp_path, cached_path)
+
+    # The cached model already has the saved optimizations; only what lies
+    # beyond them (the hardware specific "all" passes) still runs
+    if config.onnx_graph_optimization_level == "all":
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["all"]
+    else:
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+    return onnxruntime.InferenceSession(cached_path, options, providers=list(providers))
@@ -0,0 +1,161 @@
+"""Produce INT8 siblings of the FP32 models referenced in config.py.
+
+Static quantization calibrates activation ranges on a local image set and
+is the better fit for these convolutional models; dynamic quantization
+needs no images. Needs the `onnx` package in addition to the app's
+requirements.
+
+    python -m src.quantize --calibration-dir uploads
+    python -m src.quantize --models object_detection --mode dynamic
+"""
+import os
+import argparse
+import tempfile
+import onnx
+from onnx import version_converter
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quant_pre_process,
+    quantize_dynamic,
+    quantize_static,
+)
+from src.face_detection import RetinaFace
+from src.age_gender_estimation import AgeGenderEstimator
+from src.object_detection import YOLOv8
+from utils.image import decode_image
+import config
+
+
+MODELS = {
+    "face_detection": config.face_detection_fp32_onnx_model_path,
+    "age_gender_estimation": config.age_gender_estimation_fp32_onnx_model_path,
+    "object_detection": config.object_detection_fp32_onnx_model_path,
+}
+
+
+def load_images(directory, max_images):
+    paths = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.rsplit(".", 1)[-1].lower() in config.ALLOWED_EXTENSIONS
+    )[:max_images]
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            image, _ = decode_image(f, config.decode_min_size, config.max_image_pixels)
+        images.append(image)
+    return images
+
+
+def face_detection_inputs(images):
+    face_detector = RetinaFace(config.face_detection_fp32_onnx_model_path)
+    for image in images:
+        det_img, _ = face_detector.letterbox(image, (640, 640))
+        yield {face_detector.input_name: face_detector.preprocess([det_img])}
+
+
+def age_gender_estimation_inputs(images):
+    # Calibrate on real face crops when the FP32 detector is available
+    estimator = AgeGenderEstimator(config.age_gender_estimation_fp32_onnx_model_path)
+    face_detector = None
+    if os.path.exists(config.face_detection_fp32_onnx_model_path):
+        face_detector = RetinaFace(config.face_detection_fp32_onnx_model_path)
+        face_detector.prepare(0, det_thresh=config.face_detection_threshold)
+    for image in images:
+        faces = face_detector(image, max_num=8) if face_detector is not None else []
+        crops = [estimator.crop(image, face) for face in faces]
+        if not crops:
+            crops = [image]
+        for crop in crops:
+            yield {estimator.input_name: estimator.preprocess([crop])}
+
+
+def object_detection_inputs(images):
+    object_detector = YOLOv8(config.object_detection_fp32_onnx_model_path)
+    for image in images:
+        yield {object_detector.model_inputs[0].name: object_detector.preprocess(image)}
+
+
+CALIBRATION_INPUTS = {
+    "face_detection": face_detection_inputs,
+    "age_gender_estimation": age_gender_estimation_inputs,
+    "object_detection": object_detection_inputs,
+}
+
+
+class ImageCalibrationDataReader(CalibrationDataReader):
+    def __init__(self, inputs):
+        self.inputs = iter(inputs)
+
+    def get_next(self):
+        return next(self.inputs, None)
+
+
+def quantize(name, mode, images=None, per_channel=True):
+    model_path = MODELS[name]
+    output_path = config.model_path(model_path, "int8")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference and graph cleanup give the quantizer more to work with
+        preprocessed_path = os.path.join(tmp_dir, "preprocessed.onnx")
+        try:
+            quant_pre_process(model_path, preprocessed_path, skip_symbolic_shape=True)
+        except Exception as e:
+            print(f"{name}: skipping pre-processing ({e})")
+            preprocessed_path = model_path
+
+        # Per-channel quantization needs the axis attribute of opset 13 QDQ nodes
+        model = onnx.load(preprocessed_path)
+        opset = next(o.version for o in model.opset_import if o.domain in ("", "ai.onnx"))
+        if per_channel and opset < 13:
+            upgraded_path = os.path.join(tmp_dir, "upgraded.onnx")
+            onnx.save(version_converter.convert_version(model, 13), upgraded_path)
+            preprocessed_path = upgraded_path
+
+        if mode == "dynamic":
+            quantize_dynamic(
+                preprocessed_path,
+                output_path,
+                weight_type=QuantType.QUInt8,
+                per_channel=per_channel,
+            )
+        else:
+            quantize_static(
+                preprocessed_path,
+                output_path,
+                ImageCalibrationDataReader(CALIBRATION_INPUTS[name](images)),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=per_channel,
+            )
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--models", type=str, nargs="+", default=list(MODELS), choices=list(MODELS), help="Models to quantize"
+    )
+    parser.add_argument(
+        "--mode", type=str, default="static", choices=["static", "dynamic"], help="Quantization mode"
+    )
+    parser.add_argument(
+        "--calibration-dir", type=str, default="uploads", help="Directory of calibration images for static mode"
+    )
+    parser.add_argument(
+        "--max-images", type=int, default=100, help="Maximum number of calibration images"
+    )
+    parser.add_argument(
+        "--per-tensor", action="store_true", help="Quantize weights per tensor instead of per channel"
+    )
+    args = parser.parse_args()
+
+    images = None
+    if args.mode == "static":
+        images = load_images(args.calibration_dir, args.max_images)
+        assert images, f"No calibration images found in {args.calibration_dir}"
+    for name in args.models:
+        output_path = quantize(name, args.mode, images, per_channel=not args.per_tensor)
+        print(f"{name}: {MODELS[name]} -> {output_path}")
@@ -0,0 +1,117 @@
+// Sends webcam frames to a live detection stream and draws the results.
+// Frames are posted at the camera rate without waiting for results; the
+// server only processes the newest one, so at most a couple of uploads
+// are kept in flight to avoid queueing in the browser instead.
+const MAX_UPLOADS_IN_FLIGHT = 2;
+const FRAME_INTERVAL_MS = 1000 / 15;
+const JPEG_QUALITY = 0.7;
+
+const video = document.getElementById("webcam");
+const overlay = document.getElementById("overlay");
+const button = document.getElementById("streamButton");
+const statsText = document.getElementById("streamStats");
+const capture = document.createElement("canvas");
+
+let stream = null;
+let timer = null;
+let reader = null;
+let uploadsInFlight = 0;
+
+async function start() {
+    const kind = document.getElementById("streamKind").value;
+    const mode = document.getElementById("detectionMode").value;
+    video.srcObject = await navigator.mediaDevices.getUserMedia({ video: true });
+    await video.play();
+    const response = await fetch(`/api/v1/streams?kind=${kind}&detection_mode=${mode}`, { method: "POST" });
+    if (!response.ok) {
+        statsText.textContent = (await response.json()).error;
+        stopCamera();
+        return;
+    }
+    stream = await response.json();
+    timer = setInterval(sendFrame, FRAME_INTERVAL_MS);
+    readResults(stream);
+    button.textContent = "توقف";
+}
+
+function sendFrame() {
+    if (!stream || uploadsInFlight >= MAX_UPLOADS_IN_FLIGHT || !video.videoWidth) {
+        return;
+    }
+    capture.width = video.videoWidth;
+    capture.height = video.videoHeight;
+    capture.getContext("2d").drawImage(video, 0, 0);
+    uploadsInFlight += 1;
+    capture.toBlob(async (blob) => {
+        try {
+            await fetch(stream.frames_url, { method: "POST", body: blob, headers: { "Content-Type": "image/jpeg" } });
+        } finally {
+            uploadsInFlight -= 1;
+        }
+    }, "image/jpeg", JPEG_QUALITY);
+}
+
+async function readResults(current) {
+    const response = await fetch(current.results_url);
+    reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (line.trim()) {
+                draw(JSON.parse(line));
+            }
+        }
+    }
+}
+
+function draw(result) {
+    overlay.width = video.videoWidth;
+    overlay.height = video.videoHeight;
+    const context = overlay.getContext("2d");
+    context.clearRect(0, 0, overlay.width, overlay.height);
+    context.lineWidth = 3;
+    context.font = "18px sans-serif";
+    context.strokeStyle = context.fillStyle = "#24ff0c";
+    for (const face of result.faces || []) {
+        const [x1, y1, x2, y2] = face.box;
+        context.strokeRect(x1, y1, x2 - x1, y2 - y1);
+        context.fillText(`${face.gender}, ${face.age}`, x1, y1 - 6);
+    }
+    for (const object of result.objects || []) {
+        const [x1, y1, x2, y2] = object.box;
+        context.strokeRect(x1, y1, x2 - x1, y2 - y1);
+        context.fillText(`${object.label}: ${object.score.toFixed(2)}`, x1, y1 - 6);
+    }
+    statsText.textContent = result.error || `${result.fps} fps, ${result.latency_ms} ms`;
+}
+
+function stopCamera() {
+    if (video.srcObject) {
+        video.srcObject.getTracks().forEach((track) => track.stop());
+        video.srcObject = null;
+    }
+}
+
+async function stop() {
+    clearInterval(timer);
+    if (reader) {
+        reader.cancel();
+    }
+    if (stream) {
+        await fetch(`/api/v1/streams/${stream.id}`, { method: "DELETE" });
+    }
+    stream = reader = null;
+    stopCamera();
+    overlay.getContext("2d").clearRect(0, 0, overlay.width, overlay.height);
+    button.textContent = "شروع";
+}
+
+button.addEventListener("click", () => (stream ? stop() : start()));
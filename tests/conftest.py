@@ -0,0 +1,123 @@
+import io
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Models and coco8.yaml are opened relative to the repository root
+os.chdir(ROOT)
+
+# The app reads its settings when it is imported: keep everything it writes
+# in a scratch directory and use SQLite instead of Postgres
+SCRATCH = tempfile.mkdtemp(prefix="ai-web-app-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{SCRATCH}/database.db",
+    SECRET_KEY="test",
+    INFERENCE_CACHE_BACKEND="none",
+    PAGE_CACHE_BACKEND="none",
+    OUTPUT_IMAGE_STORE_DIR=f"{SCRATCH}/output_images",
+    ONNX_OPTIMIZED_MODEL_DIR=f"{SCRATCH}/onnx",
+    JOB_QUEUE_PATH=f"{SCRATCH}/jobs.sqlite3",
+    PROFILE_DIR=f"{SCRATCH}/profiles",
+)
+os.environ.pop("API_KEY", None)
+
+
+class FakeSession:
+    """Stands in for an ONNX Runtime session with a single image input."""
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="images", shape=self.shape)]
+
+
+@pytest.fixture
+def make_detector(monkeypatch):
+    """Build a YOLOv8 for a 640x640 model with a dynamic batch axis, without loading a model."""
+    from src import object_detection
+
+    monkeypatch.setattr(
+        object_detection, "create_session", lambda path: FakeSession(["batch", 3, 640, 640])
+    )
+
+    def make(**options):
+        return object_detection.YOLOv8("yolov8n.onnx", **options)
+
+    return make
+
+
+class FakeBackend:
+    """Stands in for the models: records the images it is given and finds nothing."""
+
+    def __init__(self):
+        self.images = []
+
+    def analyze_faces(self, input_image, draw=False, detection_mode=None):
+        self.images.append(input_image)
+        return [], input_image
+
+    def detect_objects(self, input_image, draw=False):
+        self.images.append(input_image)
+        return np.empty((0, 4), dtype=int), np.empty(0), np.empty(0, dtype=int), [], input_image
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """An empty database of the test's own for the functions in database.py."""
+    from sqlmodel import SQLModel, create_engine
+    import database
+
+    engine = create_engine(f"sqlite:///{tmp_path}/database.db")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "tables_created", True)
+    return engine
+
+
+@pytest.fixture
+def app_module():
+    import app
+
+    return app
+
+
+@pytest.fixture
+def backend(app_module, monkeypatch):
+    """Replace the models behind the app's admission gates with a FakeBackend."""
+    from utils.admission import AdmittedBackend
+
+    fake = FakeBackend()
+    admitted = app_module.inference_backend
+    monkeypatch.setattr(
+        app_module,
+        "inference_backend",
+        AdmittedBackend(fake, admitted.gates, background=admitted.background),
+    )
+    return fake
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.app.config["TESTING"] = True
+    return app_module.app.test_client()
+
+
+def encode(width, height, format="JPEG"):
+    image = Image.new("RGB", (width, height), (120, 80, 40))
+    data = io.BytesIO()
+    image.save(data, format)
+    return data.getvalue()
+
+
+@pytest.fixture
+def jpeg():
+    return encode(64, 48)
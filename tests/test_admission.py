@@ -0,0 +1,189 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from src.inference_pool import InferenceUnavailable
+from utils.admission import AdmissionGate, AdmittedBackend, Overloaded
+
+
+def start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_calls_run_up_to_max_in_flight():
+    gate = AdmissionGate("model", max_in_flight=2, max_queue=0)
+    gate.acquire()
+    gate.acquire()
+    assert gate.stats()["in_flight"] == 2
+    with pytest.raises(Overloaded):
+        gate.acquire()
+    gate.release()
+    with gate.admit():
+        assert gate.stats()["in_flight"] == 2
+    assert gate.stats()["in_flight"] == 1
+    assert gate.stats()["admitted"] == 3
+    assert gate.stats()["rejected"] == 1
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    gate = AdmissionGate("model", max_in_flight=1, max_queue=1, max_wait=5, retry_after=7)
+    gate.acquire()
+    waiter = start(gate.acquire)
+    wait_until(lambda: gate.stats()["queue_depth"] == 1)
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as e:
+        gate.acquire()
+    assert time.monotonic() - started < 1
+    assert (e.value.name, e.value.retry_after) == ("model", 7)
+    gate.release()
+    waiter.join(5)
+    assert gate.stats()["in_flight"] == 1
+    assert gate.stats()["queue_depth"] == 0
+
+
+def test_queued_call_is_rejected_after_max_wait():
+    gate = AdmissionGate("model", max_in_flight=1, max_queue=4, max_wait=0.2)
+    gate.acquire()
+    started = time.monotonic()
+    with pytest.raises(Overloaded):
+        gate.acquire()
+    assert 0.2 <= time.monotonic() - started < 2
+    assert gate.stats()["queue_depth"] == 0
+
+
+def test_check_rejects_only_when_the_queue_is_full():
+    gate = AdmissionGate("model", max_in_flight=1, max_queue=1, max_wait=5)
+    gate.check()
+    gate.acquire()
+    gate.check()
+    waiter = start(gate.acquire)
+    wait_until(lambda: gate.stats()["queue_depth"] == 1)
+    with pytest.raises(Overloaded):
+        gate.check()
+    gate.release()
+    waiter.join(5)
+
+
+def test_background_work_waits_without_a_deadline_behind_requests():
+    gate = AdmissionGate("model", max_in_flight=1, max_queue=0, max_wait=0.1)
+    order = []
+    gate.acquire()
+    background = start(lambda: (gate.acquire(background=True), order.append("background")))
+    wait_until(lambda: gate.stats()["background_waiting"] == 1)
+    # Past max_wait and beyond max_queue, but not rejected
+    time.sleep(0.3)
+    assert gate.stats()["rejected"] == 0
+
+    # A queued request is admitted before the background work
+    gate.max_queue = 1
+    gate.max_wait = 5
+    request = start(lambda: (gate.acquire(), order.append("request")))
+    wait_until(lambda: gate.stats()["queue_depth"] == 2)
+    gate.release()
+    request.join(5)
+    assert order == ["request"]
+    gate.release()
+    background.join(5)
+    assert order == ["request", "background"]
+
+
+def test_admitted_backend_passes_calls_through_their_gate():
+    class Backend:
+        def analyze_faces(self, input_image, draw=False, detection_mode=None):
+            return gates["face_analysis"].stats()["in_flight"], detection_mode
+
+        def detect_objects(self, input_image, draw=False):
+            return gates["object_detection"].stats()["in_flight"], draw
+
+        def stats(self):
+            return "backend stats"
+
+    gates = {name: AdmissionGate(name) for name in ("face_analysis", "object_detection")}
+    backend = AdmittedBackend(Backend(), gates)
+    assert backend.analyze_faces(None, detection_mode="fast") == (1, "fast")
+    assert backend.detect_objects(None, draw=True) == (1, True)
+    assert backend.stats() == "backend stats"
+    assert [gate.stats()["admitted"] for gate in gates.values()] == [1, 1]
+    assert [gate.stats()["in_flight"] for gate in gates.values()] == [0, 0]
+
+
+@pytest.fixture
+def gates(app_module, monkeypatch):
+    """Give the app small gates of the test's own."""
+    gates = app_module.admission_gates
+    for name in ("face_analysis", "object_detection", "bulk"):
+        monkeypatch.setitem(gates, name, AdmissionGate(name, 1, 0, 0, retry_after=3))
+    return gates
+
+
+def test_saturated_model_answers_503(client, backend, gates, jpeg):
+    gates["object_detection"].acquire()
+    response = client.post("/api/v1/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert "error" in response.get_json()
+    assert backend.images == []
+
+    # The other model is not affected
+    assert client.post("/api/v1/face-analysis", data=jpeg, content_type="image/jpeg").status_code == 200
+    gates["object_detection"].release()
+    assert client.post("/api/v1/object-detection", data=jpeg, content_type="image/jpeg").status_code == 200
+    assert gates["object_detection"].stats()["in_flight"] == 0
+
+
+def test_unavailable_inference_answers_503(client, backend, gates, jpeg, monkeypatch):
+    def unavailable(input_image, draw=False):
+        raise InferenceUnavailable("Inference worker process died")
+
+    monkeypatch.setattr(backend, "detect_objects", unavailable)
+    response = client.post("/api/v1/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert gates["object_detection"].stats()["in_flight"] == 0
+
+
+def test_bulk_requests_are_limited_and_their_images_wait_for_the_model(client, backend, gates, jpeg):
+    def bulk():
+        return client.post(
+            "/api/v1/bulk/object-detection",
+            data={"images": [(io.BytesIO(jpeg), f"{i}.jpg") for i in range(3)]},
+            content_type="multipart/form-data",
+        )
+
+    gates["bulk"].acquire()
+    response = bulk()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    gates["bulk"].release()
+
+    # The single model slot is taken; bulk images wait for it instead of failing
+    gates["object_detection"].acquire()
+    threading.Timer(0.3, gates["object_detection"].release).start()
+    response = bulk()
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[-1]["summary"]["images"] == 3
+    assert lines[-1]["summary"]["failed"] == 0
+    assert len(backend.images) == 3
+    response.close()
+    assert gates["bulk"].stats()["in_flight"] == 0
+    assert gates["object_detection"].stats()["rejected"] == 0
+
+
+def test_oversized_request_answers_413(client, backend, app_module, jpeg, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "MAX_CONTENT_LENGTH", len(jpeg) - 1)
+    response = client.post("/api/v1/face-analysis", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 413
+    assert backend.images == []
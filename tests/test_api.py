@@ -0,0 +1,66 @@
+import io
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "content_type", ["image/jpeg", "application/octet-stream", "application/x-www-form-urlencoded", None]
+)
+def test_raw_body_is_the_image(client, backend, jpeg, content_type):
+    # curl --data-binary sends application/x-www-form-urlencoded unless told otherwise
+    headers = {"Content-Type": content_type} if content_type else {}
+    response = client.post("/api/v1/face-analysis", data=jpeg, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json() == {"faces": []}
+    assert [image.shape for image in backend.images] == [(48, 64, 3)]
+
+
+def test_multipart_image_field(client, backend, jpeg):
+    response = client.post(
+        "/api/v1/object-detection",
+        data={"image": (io.BytesIO(jpeg), "photo.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json() == {"objects": []}
+    assert len(backend.images) == 1
+
+
+def test_multipart_without_image_field(client, backend, jpeg):
+    response = client.post(
+        "/api/v1/object-detection",
+        data={"file": (io.BytesIO(jpeg), "photo.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+    assert backend.images == []
+
+
+def test_empty_body(client, backend):
+    response = client.post("/api/v1/face-analysis", data=b"", content_type="image/jpeg")
+    assert response.status_code == 400
+    assert backend.images == []
+
+
+def test_body_that_is_not_an_image(client, backend):
+    response = client.post(
+        "/api/v1/face-analysis", data=b"name=value", content_type="application/x-www-form-urlencoded"
+    )
+    assert response.status_code == 400
+    assert backend.images == []
+
+
+def test_job_with_raw_body(client, backend, jpeg):
+    response = client.post(
+        "/api/v1/jobs/face-analysis", data=jpeg, content_type="application/x-www-form-urlencoded"
+    )
+    assert response.status_code == 202, response.get_json()
+    status_url = response.headers["Location"]
+    deadline = time.monotonic() + 10
+    while (job := client.get(status_url).get_json())["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, job
+        time.sleep(0.05)
+    assert job["status"] == "done", job
+    assert job["result"] == {"faces": []}
+    assert [image.shape for image in backend.images] == [(48, 64, 3)]
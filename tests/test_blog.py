@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import Session
+
+from database import Topic, get_topics_page, parse_topic_cursor, topic_cursor
+
+
+def add_topics(engine, *bodies, timestamps=None):
+    start = datetime(2024, 5, 1, 12, 0, 0, 250000, tzinfo=timezone.utc)
+    timestamps = timestamps or [start + timedelta(minutes=i) for i in range(len(bodies))]
+    with Session(engine) as db_session:
+        for i, (body, timestamp) in enumerate(zip(bodies, timestamps)):
+            db_session.add(
+                Topic(title=f"Topic {i + 1}", body=body, image="", timestamp=timestamp, user_id=1)
+            )
+        db_session.commit()
+
+
+def ids(page):
+    return [topic.id for topic in page["topics"]]
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, 5, 17, tzinfo=timezone.utc)
+    topic = Topic(id=42, title="", body="", image="", timestamp=timestamp, user_id=1)
+    assert parse_topic_cursor(topic_cursor(topic)) == (topic.timestamp, 42)
+
+
+@pytest.mark.parametrize("cursor", [None, "", "42", "yesterday_42", "2024-05-01T12:30:05_x", "_42"])
+def test_invalid_cursor(cursor):
+    assert parse_topic_cursor(cursor) is None
+
+
+def test_pages_go_back_and_forth(engine):
+    # Topics 3 and 4 share a timestamp, so the id breaks the tie
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    minutes = [0, 1, 2, 2, 3, 4, 5]
+    add_topics(engine, *["body"] * 7, timestamps=[start + timedelta(minutes=m) for m in minutes])
+
+    first = get_topics_page(3)
+    assert ids(first) == [7, 6, 5]
+    assert first["newer"] is None
+    second = get_topics_page(3, after=first["older"])
+    assert ids(second) == [4, 3, 2]
+    last = get_topics_page(3, after=second["older"])
+    assert ids(last) == [1]
+    assert last["older"] is None
+
+    assert ids(get_topics_page(3, before=last["newer"])) == [4, 3, 2]
+    back = get_topics_page(3, before=second["newer"])
+    assert ids(back) == [7, 6, 5]
+    assert back["newer"] is None
+    assert back["older"] == first["older"]
+
+
+def test_invalid_cursor_shows_the_first_page(engine):
+    add_topics(engine, "a", "b", "c")
+    assert ids(get_topics_page(2, after="garbage")) == [3, 2]
+    assert ids(get_topics_page(2, before="garbage")) == [3, 2]
+
+
+def test_empty_blog(engine):
+    assert get_topics_page(10) == {"topics": [], "newer": None, "older": None}
+
+
+def test_excerpt_is_marked_truncated_only_when_the_body_goes_on(engine):
+    add_topics(engine, "x" * 10, "x" * 11, "x" * 10 + "   ", "x" * 9 + " y")
+    topics = {topic.title: topic for topic in get_topics_page(10, excerpt_length=10)["topics"]}
+    assert [topics[f"Topic {i}"].truncated for i in range(1, 5)] == [False, True, False, True]
+    assert all(len(topic.excerpt) <= 10 for topic in topics.values())
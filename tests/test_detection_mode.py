@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/v1/face-analysis",
+        "/api/v1/streams?kind=faces",
+        "/api/v1/bulk/face-analysis",
+        "/api/v1/jobs/face-analysis",
+    ],
+)
+def test_api_rejects_an_unknown_detection_mode(client, backend, jpeg, url):
+    separator = "&" if "?" in url else "?"
+    response = client.post(f"{url}{separator}detection_mode=slow", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "detection_mode must be one of fast, balanced, accurate, adaptive"}
+    assert backend.images == []
+
+
+@pytest.fixture
+def logged_in(client):
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+        session["user_username"] = "test"
+    return client
+
+
+def selected_mode(response):
+    page = response.get_data(as_text=True)
+    return [mode for mode in ("fast", "balanced", "accurate", "adaptive") if f'value="{mode}" selected' in page]
+
+
+def test_page_selects_the_configured_mode(logged_in, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.jinja_env.globals, "default_face_detection_mode", "accurate")
+    assert selected_mode(logged_in.get("/ai-face-analysis")) == ["accurate"]
+
+
+def test_page_keeps_the_chosen_mode(logged_in, backend, jpeg):
+    response = logged_in.post(
+        "/ai-face-analysis",
+        data={"image": (io.BytesIO(jpeg), "face.jpg"), "detection_mode": "fast"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    assert selected_mode(response) == ["fast"]
+    assert len(backend.images) == 1
+
+
+def test_page_rejects_an_unknown_mode(logged_in, backend, jpeg):
+    response = logged_in.post(
+        "/ai-face-analysis",
+        data={"image": (io.BytesIO(jpeg), "face.jpg"), "detection_mode": "slow"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    assert backend.images == []
+    with logged_in.session_transaction() as session:
+        assert [category for category, _ in session["_flashes"]] == ["danger"]
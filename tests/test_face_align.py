@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from utils.face_align import arcface_dst, estimate_norm, transform_matrix, umeyama
+
+
+def similarity(scale, degrees, tx, ty):
+    rotation = np.deg2rad(degrees)
+    cos, sin = scale * np.cos(rotation), scale * np.sin(rotation)
+    return np.array([[cos, -sin, tx], [sin, cos, ty]])
+
+
+def apply(M, points):
+    return points @ M[:, :2].T + M[:, 2]
+
+
+def test_umeyama_recovers_an_exact_similarity():
+    rng = np.random.default_rng(0)
+    src = rng.uniform(0, 200, (5, 2))
+    M = similarity(0.7, 33, 12.5, -40)
+    assert np.allclose(umeyama(src, apply(M, src)), M)
+
+
+def test_umeyama_is_the_least_squares_similarity():
+    rng = np.random.default_rng(1)
+    src = rng.uniform(0, 200, (5, 2))
+    dst = apply(similarity(1.3, -20, 5, 7), src) + rng.normal(0, 2, (5, 2))
+    # x' = a x - b y + tx, y' = b x + a y + ty is linear in (a, b, tx, ty)
+    x, y = src.T
+    ones, zeros = np.ones(5), np.zeros(5)
+    A = np.concatenate([np.stack([x, -y, ones, zeros], 1), np.stack([y, x, zeros, ones], 1)])
+    (a, b, tx, ty), *_ = np.linalg.lstsq(A, np.concatenate(dst.T), rcond=None)
+    assert np.allclose(umeyama(src, dst), [[a, -b, tx], [b, a, ty]])
+
+
+def test_umeyama_batch_matches_single_faces():
+    rng = np.random.default_rng(2)
+    src = rng.uniform(0, 200, (4, 5, 2))
+    dst = rng.uniform(0, 112, (4, 5, 2))
+    batch = umeyama(src, dst)
+    assert batch.shape == (4, 2, 3)
+    for i in range(4):
+        assert np.allclose(batch[i], umeyama(src[i], dst[i]))
+
+
+def test_estimate_norm_of_the_template_is_the_identity():
+    assert np.allclose(estimate_norm(arcface_dst), np.eye(2, 3), atol=1e-5)
+    assert np.allclose(estimate_norm(arcface_dst * 2, image_size=224), np.eye(2, 3), atol=1e-5)
+
+
+def composed(center, output_size, scale, degrees):
+    """transform_matrix as the scale, translate, rotate, translate chain it replaced."""
+
+    def affine(M):
+        return np.vstack([M, [0, 0, 1]])
+
+    scaled = affine(similarity(scale, 0, 0, 0))
+    centered = affine(similarity(1, 0, -center[0] * scale, -center[1] * scale))
+    rotated = affine(similarity(1, degrees, 0, 0))
+    moved = affine(similarity(1, 0, output_size / 2, output_size / 2))
+    return (moved @ rotated @ centered @ scaled)[:2]
+
+
+@pytest.mark.parametrize(
+    "center, scale, degrees", [((50, 60), 1.0, 0), ((120.5, 80), 0.4, 30), ((10, 300), 2.5, -75)]
+)
+def test_transform_matrix_matches_the_composed_transform(center, scale, degrees):
+    expected = composed(center, 192, scale, degrees)
+    assert np.allclose(transform_matrix(center, 192, scale, degrees), expected)
+
+
+def test_transform_matrix_maps_the_center_to_the_middle_of_the_crop():
+    M = transform_matrix((120.5, 80), 192, 0.4, 30)
+    assert np.allclose(apply(M, np.array([[120.5, 80]])), [[96, 96]])
+
+
+def test_transform_matrix_batch():
+    centers = np.array([[50, 60], [120.5, 80], [10, 300]])
+    scales = np.array([1.0, 0.4, 2.5])
+    rotations = np.array([0, 30, -75])
+    batch = transform_matrix(centers, 192, scales, rotations)
+    assert batch.shape == (3, 2, 3)
+    for i in range(3):
+        assert np.allclose(batch[i], composed(centers[i], 192, scales[i], rotations[i]))
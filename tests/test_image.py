@@ -0,0 +1,61 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils.image import ImageTooLargeError, decode_image
+
+
+def encode(width, height, format, mode="RGB"):
+    data = io.BytesIO()
+    Image.new(mode, (width, height), 128).save(data, format)
+    data.seek(0)
+    return data
+
+
+def test_full_resolution_without_min_size():
+    pixels, scale = decode_image(encode(1280, 720, "JPEG"))
+    assert pixels.shape == (720, 1280, 3)
+    assert scale == (1.0, 1.0)
+
+
+def test_jpeg_is_drafted_at_the_smallest_dct_scale_keeping_min_size():
+    # 1/4 keeps the shorter side at 650, 1/8 would give 325
+    pixels, scale = decode_image(encode(4000, 2600, "JPEG"), min_size=640)
+    assert pixels.shape == (650, 1000, 3)
+    assert scale == (4.0, 4.0)
+
+
+def test_small_jpeg_is_not_reduced():
+    pixels, scale = decode_image(encode(1000, 700, "JPEG"), min_size=640)
+    assert pixels.shape == (700, 1000, 3)
+    assert scale == (1.0, 1.0)
+
+
+def test_png_is_reduced_by_an_integer_factor():
+    pixels, scale = decode_image(encode(2600, 1400, "PNG"), min_size=640)
+    assert pixels.shape == (700, 1300, 3)
+    assert scale == (2.0, 2.0)
+
+
+def test_scale_maps_back_to_odd_sizes():
+    pixels, (x_scale, y_scale) = decode_image(encode(1283, 1921, "PNG"), min_size=640)
+    height, width = pixels.shape[:2]
+    assert min(height, width) >= 640
+    assert (width * x_scale, height * y_scale) == pytest.approx((1283, 1921))
+
+
+def test_reduction_is_at_most_eight():
+    pixels, scale = decode_image(encode(6400, 6400, "PNG"), min_size=64)
+    assert pixels.shape == (800, 800, 3)
+    assert scale == (8.0, 8.0)
+
+
+def test_grayscale_is_converted_to_rgb():
+    pixels, _ = decode_image(encode(64, 48, "PNG", mode="L"))
+    assert pixels.shape == (48, 64, 3)
+
+
+def test_too_many_pixels_is_rejected():
+    with pytest.raises(ImageTooLargeError):
+        decode_image(encode(1000, 1000, "PNG"), max_pixels=999_999)
@@ -0,0 +1,129 @@
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from src import inference_pool
+from src.inference_pool import OBJECT_COLUMNS, InferencePool, InferenceUnavailable
+
+
+# Worker processes are spawned, so these stand-ins for worker_main must be
+# importable from this module
+
+
+def answering_worker(task_queue, result_queue, max_results):
+    """Finds one car in every image and draws by inverting it."""
+    while (task := task_queue.get()) is not None:
+        task_id, kind, draw, shm_name, shape, dtype, detection_mode = task
+        result_queue.put(("started", task_id, os.getpid()))
+        shm = shared_memory.SharedMemory(name=shm_name)
+        image = np.ndarray(shape, dtype, shm.buf)
+        results = np.ndarray((1, OBJECT_COLUMNS), np.float32, shm.buf, image.nbytes)
+        results[0] = 10, 20, 30, 40, 0.5, 2
+        if draw:
+            image[:] = 255 - image
+        del image, results
+        shm.close()
+        result_queue.put(("done", task_id, (1, ["car"], None)))
+
+
+def crashing_worker(task_queue, result_queue, max_results):
+    """Dies in the middle of its first task."""
+    task = task_queue.get()
+    if task is None:
+        return
+    result_queue.put(("started", task[0], os.getpid()))
+    result_queue.close()
+    result_queue.join_thread()
+    os._exit(1)
+
+
+def dead_worker(task_queue, result_queue, max_results):
+    """Dies before taking any task."""
+    os._exit(1)
+
+
+def hanging_worker(task_queue, result_queue, max_results):
+    """Never finishes its first task."""
+    task = task_queue.get()
+    if task is None:
+        return
+    result_queue.put(("started", task[0], os.getpid()))
+    time.sleep(3600)
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    pools = []
+
+    def make(worker, num_workers=1, timeout=30):
+        monkeypatch.setattr(inference_pool, "worker_main", worker)
+        pool = InferencePool(num_workers, max_results=16, timeout=timeout)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close(timeout=1)
+
+
+def image():
+    return np.arange(48 * 64 * 3, dtype=np.uint8).reshape(48, 64, 3)
+
+
+def test_workers_start_with_the_first_task(make_pool):
+    pool = make_pool(answering_worker)
+    assert pool.stats()["started"] is False
+    pool.detect_objects(image())
+    assert pool.stats()["started"] is True
+
+
+def test_results_and_drawing_come_back_through_shared_memory(make_pool):
+    pool = make_pool(answering_worker)
+    boxes, scores, class_ids, labels, output_image = pool.detect_objects(image(), draw=True)
+    assert boxes.tolist() == [[10, 20, 30, 40]]
+    assert scores.tolist() == [0.5]
+    assert class_ids.tolist() == [2]
+    assert labels == ["car"]
+    assert np.array_equal(output_image, 255 - image())
+
+
+def test_task_of_a_dead_worker_fails_and_the_worker_is_replaced(make_pool):
+    pool = make_pool(crashing_worker, timeout=30)
+    start = time.monotonic()
+    with pytest.raises(InferenceUnavailable, match="died"):
+        pool.detect_objects(image())
+    # Well before the timeout: the listener notices the dead process
+    assert time.monotonic() - start < 10
+    deadline = time.monotonic() + 10
+    while pool.stats()["restarts"] < 1 or pool.stats()["alive"] < 1:
+        assert time.monotonic() < deadline, pool.stats()
+        time.sleep(0.05)
+    assert pool.stats()["pending"] == 0
+
+
+def test_tasks_fail_when_every_worker_is_dead(make_pool):
+    pool = make_pool(dead_worker, num_workers=2, timeout=30)
+    start = time.monotonic()
+    with pytest.raises(InferenceUnavailable, match="died"):
+        pool.detect_objects(image())
+    assert time.monotonic() - start < 10
+    assert pool.stats()["pending"] == 0
+
+
+def test_task_without_a_result_times_out(make_pool):
+    pool = make_pool(hanging_worker, timeout=1)
+    with pytest.raises(InferenceUnavailable, match="longer than 1 seconds"):
+        pool.detect_objects(image())
+    assert pool.stats()["pending"] == 0
+
+
+def test_closed_pool_does_not_replace_its_workers(make_pool):
+    pool = make_pool(answering_worker, num_workers=2)
+    pool.detect_objects(image())
+    pool.close(timeout=5)
+    time.sleep(1)
+    assert pool.stats()["alive"] == 0
+    assert pool.stats()["restarts"] == 0
@@ -0,0 +1,39 @@
+import pytest
+
+from src.inference_scheduler import MicroBatcher
+
+
+def test_requests_are_batched_and_answered_in_order():
+    batches = []
+
+    def double(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher("double", double, max_batch_size=4, max_wait_time=0.2)
+    futures = [batcher.submit(i) for i in range(6)]
+    assert [future.result(5) for future in futures] == [0, 2, 4, 6, 8, 10]
+    assert sum(map(len, batches)) == 6
+    assert max(map(len, batches)) <= 4
+
+
+def test_errors_fail_every_request_of_the_batch():
+    def fail(items):
+        raise ValueError("Model failed")
+
+    batcher = MicroBatcher("fail", fail, max_wait_time=0.1)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match="Model failed"):
+            future.result(5)
+
+
+def test_missing_results_fail_every_request_of_the_batch():
+    def drop_last(items):
+        return items[:-1]
+
+    batcher = MicroBatcher("drop", drop_last, max_batch_size=3, max_wait_time=1)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="drop returned 2 results for 3 requests"):
+            future.result(5)
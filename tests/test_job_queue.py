@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from utils.job_queue import JobQueue
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), poll_interval=0.01)
+
+
+def wait(jobs, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while (job := jobs.get(job_id))["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, job
+        time.sleep(0.01)
+    return job
+
+
+def test_queued_running_done(jobs):
+    job_id = jobs.submit("echo", b"payload", {"annotate": True})
+    job = jobs.get(job_id)
+    assert job["status"] == "queued"
+    assert job["position"] == 0
+    assert "started_at" not in job
+
+    claimed_id, kind, payload, params = jobs.claim()
+    assert (claimed_id, kind, payload, params) == (job_id, "echo", b"payload", '{"annotate": true}')
+    job = jobs.get(job_id)
+    assert job["status"] == "running"
+    assert "position" not in job
+    assert job["started_at"] >= job["created_at"]
+
+    jobs.finish(job_id, result={"labels": ["car"]})
+    job = jobs.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"labels": ["car"]}
+    assert job["expires_at"] == job["finished_at"] + jobs.result_ttl
+    assert jobs.claim() is None
+
+
+def test_failed_job_keeps_its_error(jobs):
+    job_id = jobs.submit("echo", b"payload")
+    jobs.claim()
+    jobs.finish(job_id, error="Invalid image")
+    job = jobs.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Invalid image"
+    assert "result" not in job
+
+
+def test_jobs_are_claimed_in_order_and_report_their_position(jobs):
+    job_ids = [jobs.submit("echo", b"payload") for _ in range(3)]
+    assert [jobs.get(job_id)["position"] for job_id in job_ids] == [0, 1, 2]
+    assert jobs.claim()[0] == job_ids[0]
+    assert [jobs.get(job_id)["position"] for job_id in job_ids[1:]] == [0, 1]
+
+
+def test_unknown_and_expired_jobs(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), result_ttl=0)
+    assert jobs.get("missing") is None
+    job_id = jobs.submit("echo", b"payload")
+    jobs.claim()
+    jobs.finish(job_id, result=1)
+    time.sleep(0.01)
+    assert jobs.get(job_id) is None
+    jobs.sweep()
+    assert jobs.stats()["jobs"] == {}
+
+
+def test_timed_out_job_is_requeued_then_failed(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), job_timeout=0, max_attempts=2)
+    job_id = jobs.submit("echo", b"payload")
+    jobs.claim()
+    time.sleep(0.01)
+    jobs.sweep()
+    assert jobs.get(job_id)["status"] == "queued"
+    jobs.claim()
+    time.sleep(0.01)
+    jobs.sweep()
+    job = jobs.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Timed out"
+
+
+def test_workers_run_the_registered_handlers(jobs):
+    def echo(payload, params):
+        if not payload:
+            raise ValueError("Empty payload")
+        return {"length": len(payload), **params}
+
+    jobs.register("echo", echo)
+    done = jobs.submit("echo", b"abc", {"annotate": False})
+    failed = jobs.submit("echo", b"")
+    jobs.start(2)
+    jobs.start(2)
+    assert jobs.stats()["workers"] == 2
+    assert wait(jobs, done)["result"] == {"length": 3, "annotate": False}
+    job = wait(jobs, failed)
+    assert (job["status"], job["error"]) == ("failed", "Empty payload")
+
+
+def test_api_rejects_oversized_uploads(client, app_module, backend, jpeg, monkeypatch):
+    monkeypatch.setattr(app_module.config, "job_max_bytes", len(jpeg) - 1)
+    response = client.post("/api/v1/jobs/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 413
+    monkeypatch.setattr(app_module.config, "job_max_bytes", len(jpeg))
+    response = client.post("/api/v1/jobs/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 202
+    assert app_module.job_queue.workers
+    assert wait(app_module.job_queue, response.get_json()["id"])["status"] == "done"
+
+
+def test_api_unknown_job_kind(client):
+    response = client.post("/api/v1/jobs/poetry", data=b"abc")
+    assert response.status_code == 404
@@ -0,0 +1,22 @@
+from utils.metrics import Metrics
+
+
+def test_render_sorts_mixed_label_values():
+    metrics = Metrics()
+    metrics.describe("app_request_seconds", "histogram", "Request latency")
+    metrics.inc("app_requests_total", endpoint="index", status=200)
+    metrics.inc("app_requests_total", endpoint=None, status=404)
+    metrics.observe("app_request_seconds", 0.02, endpoint=None)
+    metrics.observe("app_request_seconds", 0.01, endpoint="index")
+    text = metrics.render()
+    assert 'app_requests_total{endpoint="None",status="404"} 1' in text
+    assert 'app_requests_total{endpoint="index",status="200"} 1' in text
+    assert 'app_request_seconds_count{endpoint="index"} 1' in text
+
+
+def test_metrics_survive_unmatched_requests(client, engine):
+    assert client.get("/no-such-page").status_code == 404
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'app_requests_total{endpoint="unmatched",method="GET",status="404"}' in text
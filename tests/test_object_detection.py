@@ -0,0 +1,133 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.object_detection import PAD_VALUE, tile_starts
+
+
+def model_output(*detections, num_classes=80):
+    """A window's model output holding (cx, cy, w, h, class_id, score) detections."""
+    output = np.zeros((1, 4 + num_classes, len(detections)), dtype=np.float32)
+    for i, (cx, cy, w, h, class_id, score) in enumerate(detections):
+        output[0, :4, i] = cx, cy, w, h
+        output[0, 4 + class_id, i] = score
+    return output
+
+
+def detect(detector, image_shape, *detections):
+    image = np.zeros(image_shape, dtype=np.uint8)
+    return detector.detections(model_output(*detections), [(image, 0, 0)])
+
+
+def test_decode_maps_boxes_to_the_image(make_detector):
+    detector = make_detector()
+    boxes, scores, class_ids = detect(detector, (320, 1280, 3), (320, 320, 64, 64, 2, 0.9))
+    assert boxes.tolist() == [[576, 144, 128, 32]]
+    assert scores.tolist() == [np.float32(0.9)]
+    assert class_ids.tolist() == [2]
+
+
+def test_decode_drops_boxes_under_the_confidence_threshold(make_detector):
+    detector = make_detector(confidence_threshold=0.5)
+    boxes, _, class_ids = detect(
+        detector, (640, 640, 3), (100, 100, 50, 50, 0, 0.4), (400, 400, 50, 50, 1, 0.6)
+    )
+    assert class_ids.tolist() == [1]
+    assert len(boxes) == 1
+
+
+def test_nms_suppresses_overlapping_boxes_of_one_class(make_detector):
+    for class_aware_nms in (False, True):
+        detector = make_detector(class_aware_nms=class_aware_nms)
+        _, scores, _ = detect(
+            detector, (640, 640, 3), (100, 100, 80, 80, 0, 0.7), (104, 102, 80, 80, 0, 0.9)
+        )
+        assert scores.tolist() == [np.float32(0.9)]
+
+
+def test_class_aware_nms_keeps_overlapping_boxes_of_other_classes(make_detector):
+    overlapping = ((100, 100, 80, 80, 0, 0.7), (104, 102, 80, 80, 1, 0.9))
+    _, _, class_ids = detect(make_detector(), (640, 640, 3), *overlapping)
+    assert class_ids.tolist() == [1]
+    _, _, class_ids = detect(make_detector(class_aware_nms=True), (640, 640, 3), *overlapping)
+    assert sorted(class_ids.tolist()) == [0, 1]
+
+
+def test_no_detections(make_detector):
+    boxes, scores, class_ids = detect(make_detector(), (480, 640, 3))
+    assert boxes.shape == (0, 4)
+    assert len(scores) == len(class_ids) == 0
+
+
+@pytest.mark.parametrize(
+    "length, expected",
+    [(500, [0]), (640, [0]), (641, [0, 1]), (1080, [0, 440]), (1920, [0, 512, 1024, 1280])],
+)
+def test_tile_starts(length, expected):
+    assert tile_starts(length, 640, 512) == expected
+
+
+def test_only_tiled_mode_splits_large_images(make_detector):
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    for mode in ("resize", "letterbox"):
+        assert len(make_detector(mode=mode).windows(image)) == 1
+    small = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert len(make_detector(mode="tiled").windows(small)) == 1
+
+
+def test_tiles_cover_the_image(make_detector):
+    detector = make_detector(mode="tiled", tile_size=640, tile_overlap=0.2)
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    windows = detector.windows(image)
+    whole, x, y = windows[0]
+    assert whole is image and (x, y) == (0, 0)
+    assert [(x, y) for _, x, y in windows[1:]] == [
+        (x, y) for y in (0, 440) for x in (0, 512, 1024, 1280)
+    ]
+    covered = np.zeros(image.shape[:2], dtype=bool)
+    for tile, x, y in windows[1:]:
+        assert tile.shape == (640, 640, 3)
+        covered[y : y + 640, x : x + 640] = True
+    assert covered.all()
+
+
+def test_letterbox_keeps_the_aspect_ratio(make_detector):
+    detector = make_detector(mode="letterbox")
+    image = np.full((640, 1280, 3), 7, dtype=np.uint8)
+    assert detector.geometry(image.shape) == (640, 320, 0, 160)
+    resized = detector.resize(image)
+    assert resized.shape == (640, 640, 3)
+    assert (resized[:160] == PAD_VALUE).all() and (resized[480:] == PAD_VALUE).all()
+    assert (resized[160:480] == 7).all()
+    boxes, _, _ = detect(detector, image.shape, (320, 320, 64, 32, 0, 0.9))
+    assert boxes.tolist() == [[576, 288, 128, 64]]
+
+
+def test_tiles_and_the_whole_image_go_through_one_nms(make_detector):
+    detector = make_detector(mode="tiled")
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    windows = detector.windows(image)
+    # One object at x=600, y=100, 60x60: seen by the whole image, scaled by
+    # 1/3 and padded by 140 rows, and by the tile starting at x=512
+    outputs = np.concatenate([model_output((0, 0, 0, 0, 0, 0))] * len(windows))
+    outputs[0] = model_output((210, 130 / 3 + 140, 20, 20, 0, 0.6))[0]
+    tile = [(x, y) for _, x, y in windows].index((512, 0))
+    outputs[tile] = model_output((118, 130, 60, 60, 0, 0.9))[0]
+    boxes, scores, class_ids = detector.detections(outputs, windows)
+    assert boxes.tolist() == [[600, 100, 60, 60]]
+    assert scores.tolist() == [np.float32(0.9)]
+
+
+def test_resize_stays_the_default_mode(make_detector):
+    assert make_detector().mode == "resize"
+
+
+@pytest.mark.parametrize("mode, shape", [("letterbox", (700, 1000, 3)), ("tiled", (1400, 2000, 3))])
+def test_tiled_detection_gets_the_full_resolution_upload(
+    client, backend, app_module, monkeypatch, mode, shape
+):
+    monkeypatch.setattr(app_module.config, "object_detection_mode", mode)
+    jpeg = cv2.imencode(".jpg", np.zeros((1400, 2000, 3), dtype=np.uint8))[1].tobytes()
+    response = client.post("/api/v1/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 200, response.get_json()
+    assert [image.shape for image in backend.images] == [shape]
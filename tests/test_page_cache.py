@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from sqlmodel import Session
+
+from database import Topic
+from utils.cache import MemoryCache, PageCache, create_page_cache
+
+
+@pytest.fixture
+def pages():
+    return PageCache(MemoryCache())
+
+
+def test_page_round_trip(pages):
+    key = pages.key("/blog", ["topics"])
+    assert pages.get(key) is None
+    page = pages.set(key, b"<h1>Blog</h1>", "text/html")
+    assert pages.get(key) == page
+    assert page["body"] == b"<h1>Blog</h1>"
+    assert page["mimetype"] == "text/html"
+    assert page["etag"] == pages.set(key, b"<h1>Blog</h1>", "text/html")["etag"]
+    assert page["etag"] != pages.set(key, b"<h1>News</h1>", "text/html")["etag"]
+
+
+def test_keys_depend_on_the_page_and_its_tags(pages):
+    assert pages.key("/blog", ["topics"]) == pages.key("/blog", ["topics"])
+    assert pages.key("/blog", ["topics"]) != pages.key("/blog?limit=50", ["topics"])
+    assert pages.key("/blog", ["topics"]) != pages.key("/blog", ["topics", "topic-1"])
+
+
+def test_invalidating_a_tag_drops_only_its_pages(pages):
+    blog = pages.key("/blog", ["topics"])
+    first = pages.key("/blog/1", ["topic-1"])
+    second = pages.key("/blog/2", ["topic-2"])
+    for key in (blog, first, second):
+        pages.set(key, b"page", "text/html")
+
+    pages.invalidate("topics", "topic-1")
+    assert pages.key("/blog", ["topics"]) != blog
+    assert pages.key("/blog/1", ["topic-1"]) != first
+    assert pages.key("/blog/2", ["topic-2"]) == second
+    assert pages.get(pages.key("/blog", ["topics"])) is None
+    assert pages.get(pages.key("/blog/2", ["topic-2"])) is not None
+
+
+def test_evicted_tag_version_never_brings_an_old_page_back():
+    backend = MemoryCache()
+    pages = PageCache(backend)
+    key = pages.key("/blog", ["topics"])
+    pages.set(key, b"page", "text/html")
+    backend.delete("tag-" + pages.hash("topics"))
+    assert pages.key("/blog", ["topics"]) != key
+
+
+def test_disk_cache_shares_invalidations_between_processes(tmp_path):
+    # Two workers' page caches on the same directory
+    first, second = (create_page_cache("disk", str(tmp_path)) for _ in range(2))
+    key = first.key("/blog", ["topics"])
+    first.set(key, b"page", "text/html")
+    assert second.get(second.key("/blog", ["topics"])) is not None
+    second.invalidate("topics")
+    assert first.key("/blog", ["topics"]) != key
+
+
+@pytest.mark.parametrize("web_concurrency, backend", [("1", "memory"), ("4", "disk")])
+def test_default_backend_follows_web_concurrency(web_concurrency, backend):
+    env = dict(os.environ, WEB_CONCURRENCY=web_concurrency)
+    env.pop("PAGE_CACHE_BACKEND", None)
+    output = subprocess.run(
+        [sys.executable, "-c", "import config; print(config.page_cache_backend)"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip() == backend
+
+
+@pytest.fixture
+def cached_client(client, app_module, engine, pages, monkeypatch):
+    monkeypatch.setattr(app_module, "page_cache", pages)
+    return client
+
+
+def add_topic(engine, title):
+    with Session(engine) as db_session:
+        timestamp = datetime.now(timezone.utc)
+        topic = Topic(title=title, body="body", image="", timestamp=timestamp, user_id=1)
+        db_session.add(topic)
+        db_session.commit()
+        return topic.id
+
+
+def test_blog_answers_revalidation_with_304(cached_client, pages, engine):
+    add_topic(engine, "First topic")
+    response = cached_client.get("/blog")
+    assert response.status_code == 200
+    assert "First topic" in response.get_data(as_text=True)
+    assert response.cache_control.private and response.cache_control.no_cache
+    etag = response.headers["ETag"]
+
+    response = cached_client.get("/blog", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+    add_topic(engine, "Second topic")
+    # Still served from the cache until the tag is invalidated
+    assert cached_client.get("/blog", headers={"If-None-Match": etag}).status_code == 304
+    pages.invalidate("topics")
+    response = cached_client.get("/blog", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "Second topic" in response.get_data(as_text=True)
+    assert response.headers["ETag"] != etag
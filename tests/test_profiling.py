@@ -0,0 +1,62 @@
+import pstats
+
+import numpy as np
+import pytest
+
+from src.inference_scheduler import InferenceScheduler
+from utils.admission import AdmittedBackend
+from utils.profiling import RequestProfiler
+
+
+def postprocess_detections(image):
+    return np.array([[1, 2, 3, 4]]), np.array([0.9]), np.array([0])
+
+
+class FakeDetector:
+    classes = ["person"]
+
+    def batch(self, images):
+        return [postprocess_detections(image) for image in images]
+
+
+class FakeRegistry:
+    def get(self, name):
+        return FakeDetector()
+
+
+@pytest.fixture
+def profiler(app_module, tmp_path, monkeypatch):
+    profiler = RequestProfiler(str(tmp_path))
+    monkeypatch.setattr(app_module, "request_profiler", profiler)
+    monkeypatch.setattr(app_module.config, "profile_key", "secret")
+    admitted = app_module.inference_backend
+    scheduler = InferenceScheduler(FakeRegistry())
+    monkeypatch.setattr(
+        app_module,
+        "inference_backend",
+        AdmittedBackend(scheduler, admitted.gates, background=admitted.background),
+    )
+    return profiler
+
+
+def functions(profiler, name):
+    return {function for _, _, function in pstats.Stats(profiler.path(name)).stats}
+
+
+def test_profile_covers_the_model_call(client, profiler, jpeg):
+    response = client.post(
+        "/api/v1/object-detection", data=jpeg, content_type="image/jpeg", headers={"X-Profile": "secret"}
+    )
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["objects"][0]["label"] == "person"
+    # Run on the request thread rather than the batcher thread cProfile cannot see
+    assert {"batch", "postprocess_detections"} <= functions(profiler, response.headers["X-Profile-Name"])
+
+
+def test_unprofiled_requests_use_the_batcher(client, profiler, app_module, jpeg):
+    response = client.post("/api/v1/object-detection", data=jpeg, content_type="image/jpeg")
+    assert response.status_code == 200
+    assert "X-Profile-Name" not in response.headers
+    assert profiler.names() == []
+    scheduler = app_module.inference_backend.backend
+    assert scheduler.object_detection_batcher.stats()["batch_sizes"] == {1: 1}
@@ -0,0 +1,142 @@
+import time
+import threading
+from contextlib import contextmanager
+from utils.metrics import metrics
+
+
+metrics.describe("app_admission_in_flight", "gauge", "Admitted requests running per model")
+metrics.describe("app_admission_queue_depth", "gauge", "Requests waiting for admission per model")
+metrics.describe("app_admission_rejected_total", "counter", "Requests rejected by admission control per model")
+
+
+class Overloaded(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is overloaded, retry in {retry_after} seconds")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Bound the calls one model works on, with a short wait queue.
+
+    Up to max_in_flight calls run at once. Up to max_queue more wait, each
+    for at most max_wait seconds; a call finding the queue full, or still
+    waiting after max_wait, raises Overloaded so the client can back off.
+    Background work (bulk analysis, jobs, live streams) is already bounded
+    by its own threads, so it waits for a slot without a deadline instead
+    of being rejected, and outside the max_queue limit. Queued requests
+    are admitted before waiting background work.
+    """
+
+    def __init__(self, name, max_in_flight=16, max_queue=16, max_wait=2.0, retry_after=1):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self.background_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+
+    def reject(self):
+        self.rejected += 1
+        metrics.inc("app_admission_rejected_total", model=self.name)
+        raise Overloaded(self.name, self.retry_after)
+
+    def check(self):
+        """Raise Overloaded if a call arriving now would be rejected.
+
+        Routes call this before reading the upload, so that a saturated
+        server turns requests away without buffering or decoding them.
+        """
+        with self.condition:
+            if self.in_flight >= self.max_in_flight and self.waiting >= self.max_queue:
+                self.reject()
+
+    def acquire(self, background=False):
+        with self.condition:
+            if background:
+                # Queued requests go first, background work only takes free slots
+                if self.in_flight >= self.max_in_flight or self.waiting:
+                    self.background_waiting += 1
+                    metrics.add("app_admission_queue_depth", 1, model=self.name)
+                    try:
+                        while self.in_flight >= self.max_in_flight or self.waiting:
+                            self.condition.wait()
+                    finally:
+                        self.background_waiting -= 1
+                        metrics.add("app_admission_queue_depth", -1, model=self.name)
+            elif self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_queue:
+                    self.reject()
+                self.waiting += 1
+                metrics.add("app_admission_queue_depth", 1, model=self.name)
+                deadline = time.monotonic() + self.max_wait
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            self.reject()
+                        self.condition.wait(timeout)
+                finally:
+                    self.waiting -= 1
+                    metrics.add("app_admission_queue_depth", -1, model=self.name)
+                    # Background work may have been holding back for this request
+                    self.condition.notify_all()
+            self.in_flight += 1
+            self.admitted += 1
+            metrics.add("app_admission_in_flight", 1, model=self.name)
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            metrics.add("app_admission_in_flight", -1, model=self.name)
+            self.condition.notify_all()
+
+    @contextmanager
+    def admit(self, background=False):
+        self.acquire(background)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting + self.background_waiting,
+                "background_waiting": self.background_waiting,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+class AdmittedBackend:
+    """An inference backend whose calls first pass the model's admission gate.
+
+    Wrapping the backend, rather than single routes, makes pages, the API,
+    bulk analysis, jobs and live streams share one limit per model.
+    background() tells whether the calling thread does background work.
+    """
+
+    def __init__(self, backend, gates, background=lambda: False):
+        self.backend = backend
+        self.gates = gates
+        self.background = background
+
+    def analyze_faces(self, input_image, draw=False, detection_mode=None):
+        with self.gates["face_analysis"].admit(self.background()):
+            return self.backend.analyze_faces(input_image, draw=draw, detection_mode=detection_mode)
+
+    def detect_objects(self, input_image, draw=False):
+        with self.gates["object_detection"].admit(self.background()):
+            return self.backend.detect_objects(input_image, draw=draw)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+import pickle
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class NullCache:
+    """Backend that stores nothing; only single-flight deduplication remains."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+class MemoryCache:
+    """In-process LRU store of bytes values, bounded by total size and entry age."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                self.delete(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.delete(key)
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self.delete(next(iter(self.entries)))
+
+    def delete(self, key):
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
+
+
+class DiskCache:
+    """LRU store of bytes values in a local directory.
+
+    Entries are written atomically, so several worker processes can share
+    one directory. The file mtime doubles as the last-access time: hits
+    touch the file and eviction removes the least recently used files
+    until the directory fits in max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttl=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        size = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime + self.ttl < now:
+                self.remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            size += stat.st_size
+        entries.sort()
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            self.remove(path)
+            size -= entry_size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class InferenceCache:
+    """Content-addressed cache of inference results.
+
+    Keys are derived from the decoded image pixels plus the model id and
+    any parameters that change the output. Concurrent misses for the same
+    key within a process are collapsed into a single computation.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(image, model_id, **params):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{model_id}|{sorted(params.items())}|{image.shape}|{image.dtype}".encode())
+        h.update(np.ascontiguousarray(image))
+        return h.hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        self.backend.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.in_flight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            # Another leader may have finished between the miss and registering
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+
+class PageCache:
+    """Rendered pages, invalidated by tags.
+
+    Every page is stored with the tags of the data it was rendered from.
+    Each tag has a random version kept in the backend, and page keys include
+    the versions of their tags, so invalidating a tag gives it a new version
+    and orphans exactly the pages built from it; they age out of the
+    backend on their own. A tag whose version was evicted gets a new one,
+    so an old page can never come back.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def hash(value):
+        return hashlib.blake2b(repr(value).encode(), digest_size=20).hexdigest()
+
+    def version(self, tag):
+        key = "tag-" + self.hash(tag)
+        version = self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex.encode()
+            self.backend.set(key, version)
+        return version.decode()
+
+    def key(self, page, tags):
+        """Key for a page; take it before rendering, so a concurrent invalidation is not missed."""
+        return "page-" + self.hash((page, [(tag, self.version(tag)) for tag in tags]))
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, body, mimetype):
+        """Store a page; returns it as a dict with its body, mimetype, etag and last_modified."""
+        page = {
+            "body": body,
+            "mimetype": mimetype,
+            "etag": hashlib.blake2b(body, digest_size=16).hexdigest(),
+            "last_modified": int(time.time()),
+        }
+        self.backend.set(key, pickle.dumps(page, protocol=pickle.HIGHEST_PROTOCOL))
+        return page
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.set("tag-" + self.hash(tag), uuid.uuid4().hex.encode())
+
+
+def create_cache_backend(backend, directory=None, max_bytes=256 * 1024 * 1024, ttl=3600):
+    if backend == "none":
+        return NullCache()
+    if backend == "memory":
+        return MemoryCache(max_bytes, ttl)
+    if backend == "disk":
+        return DiskCache(directory, max_bytes, ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def create_inference_cache(backend, directory=None, max_bytes=256 * 1024 * 1024, ttl=3600):
+    return InferenceCache(create_cache_backend(backend, directory, max_bytes, ttl))
+
+
+def create_page_cache(backend, directory=None, max_bytes=64 * 1024 * 1024, ttl=3600):
+    return PageCache(create_cache_backend(backend, directory, max_bytes, ttl))
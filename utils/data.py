@@ -2,12 +2,9 @@ from datetime import datetime
 import config
 
 
-def relative_time(datetime_str):
-    # Parse the input string into a datetime object
-    input_time = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S.%f')
-    
-    # Get the current time
-    current_time = datetime.now()
+def relative_time(input_time):
+    # Get the current time, in the input's timezone if it has one
+    current_time = datetime.now(input_time.tzinfo)
     
     # Calculate the difference
     time_difference = current_time - input_time
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-from skimage import transform as trans
 
 
 arcface_dst = np.array(
@@ -8,8 +7,36 @@ arcface_dst = np.array(
      [41.5493, 92.3655], [70.7299, 92.2041]],
     dtype=np.float32)
 
+def umeyama(src, dst):
+    """Least-squares similarity transform mapping src points onto dst points.
+
+    Closed form of Umeyama's method for 2D points: the rotation and scale
+    solve a complex linear regression, so no SVD is needed. src and dst are
+    (K, 2) or batches of shape (N, K, 2); returns (2, 3) or (N, 2, 3).
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=-2, keepdims=True)
+    dst_mean = dst.mean(axis=-2, keepdims=True)
+    src_demean = src - src_mean
+    dst_demean = dst - dst_mean
+    src_var = np.sum(src_demean ** 2, axis=(-2, -1))
+    # a = scale * cos(rotation), b = scale * sin(rotation)
+    a = np.sum(src_demean * dst_demean, axis=(-2, -1)) / src_var
+    b = np.sum(
+        src_demean[..., 0] * dst_demean[..., 1] - src_demean[..., 1] * dst_demean[..., 0], axis=-1
+    ) / src_var
+    M = np.empty(src.shape[:-2] + (2, 3))
+    M[..., 0, 0] = a
+    M[..., 0, 1] = -b
+    M[..., 1, 0] = b
+    M[..., 1, 1] = a
+    M[..., :, 2] = dst_mean[..., 0, :] - np.einsum("...ij,...j->...i", M[..., :, :2], src_mean[..., 0, :])
+    return M
+
 def estimate_norm(lmk, image_size=112,mode='arcface'):
-    assert lmk.shape == (5, 2)
+    # lmk is (5, 2) for one face or (N, 5, 2) for a batch
+    assert lmk.shape[-2:] == (5, 2)
     assert image_size%112==0 or image_size%128==0
     if image_size%112==0:
         ratio = float(image_size)/112.0
@@ -19,10 +46,7 @@ def estimate_norm(lmk, image_size=112,mode='arcface'):
         diff_x = 8.0*ratio
     dst = arcface_dst * ratio
     dst[:,0] += diff_x
-    tform = trans.SimilarityTransform()
-    tform.estimate(lmk, dst)
-    M = tform.params[0:2, :]
-    return M
+    return umeyama(lmk, np.broadcast_to(dst, lmk.shape))
 
 def norm_crop(img, landmark, image_size=112, mode='arcface'):
     M = estimate_norm(landmark, image_size, mode)
@@ -49,19 +73,31 @@ def square_crop(im, S):
     return det_im, scale
 
 
+def transform_matrix(center, output_size, scale, rotation):
+    """Affine matrix that scales and rotates about center into an output_size crop.
+
+    center is (2,) or (N, 2); scale and rotation (degrees) are scalars or (N,).
+    Returns (2, 3) or (N, 2, 3).
+    """
+    center = np.asarray(center, dtype=np.float64)
+    rot = np.asarray(rotation, dtype=np.float64) * np.pi / 180.0
+    scale = np.asarray(scale, dtype=np.float64)
+    cos = scale * np.cos(rot)
+    sin = scale * np.sin(rot)
+    cos, sin = np.broadcast_arrays(cos, sin, center[..., 0])[:2]
+    M = np.empty(center.shape[:-1] + (2, 3))
+    M[..., 0, 0] = cos
+    M[..., 0, 1] = -sin
+    M[..., 1, 0] = sin
+    M[..., 1, 1] = cos
+    # Move the center to the origin, rotate, then to the middle of the crop
+    M[..., 0, 2] = output_size / 2 - (cos * center[..., 0] - sin * center[..., 1])
+    M[..., 1, 2] = output_size / 2 - (sin * center[..., 0] + cos * center[..., 1])
+    return M
+
+
 def transform(data, center, output_size, scale, rotation):
-    scale_ratio = scale
-    rot = float(rotation) * np.pi / 180.0
-    #translation = (output_size/2-center[0]*scale_ratio, output_size/2-center[1]*scale_ratio)
-    t1 = trans.SimilarityTransform(scale=scale_ratio)
-    cx = center[0] * scale_ratio
-    cy = center[1] * scale_ratio
-    t2 = trans.SimilarityTransform(translation=(-1 * cx, -1 * cy))
-    t3 = trans.SimilarityTransform(rotation=rot)
-    t4 = trans.SimilarityTransform(translation=(output_size / 2,
-                                                output_size / 2))
-    t = t1 + t2 + t3 + t4
-    M = t.params[0:2]
+    M = transform_matrix(center, output_size, scale, rotation)
     cropped = cv2.warpAffine(data,
                              M, (output_size, output_size),
                              borderValue=0.0)
@@ -69,34 +105,24 @@ def transform(data, center, output_size, scale, rotation):
 
 
 def trans_points2d(pts, M):
-    new_pts = np.zeros(shape=pts.shape, dtype=np.float32)
-    for i in range(pts.shape[0]):
-        pt = pts[i]
-        new_pt = np.array([pt[0], pt[1], 1.], dtype=np.float32)
-        new_pt = np.dot(M, new_pt)
-        #print('new_pt', new_pt.shape, new_pt)
-        new_pts[i] = new_pt[0:2]
-
+    # pts is (K, 2) with M (2, 3), or (N, K, 2) with M (N, 2, 3)
+    M = np.asarray(M, dtype=np.float32)
+    new_pts = np.matmul(pts[..., 0:2].astype(np.float32), np.swapaxes(M[..., :, 0:2], -1, -2))
+    new_pts += M[..., None, :, 2]
     return new_pts
 
 
 def trans_points3d(pts, M):
-    scale = np.sqrt(M[0][0] * M[0][0] + M[0][1] * M[0][1])
-    #print(scale)
-    new_pts = np.zeros(shape=pts.shape, dtype=np.float32)
-    for i in range(pts.shape[0]):
-        pt = pts[i]
-        new_pt = np.array([pt[0], pt[1], 1.], dtype=np.float32)
-        new_pt = np.dot(M, new_pt)
-        #print('new_pt', new_pt.shape, new_pt)
-        new_pts[i][0:2] = new_pt[0:2]
-        new_pts[i][2] = pts[i][2] * scale
-
+    M = np.asarray(M, dtype=np.float32)
+    scale = np.sqrt(M[..., 0, 0] * M[..., 0, 0] + M[..., 0, 1] * M[..., 0, 1])
+    new_pts = np.empty(pts.shape, dtype=np.float32)
+    new_pts[..., 0:2] = trans_points2d(pts, M)
+    new_pts[..., 2] = pts[..., 2] * scale[..., None]
     return new_pts
 
 
 def trans_points(pts, M):
-    if pts.shape[1] == 2:
+    if pts.shape[-1] == 2:
         return trans_points2d(pts, M)
     else:
         return trans_points3d(pts, M)
@@ -1,10 +1,121 @@
-import cv2
+import re
+import hashlib
 import numpy as np
 import base64
+from PIL import Image
+from utils.cache import create_cache_backend
+from utils.metrics import metrics
+
+
+# OpenCV is imported inside the functions that use it so that importing the
+# web app stays cheap
+IMAGE_FORMATS = {
+    "png": (".png", "image/png", None),
+    "jpeg": (".jpg", "image/jpeg", "IMWRITE_JPEG_QUALITY"),
+    "webp": (".webp", "image/webp", "IMWRITE_WEBP_QUALITY"),
+}
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def decode_image(stream, min_size=None, max_pixels=None):
+    """Decode an uploaded image, skipping resolution the models will never use.
+
+    With min_size set, JPEGs are decoded in draft mode at the smallest DCT
+    scale (1/2, 1/4 or 1/8) that keeps both sides at least min_size, and
+    other formats are box-reduced by an integer factor after decoding.
+    Returns the RGB pixels and the (x, y) factors that map coordinates in
+    the decoded image back to the original.
+    """
+    try:
+        image = Image.open(stream)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    width, height = image.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(f"Image has {width * height} pixels, the limit is {max_pixels}")
+
+    if min_size:
+        image.draft("RGB", (min_size, min_size))
+        factor = min(image.size) // min_size
+        if factor >= 2:
+            image = image.reduce(min(factor, 8))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    scale = (width / image.size[0], height / image.size[1])
+    return np.array(image), scale
 
 
 def encode_image(image):
-    _, buffer = cv2.imencode('.png', image)
+    import cv2
+
+    with metrics.time("encode"):
+        _, buffer = cv2.imencode('.png', image)
     image_base64 = base64.b64encode(buffer).decode('utf-8')
     image_uri = f'data:image/png;base64,{image_base64}'
     return image_uri
+
+
+def limit_dimension(image, max_dimension):
+    import cv2
+
+    height, width = image.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return image
+    scale = max_dimension / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class ImageStore:
+    """Short-lived store for encoded output images.
+
+    Images are encoded once with the configured format, quality and size
+    limit, and stored under a name derived from their content, so a stored
+    image never changes and can be cached by the browser.
+    """
+
+    def __init__(self, backend, format="jpeg", quality=85, max_dimension=None):
+        assert format in IMAGE_FORMATS
+        self.backend = backend
+        self.format = format
+        self.quality = quality
+        self.max_dimension = max_dimension
+
+    def encode(self, image):
+        import cv2
+
+        extension, _, quality_flag = IMAGE_FORMATS[self.format]
+        image = limit_dimension(image, self.max_dimension)
+        params = [getattr(cv2, quality_flag), self.quality] if quality_flag is not None else []
+        with metrics.time("encode"):
+            _, buffer = cv2.imencode(extension, image, params)
+        return buffer.tobytes()
+
+    def save(self, data):
+        extension, _, _ = IMAGE_FORMATS[self.format]
+        name = hashlib.blake2b(data, digest_size=20).hexdigest() + extension
+        self.backend.set(name, data)
+        return name
+
+    def put(self, image):
+        return self.save(self.encode(image))
+
+    def get(self, name):
+        match = re.fullmatch(r"[0-9a-f]{40}(\.[a-z]+)", name)
+        if match is None:
+            return None, None
+        for extension, mimetype, _ in IMAGE_FORMATS.values():
+            if match.group(1) == extension:
+                data = self.backend.get(name)
+                if data is None:
+                    return None, None
+                return data, mimetype
+        return None, None
+
+
+def create_image_store(backend, directory=None, max_bytes=256 * 1024 * 1024, ttl=600, **kwargs):
+    return ImageStore(create_cache_backend(backend, directory, max_bytes, ttl), **kwargs)
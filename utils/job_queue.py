@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """Durable job queue in a local SQLite file, with background worker threads.
+
+    Jobs are claimed inside an immediate transaction, so several processes
+    can share one database file. A job whose worker died is put back in the
+    queue after job_timeout seconds, up to max_attempts times. Finished jobs
+    keep their result for result_ttl seconds and are then deleted.
+
+    Handlers are registered per job kind as handler(payload, params) and
+    must return something JSON serializable.
+    """
+
+    def __init__(self, path, result_ttl=600, job_timeout=300, max_attempts=2, poll_interval=0.5):
+        self.path = path
+        self.result_ttl = result_ttl
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.workers = []
+        self.start_lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.last_sweep = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload, params=None):
+        job_id = uuid.uuid4().hex
+        with self.connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, status, params, payload, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params or {}), payload, time.time()),
+            )
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, result, error, created_at, started_at, finished_at = row
+        if finished_at is not None and finished_at + self.result_ttl < time.time():
+            return None
+        job = {"id": job_id, "kind": kind, "status": status, "created_at": created_at}
+        if started_at is not None:
+            job["started_at"] = started_at
+        if finished_at is not None:
+            job["finished_at"] = finished_at
+            job["expires_at"] = finished_at + self.result_ttl
+        if status == "queued":
+            with self.connect() as db:
+                (ahead,) = db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                    (created_at,),
+                ).fetchone()
+            job["position"] = ahead
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def claim(self):
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, kind, payload, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (time.time(), row[0]),
+                )
+            db.execute("COMMIT")
+        return row
+
+    def finish(self, job_id, result=None, error=None):
+        # The input is no longer needed once the job is done
+        with self.connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                (
+                    "failed" if error is not None else "done",
+                    None if result is None else json.dumps(result),
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def sweep(self):
+        """Requeue or fail jobs that outlived job_timeout and delete expired results."""
+        now = time.time()
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Timed out', payload = NULL, finished_at = ? "
+                "WHERE status = 'running' AND started_at < ? AND attempts >= ?",
+                (now, now - self.job_timeout, self.max_attempts),
+            )
+            db.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL "
+                "WHERE status = 'running' AND started_at < ?",
+                (now - self.job_timeout,),
+            )
+            db.execute("DELETE FROM jobs WHERE finished_at < ?", (now - self.result_ttl,))
+            db.execute("COMMIT")
+        self.last_sweep = now
+
+    def run(self):
+        while True:
+            try:
+                if time.time() - self.last_sweep > self.poll_interval * 20:
+                    self.sweep()
+                job = self.claim()
+            except sqlite3.OperationalError:
+                # The database stayed locked by another process; try again later
+                time.sleep(self.poll_interval)
+                continue
+            if job is None:
+                # Jobs submitted by this process wake us up, other processes' are polled for
+                with self.wakeup:
+                    self.wakeup.wait(self.poll_interval)
+                continue
+            job_id, kind, payload, params = job
+            try:
+                result = self.handlers[kind](payload, json.loads(params))
+            except Exception as e:
+                self.finish(job_id, error=str(e) or type(e).__name__)
+            else:
+                self.finish(job_id, result=result)
+
+    def start(self, num_workers):
+        """Start num_workers worker threads, unless they were already started."""
+        with self.start_lock:
+            if self.workers:
+                return
+            for i in range(num_workers):
+                worker = threading.Thread(target=self.run, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def stats(self):
+        with self.connect() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"workers": len(self.workers), "jobs": counts}
@@ -0,0 +1,152 @@
+import time
+import bisect
+import threading
+import config
+
+
+# Seconds; covers a cached lookup up to a slow high resolution analysis
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    __slots__ = ("metrics", "stage", "labels", "start")
+
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metrics:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Pipeline stages are timed with `with metrics.time("decode"):` into the
+    app_stage_seconds histogram. Between start_request() and
+    finish_request() the stages timed on the request's own thread are also
+    collected for its Server-Timing header. When disabled, time() returns a
+    shared no-op context manager and nothing is recorded.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.values = {}
+        self.local = threading.local()
+        self.describe("app_stage_seconds", "histogram", "Time spent in each pipeline stage")
+
+    def describe(self, name, kind, description):
+        self.descriptions[name] = (kind, description)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    # Gauges only go up and down by deltas, which is all in-flight counts need
+    add = inc
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.observe_labels(name, value, tuple(labels.items()))
+
+    def observe_labels(self, name, value, labels):
+        key = (name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                histogram = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def time(self, stage, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, stage, tuple(labels.items()))
+
+    def record(self, stage, seconds, labels=()):
+        self.observe_labels("app_stage_seconds", seconds, (("stage", stage),) + labels)
+        timings = getattr(self.local, "timings", None)
+        if timings is not None:
+            name = "-".join([str(value) for _, value in labels] + [stage])
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    def start_request(self):
+        if self.enabled:
+            self.local.timings = {}
+
+    def finish_request(self):
+        """Return the stage timings of the current request as a Server-Timing header value."""
+        timings = getattr(self.local, "timings", None)
+        self.local.timings = None
+        if not timings:
+            return None
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+    def render(self):
+        with self.lock:
+            # Label values are compared as text, so a None or a number next
+            # to a string in the same label cannot break the sort
+            values = sorted(
+                (
+                    (key, list(value) if isinstance(value, list) else value)
+                    for key, value in self.values.items()
+                ),
+                key=lambda item: (item[0][0], [(name, str(value)) for name, value in item[0][1]]),
+            )
+        lines = []
+        described = set()
+        for (name, labels), value in values:
+            kind, description = self.descriptions.get(name, ("untyped", ""))
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(config.metrics_enabled)
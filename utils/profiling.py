@@ -0,0 +1,113 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import deque
+
+
+# The profile running on the current thread, if any
+local = threading.local()
+
+
+def profiling():
+    """Whether a RequestProfiler is profiling the current thread.
+
+    cProfile only sees the thread that enabled it, so code that would hand
+    work to another thread checks this and runs it on the calling thread.
+    """
+    return getattr(local, "profile", None) is not None
+
+
+class RequestProfiler:
+    """Profile single requests with cProfile and keep the latest profiles on disk.
+
+    Each profile is a pstats file plus a JSON file describing the request.
+    At most max_per_minute requests are profiled and only one at a time,
+    since profiling slows the request down; a request asking for a profile
+    beyond that is served normally. Only the newest max_profiles are kept.
+    """
+
+    def __init__(self, directory, max_profiles=50, max_per_minute=6):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.max_per_minute = max_per_minute
+        self.started = deque()
+        self.busy = threading.Lock()
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self):
+        """Return an enabled profiler, or None if the rate limit or another profile is in the way."""
+        now = time.monotonic()
+        with self.lock:
+            while self.started and self.started[0] < now - 60:
+                self.started.popleft()
+            if len(self.started) >= self.max_per_minute or not self.busy.acquire(blocking=False):
+                return None
+            self.started.append(now)
+        profile = cProfile.Profile()
+        profile.enable()
+        local.profile = profile
+        return profile
+
+    def stop(self, profile, info):
+        """Stop profile and save it with info, a JSON-serializable dict about the request."""
+        profile.disable()
+        local.profile = None
+        self.busy.release()
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profile.dump_stats(os.path.join(self.directory, name + ".prof"))
+        with open(os.path.join(self.directory, name + ".json"), "w") as f:
+            json.dump(dict(info, name=name, time=time.time()), f)
+        self.prune()
+        return name
+
+    def discard(self, profile):
+        """Stop profile without saving it, for requests that failed before it was saved."""
+        profile.disable()
+        local.profile = None
+        self.busy.release()
+
+    def names(self):
+        # Names start with the time, so they sort oldest first
+        return sorted(
+            entry[: -len(".json")] for entry in os.listdir(self.directory) if entry.endswith(".json")
+        )
+
+    def prune(self):
+        for name in self.names()[: -self.max_profiles]:
+            for extension in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def path(self, name):
+        """Path of a profile's pstats file, or None for an unknown or malformed name."""
+        if not re.fullmatch(r"\d{8}-\d{6}-[0-9a-f]{8}", name):
+            return None
+        path = os.path.join(self.directory, name + ".prof")
+        return path if os.path.exists(path) else None
+
+    def info(self, name):
+        try:
+            with open(os.path.join(self.directory, name + ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def recent(self):
+        profiles = [self.info(name) for name in reversed(self.names())]
+        return [profile for profile in profiles if profile is not None]
+
+    def summary(self, name, sort="cumulative", limit=40):
+        """The pstats report of a profile, as text."""
+        output = io.StringIO()
+        stats = pstats.Stats(self.path(name), stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()